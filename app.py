@@ -2,18 +2,47 @@ from flask import Flask, redirect, url_for, render_template
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, current_user
 from config import Config
-from models import db, User
+from models import db
 from routes.admin import admin_bp
 from routes.user import user_bp
+from routes.api import api_bp
+from services.engine_profile import engine_profile
+from services.allocator import spot_allocator
+from services.booking_queue import booking_queue
+from services.instrumentation import request_instrumentation
+from services.profiler import request_profiler
+from services.metrics import metrics
+from services.lot_cache import lot_cache
+from services.live_updates import live_updates
+from services.lot_versions import lot_versions
+from services.user_cache import user_cache
+from services.lot_removal import lot_removals
+from commands import register_commands
 
 #starting app
-def create_app():
+def create_app(config=None):
     """Application factory pattern"""
     app = Flask(__name__)
     app.config.from_object(Config)
+    #overrides used by scripts and benchmarks (e.g. a separate database)
+    if config:
+        app.config.update(config)
 
     #initialize extensions
+    #engine options must be set before db creates the engines
+    engine_profile.init_app(app)
     db.init_app(app)
+    spot_allocator.init_app(app)
+    booking_queue.init_app(app)
+    request_instrumentation.init_app(app)
+    request_profiler.init_app(app)
+    metrics.init_app(app)
+    lot_cache.init_app(app)
+    live_updates.init_app(app)
+    lot_versions.init_app(app)
+    user_cache.init_app(app)
+    lot_removals.init_app(app)
+    register_commands(app)
 
     #initialize Flask-Login
     login_manager = LoginManager()
@@ -22,11 +51,12 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.load(int(user_id))
 
     # Register blueprints
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(user_bp, url_prefix='/user')
+    app.register_blueprint(api_bp, url_prefix='/api')
 
     # Home route
     @app.route('/')
@@ -0,0 +1,119 @@
+# benchmarks/api.py
+"""Check the JSON API's ETags and measure conditional GETs against full ones.
+
+Verifies that the API needs a login or a token, that a repeated request
+with If-None-Match gets a 304 without any SQL statement, and that bookings,
+releases and lot edits each change the tags of the lots they touch (and
+only those).
+
+Run from the project root:
+    python -m benchmarks.api [--rounds 300] [--lots 100]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from models import db, Reservation, IST
+from benchmarks.common import temp_app, seed, login, free_username, count_queries
+
+TOKEN = 'benchmark-kiosk'
+AUTH = {'Authorization': f'Bearer {TOKEN}'}
+
+
+def tags(client, *paths):
+    return {path: client.get(path, headers=AUTH).headers.get('ETag') for path in paths}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=300)
+    parser.add_argument('--lots', type=int, default=100)
+    args = parser.parse_args()
+
+    app, tmp = temp_app(API_TOKENS={TOKEN})
+    with app.app_context():
+        seed(lots=3, spots_per_lot=10, users=50, reservations=200)
+        engine = db.engine
+    kiosk = app.test_client()
+    user = login(app.test_client(), free_username(app))
+    admin = login(app.test_client(), 'admin')
+    failures = []
+
+    anonymous = app.test_client()
+    for headers in ({}, {'Authorization': 'Bearer wrong'}):
+        status = anonymous.get('/api/lots', headers=headers).status_code
+        if status != 401:
+            failures.append(f'/api/lots answered {status} with headers {headers}')
+    if user.get('/api/lots').status_code != 200:
+        failures.append('a logged-in user cannot read the API')
+
+    response = kiosk.get('/api/lots', headers=AUTH)
+    lots = {lot['id']: lot for lot in response.get_json()['lots']}
+    if sorted(lots) != [1, 2, 3] or (lots[1]['available_spots'], lots[1]['total_spots']) != (5, 10):
+        failures.append(f'unexpected lot listing: {lots}')
+    spots = kiosk.get('/api/lots/1/spots', headers=AUTH).get_json()['spots']
+    if [spot['status'] for spot in spots].count('available') != 5:
+        failures.append(f'unexpected spots of lot 1: {spots}')
+    if kiosk.get('/api/lots/99', headers=AUTH).status_code != 404:
+        failures.append('missing lot did not answer 404')
+
+    paths = ('/api/lots', '/api/lots/1', '/api/lots/1/spots', '/api/lots/2')
+    before = tags(kiosk, *paths)
+    for path, etag in before.items():
+        with count_queries(engine) as statements:
+            status = kiosk.get(path, headers={**AUTH, 'If-None-Match': etag}).status_code
+        if status != 304 or statements:
+            failures.append(f'{path} revalidation: {status} after {len(statements)} statements')
+
+    def changed(action):
+        nonlocal before
+        after = tags(kiosk, *paths)
+        moved = sorted(path for path in paths if after[path] != before[path])
+        before = after
+        if moved != ['/api/lots', '/api/lots/1', '/api/lots/1/spots']:
+            failures.append(f'{action} changed the tags of {moved}')
+
+    user.post('/user/book/1', data={'vehicle_no': 'KA01XY1234'})
+    changed('booking')
+    with app.app_context():
+        reservation_id = (db.session.query(Reservation.id)
+                          .filter_by(vehicle_no='KA01XY1234', leaving_timestamp=None).scalar())
+    user.post(f'/user/release/{reservation_id}',
+              data={'releasing_time': datetime.now(IST).strftime('%Y-%m-%dT%H:%M'), 'action': 'release'})
+    changed('release')
+    admin.post('/admin/lots/edit/1', data={'prime_location_name': 'Lot One', 'address': '1 Benchmark Road, Test City',
+                                           'pincode': '100001', 'price_per_hour': '20',
+                                           'maximum_number_of_spots': '10'})
+    changed('lot edit')
+    if kiosk.get('/api/lots/1', headers=AUTH).get_json()['name'] != 'Lot One':
+        failures.append('lot edit is missing from the API')
+    tmp.cleanup()
+
+    bench, bench_tmp = temp_app(API_TOKENS={TOKEN})
+    with bench.app_context():
+        seed(lots=args.lots, spots_per_lot=20, users=args.lots * 20, reservations=1000)
+    client = bench.test_client()
+    etag = client.get('/api/lots', headers=AUTH).headers['ETag']
+    full, conditional = [], []
+    for _ in range(args.rounds):
+        for samples, headers in ((full, AUTH), (conditional, {**AUTH, 'If-None-Match': etag})):
+            started = time.perf_counter()
+            client.get('/api/lots', headers=headers)
+            samples.append((time.perf_counter() - started) * 1000)
+    bench_tmp.cleanup()
+    print(f'/api/lots with {args.lots} lots, {args.rounds} requests each')
+    print(f'  200: p50 {statistics.median(full):.2f}ms')
+    print(f'  304: p50 {statistics.median(conditional):.2f}ms')
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+# benchmarks/archive.py
+"""Archive old completed reservations and check history and reports are unchanged.
+
+Seeds a year of reservations, moves those released more than --days ago
+to reservation_archive and verifies that active reservations stay in the
+live table, that the user dashboard, history and summary, the admin user
+listing and the revenue report give the same answers as before, and that
+a second run has nothing left to move. Then books, releases and archives
+twice through the routes, so the newest reservations are archived before
+the next booking is made, and checks the ids are never handed out again.
+Reports the size of the live table
+with its indexes, and the time of the booking checks and the user
+dashboard, before and after.
+
+Run from the project root:
+    python -m benchmarks.archive [--reservations 100000] [--days 90] [--rounds 200]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from models import db, User, Reservation, ReservationArchive, IST
+from services.archive import archive_completed
+from services.lot_stats import check_lot_counters
+from services.user_stats import check_user_counters
+from services.reports import user_reservations, reservation_stats, reservation_totals, lot_report, user_listing
+from benchmarks.common import temp_app, seed, login, free_username
+
+
+def snapshot(user_ids):
+    """Everything the history pages and reports show, as comparable values"""
+    return {
+        'history': {user_id: [(r.id, r.spot.spot_number, r.spot.lot.prime_location_name, r.total_cost)
+                              for r in user_reservations(user_id)] for user_id in user_ids},
+        'stats': sorted((row.user_id, row.reservations, row.active, round(row.spent, 2), row.last_booking)
+                        for row in reservation_stats()),
+        'totals': tuple(round(value, 2) for value in reservation_totals()),
+        'revenue': [(row[0], round(row[2], 2)) for row in lot_report()],
+        'spent listing': [row.user.id for row in user_listing(sort='spent')[0]],
+    }
+
+
+def live_size_mib():
+    """Pages used by the reservations table and its indexes, None without SQLite's dbstat"""
+    try:
+        size = db.session.execute(text(
+            "SELECT sum(pgsize) FROM dbstat WHERE name = 'reservations' OR name IN "
+            "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'reservations')")).scalar()
+    except OperationalError:
+        db.session.rollback()
+        return None
+    return size / 2 ** 20
+
+
+def p50_ms(call, rounds):
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def measure(app, client, user_ids, rounds):
+    """(booking checks p50 ms, /user/dashboard p50 ms)"""
+    with app.app_context():
+        def booking_checks():
+            for user_id in user_ids:
+                db.session.query(Reservation.id).filter_by(user_id=user_id, leaving_timestamp=None).first()
+            db.session.query(func.count(Reservation.id)).filter(Reservation.leaving_timestamp.is_(None)).scalar()
+        checks = p50_ms(booking_checks, rounds)
+    return checks, p50_ms(lambda: client.get('/user/dashboard'), rounds)
+
+
+def book_release_archive(app, client, vehicle_no, cutoff):
+    """Book lot 1 and release through the routes, backdate the stay past the cutoff and archive it; its id"""
+    client.post('/user/book/1', data={'vehicle_no': vehicle_no})
+    with app.app_context():
+        reservation = Reservation.query.filter_by(vehicle_no=vehicle_no, leaving_timestamp=None).one()
+        reservation_id = reservation.id
+    client.post(f'/user/release/{reservation_id}',
+                data={'releasing_time': datetime.now(IST).strftime('%Y-%m-%dT%H:%M'), 'action': 'release'})
+    with app.app_context():
+        reservation = db.session.get(Reservation, reservation_id)
+        reservation.parking_timestamp -= timedelta(days=365)
+        reservation.leaving_timestamp = cutoff - timedelta(days=1)
+        db.session.commit()
+        archive_completed(cutoff, 1000)
+    return reservation_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reservations', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+    failures = []
+
+    app, tmp = temp_app()
+    with app.app_context():
+        seed(lots=10, spots_per_lot=50, users=500, reservations=args.reservations)
+        user_ids = [user_id for (user_id,) in db.session.query(User.id).filter_by(is_admin=False).limit(50)]
+        username = db.session.get(User, user_ids[0]).username
+        before = snapshot(user_ids)
+        active = {reservation_id for (reservation_id,) in
+                  db.session.query(Reservation.id).filter(Reservation.leaving_timestamp.is_(None))}
+        live_before = db.session.query(func.count(Reservation.id)).scalar()
+        size_before = live_size_mib()
+    client = login(app.test_client(), username)
+    #the first page after the login carries its flash message
+    client.get('/user/dashboard')
+    summary_before = client.get('/user/summary').get_data(as_text=True)
+    timings_before = measure(app, client, user_ids, args.rounds)
+
+    with app.app_context():
+        cutoff = datetime.utcnow() - timedelta(days=args.days)
+        expected = db.session.query(func.count(Reservation.id)).filter(Reservation.leaving_timestamp < cutoff).scalar()
+        started = time.perf_counter()
+        archived = archive_completed(cutoff, 1000)
+        elapsed = time.perf_counter() - started
+        live_after = db.session.query(func.count(Reservation.id)).scalar()
+        size_after = live_size_mib()
+        if archived != expected or live_after != live_before - archived:
+            failures.append(f'archived {archived} of {expected}, live table {live_before} -> {live_after}')
+        if db.session.query(ReservationArchive.id).filter(ReservationArchive.id.in_(active)).count():
+            failures.append('active reservations were archived')
+        if db.session.query(Reservation.id).filter(Reservation.leaving_timestamp < cutoff).count():
+            failures.append('reservations older than the cutoff are left in the live table')
+        after = snapshot(user_ids)
+        for key in before:
+            if before[key] != after[key]:
+                failures.append(f'{key} changed by archiving')
+        if archive_completed(cutoff, 1000):
+            failures.append('a second run archived more reservations')
+        drifted = check_lot_counters()
+        if drifted:
+            failures.append(f'lot counters drifted: {drifted}')
+        drifted = check_user_counters()
+        if drifted:
+            failures.append(f'user counters drifted: {drifted}')
+    for path in ('/user/history', '/user/dashboard'):
+        if client.get(path).status_code != 200:
+            failures.append(f'{path} does not render with archived reservations')
+    if client.get('/user/summary').get_data(as_text=True) != summary_before:
+        failures.append('/user/summary changed by archiving')
+    admin = login(app.test_client(), 'admin')
+    for path in ('/admin/dashboard', '/admin/users', '/admin/summary', '/admin/users?sort=spent'):
+        if admin.get(path).status_code != 200:
+            failures.append(f'{path} does not render with archived reservations')
+    timings_after = measure(app, client, user_ids, args.rounds)
+
+    #the newest reservation is archived before the next booking, whose id must be new
+    booker = login(app.test_client(), free_username(app))
+    rebooked = []
+    try:
+        for vehicle_no in ('KA01ZZ0001', 'KA01ZZ0002'):
+            rebooked.append(book_release_archive(app, booker, vehicle_no, cutoff))
+    except IntegrityError as error:
+        failures.append(f'archiving after booking again failed: {error.orig}')
+    if len(set(rebooked)) != len(rebooked):
+        failures.append(f'reservation ids were reused: {rebooked}')
+    with app.app_context():
+        if db.session.query(ReservationArchive.id).filter(ReservationArchive.id.in_(rebooked)).count() != len(rebooked):
+            failures.append('rebooked reservations are missing from the archive')
+    tmp.cleanup()
+
+    print(f'{args.reservations} reservations, archived {archived} released more than {args.days} days ago '
+          f'in {elapsed:.2f}s; live table {live_before} -> {live_after} rows')
+    if size_before is not None:
+        print(f'  live table and indexes {size_before:.1f} MiB -> {size_after:.1f} MiB')
+    for label, (checks, dashboard) in (('before', timings_before), ('after', timings_after)):
+        print(f'  {label:7} booking checks ({len(user_ids)} users) p50 {checks:6.2f}ms  '
+              f'/user/dashboard p50 {dashboard:6.2f}ms')
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/booking_latency.py
+"""Compare free-spot lookup latency: `status='A'` scan vs SpotAllocator.
+
+Run from the project root:
+    python -m benchmarks.booking_latency --spots 10000 --occupied 0.95
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from app import create_app
+from models import db, ParkingLot, ParkingSpot
+from services.allocator import spot_allocator
+
+
+def build_lot(spots, occupied_ratio):
+    """One big lot where the first `occupied_ratio` of the spots are taken"""
+    lot = ParkingLot(prime_location_name='Benchmark Lot', address='1 Benchmark Road, Test City',
+                     pincode='000000', price_per_hour=10.0, maximum_number_of_spots=spots)
+    occupied = int(spots * occupied_ratio)
+    lot.available_spots, lot.occupied_spots = spots - occupied, occupied
+    db.session.add(lot)
+    db.session.flush()
+    db.session.execute(ParkingSpot.__table__.insert(), [
+        {'lot_id': lot.id, 'spot_number': f'S{i}', 'status': 'O' if i <= occupied else 'A'}
+        for i in range(1, spots + 1)
+    ])
+    db.session.commit()
+    return lot.id
+
+
+def time_calls(func, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--spots', type=int, default=10000)
+    parser.add_argument('--occupied', type=float, default=0.95, help='fraction of spots already taken')
+    parser.add_argument('--rounds', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'bench.db')})
+        with app.app_context():
+            db.create_all()
+            lot_id = build_lot(args.spots, args.occupied)
+            spot_allocator.rebuild(lot_id)
+
+            def query_path():
+                spot = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').first()
+                db.session.expire_all()
+                return spot
+
+            def allocator_path():
+                #acquire + release keeps the pool size constant between rounds
+                spot_id = spot_allocator.acquire(lot_id)
+                spot = db.session.get(ParkingSpot, spot_id)
+                spot_allocator.release(lot_id, spot_id)
+                db.session.expire_all()
+                return spot
+
+            query_p50, query_p99 = time_calls(query_path, args.rounds)
+            alloc_p50, alloc_p99 = time_calls(allocator_path, args.rounds)
+
+    print(f"lot of {args.spots} spots, {args.occupied:.0%} occupied, {args.rounds} rounds")
+    print(f"{'path':<12}{'p50 ms':>10}{'p99 ms':>10}")
+    print(f"{'query':<12}{query_p50:>10.3f}{query_p99:>10.3f}")
+    print(f"{'allocator':<12}{alloc_p50:>10.3f}{alloc_p99:>10.3f}")
+    print(f"speedup (p50): {query_p50 / alloc_p50:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# benchmarks/booking_queue.py
+"""Check the single-writer booking queue and measure it against per-request commits.
+
+Verifies, with BOOKING_QUEUE on, that concurrent bookings are grouped into
+fewer commits than bookings, that no spot is handed out twice, that a
+full lot, a vehicle booked twice in the same group and a repeated
+release each get their own answer, and that the lot counters still match
+the spots. Then runs book -> release loops from many threads with and
+without the queue, on SQLite's defaults and on the engine profile.
+
+Run from the project root:
+    python -m benchmarks.booking_queue [--seconds 5] [--writers 16]
+"""
+
+import argparse
+import sys
+import threading
+from datetime import datetime
+
+from sqlalchemy import event, func
+
+from models import db, User, Reservation, IST
+from services.booking_queue import booking_queue
+from services.lot_stats import check_lot_counters
+from services.user_stats import check_user_counters
+from benchmarks.common import temp_app, seed
+from benchmarks.sqlite_profile import run, free_usernames
+
+
+def count_commits(engine):
+    commits = []
+    event.listen(engine, 'commit', lambda connection: commits.append(1))
+    return commits
+
+
+def book_together(app, bookings):
+    """Run booking_queue.book for every (lot_id, username, vehicle_no) at once, results in order"""
+    with app.app_context():
+        users = dict(db.session.query(User.username, User.id))
+    barrier = threading.Barrier(len(bookings))
+    results = [None] * len(bookings)
+    now = datetime.now(IST)
+
+    def book(i, lot_id, username, vehicle_no):
+        with app.app_context():
+            barrier.wait()
+            results[i] = booking_queue.book(lot_id, users[username], vehicle_no, 20.0, now)[0]
+
+    threads = [threading.Thread(target=book, args=(i,) + booking) for i, booking in enumerate(bookings)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--writers', type=int, default=16)
+    args = parser.parse_args()
+    failures = []
+
+    app, tmp = temp_app(BOOKING_QUEUE=True, BOOKING_QUEUE_WAIT_MS=20)
+    with app.app_context():
+        seed(lots=3, spots_per_lot=40, users=200, reservations=200)
+        commits = count_commits(db.engine)
+    usernames = free_usernames(app, 30)
+
+    results = book_together(app, [(1, username, f'KA02QQ{i:04d}') for i, username in enumerate(usernames[:25])])
+    if results.count('booked') != 20 or results.count('lot_full') != 5:
+        failures.append(f'25 bookings for 20 free spots: {sorted(results)}')
+    if len(commits) >= 20:
+        failures.append(f'{len(commits)} commits for 20 bookings, expected them grouped')
+    print(f'20 concurrent bookings in {len(commits)} commits')
+
+    results = book_together(app, [(2, usernames[25], 'KA03ZZ0001'), (2, usernames[26], 'KA-03 ZZ 0001')])
+    if sorted(results) != ['booked', 'vehicle_parked']:
+        failures.append(f'one vehicle booked twice in a group: {results}')
+    with app.app_context():
+        user_id = db.session.query(User.id).filter_by(username=usernames[27]).scalar()
+        booking_queue.book(3, user_id, 'KA04RR0001', 20.0, datetime.now(IST))
+        if booking_queue.book(3, user_id, 'KA04RR0002', 20.0, datetime.now(IST))[0] != 'active_reservation':
+            failures.append('second booking of a parked user was not turned away')
+        reservation_id = (db.session.query(Reservation.id)
+                          .filter_by(user_id=user_id, leaving_timestamp=None).scalar())
+        released = [booking_queue.release(reservation_id, datetime.now(IST)) for _ in range(2)]
+        if released != [True, False]:
+            failures.append(f'release twice answered {released}')
+        doubled = (db.session.query(Reservation.spot_id).filter(Reservation.leaving_timestamp.is_(None))
+                   .group_by(Reservation.spot_id).having(func.count(Reservation.id) > 1).count())
+        if doubled:
+            failures.append(f'{doubled} spots with more than one active reservation')
+        drifted = check_lot_counters()
+        if drifted:
+            failures.append(f'lot counters drifted: {drifted}')
+        drifted = check_user_counters()
+        if drifted:
+            failures.append(f'user counters drifted: {drifted}')
+    tmp.cleanup()
+
+    print(f'{args.writers} threads booking and releasing for {args.seconds:g}s')
+    for profile in (False, True):
+        for queued in (False, True):
+            bench, bench_tmp = temp_app(SQLITE_PROFILE=profile, BOOKING_QUEUE=queued)
+            with bench.app_context():
+                seed(lots=20, spots_per_lot=50, users=1000, reservations=1000)
+                commits = count_commits(db.engine)
+            writes, _, write_p95, _, failed = run(bench, args.seconds, args.writers, 0)
+            bench_tmp.cleanup()
+            label = f"{'profile' if profile else 'SQLite defaults'}, {'queue' if queued else 'per-request commits'}"
+            print(f'  {label:36} {writes:6.1f} writes/s (p95 {write_p95:6.1f}ms)  '
+                  f'{len(commits) / max(writes * args.seconds, 1):.2f} commits per write  {sum(failed.values())} failed')
+            if queued and failed:
+                failures.append(f'failed requests through the queue: {dict(failed)}')
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# benchmarks/common.py
+"""Shared helpers for the benchmark and check scripts"""
+
+import os
+import random
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from migrations import upgrade
+from models import db, User, ParkingLot, ParkingSpot, Reservation
+from services import search as search_index
+from services.engine_profile import engine_profile
+from services.user_stats import check_user_counters
+
+PASSWORD = 'password123'
+
+
+def temp_app(**config):
+    """App bound to a throwaway sqlite file; keep the returned dir alive while using it"""
+    tmp = tempfile.TemporaryDirectory()
+    config.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite:///' + os.path.join(tmp.name, 'bench.db'))
+    app = create_app(config)
+    with app.app_context():
+        upgrade()
+    return app, tmp
+
+
+def seed(lots=4, spots_per_lot=20, users=10, reservations=100, occupied_ratio=0.5, rng=None):
+    """Bulk insert a dataset of the given size (inside an app context).
+
+    Completed reservations are spread over the past year; `occupied_ratio` of
+    each lot's spots get an active reservation. Every user has PASSWORD.
+    """
+    rng = rng or random.Random(42)
+    now = datetime.utcnow()
+    password_hash = generate_password_hash(PASSWORD)
+
+    admin = User(username='admin', is_admin=True, password_hash=password_hash)
+    db.session.add(admin)
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'user{i}', 'password_hash': password_hash, 'is_admin': False,
+         'created_at': now - timedelta(days=rng.randint(0, 365))}
+        for i in range(1, users + 1)
+    ])
+    occupied_per_lot = int(spots_per_lot * occupied_ratio)
+    db.session.execute(ParkingLot.__table__.insert(), [
+        {'prime_location_name': f'Lot {i}', 'address': f'{i} Benchmark Road, Test City',
+         'pincode': f'{100000 + i}', 'price_per_hour': 20.0, 'maximum_number_of_spots': spots_per_lot,
+         'available_spots': spots_per_lot - occupied_per_lot, 'occupied_spots': occupied_per_lot,
+         'created_at': now}
+        for i in range(1, lots + 1)
+    ])
+    lot_ids = [lot_id for (lot_id,) in db.session.query(ParkingLot.id).order_by(ParkingLot.id)]
+    db.session.execute(ParkingSpot.__table__.insert(), [
+        {'lot_id': lot_id, 'spot_number': f'S{n}', 'status': 'O' if n <= occupied_per_lot else 'A',
+         'created_at': now}
+        for lot_id in lot_ids for n in range(1, spots_per_lot + 1)
+    ])
+    spots = db.session.query(ParkingSpot.id, ParkingSpot.status).all()
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).filter_by(is_admin=False)]
+
+    rows = []
+    for _ in range(reservations):
+        start = now - timedelta(minutes=rng.randint(60, 525600))
+        hours = rng.uniform(0.5, 8)
+        vehicle_no = f'KA{rng.randint(1, 99):02d}AB{rng.randint(1000, 9999)}'
+        rows.append({'spot_id': rng.choice(spots)[0], 'user_id': rng.choice(user_ids),
+                     'parking_timestamp': start, 'leaving_timestamp': start + timedelta(hours=hours),
+                     'parking_cost_per_hour': 20.0, 'total_cost': round(hours * 20.0, 2),
+                     'created_at': start, 'vehicle_no': vehicle_no, 'vehicle_key': vehicle_no})
+    #one active reservation per occupied spot, each for a different user while they last
+    free_users = list(user_ids)
+    rng.shuffle(free_users)
+    for spot_id, status in spots:
+        if status == 'O' and free_users:
+            start = now - timedelta(minutes=rng.randint(5, 600))
+            #parked vehicles must be unique, derive the plate from the spot
+            vehicle_no = f'KA01CD{spot_id:06d}'
+            rows.append({'spot_id': spot_id, 'user_id': free_users.pop(), 'parking_timestamp': start,
+                         'leaving_timestamp': None, 'parking_cost_per_hour': 20.0, 'total_cost': None,
+                         'created_at': start, 'vehicle_no': vehicle_no, 'vehicle_key': vehicle_no})
+    if rows:
+        db.session.execute(Reservation.__table__.insert(), rows)
+    db.session.commit()
+    #bulk inserts bypass the booking service, fill the user counters from the rows
+    check_user_counters(repair=True)
+    search_index.rebuild()
+
+
+def login(client, username, password=PASSWORD):
+    response = client.post('/user/login', data={'username': username, 'password': password})
+    assert response.status_code == 302, f'login failed for {username}'
+    return client
+
+
+def free_username(app):
+    """A user without a parked car, who can book"""
+    with app.app_context():
+        active = db.session.query(Reservation.user_id).filter(Reservation.leaving_timestamp.is_(None))
+        return (User.query.filter(User.is_admin.is_(False), User.id.notin_(active))
+                .order_by(User.id).first().username)
+
+
+def app_engines():
+    """The app's engine and, with the SQLite profile on, the read-only one of the reports (inside an app context)"""
+    if 'engine_profile' in current_app.extensions:
+        return (db.engine, engine_profile.reader())
+    return (db.engine,)
+
+
+@contextmanager
+def count_queries(*engines):
+    """Collect the SQL statements run on `engines` inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
@@ -0,0 +1,66 @@
+# benchmarks/create_lot.py
+"""Time admin.create_lot for large lots.
+
+Creates lots through the real route and checks the spots, numbering and
+counters it leaves behind. Fails if a lot takes longer than --limit seconds.
+
+Run from the project root:
+    python -m benchmarks.create_lot [--spots 10000] [--limit 1.0]
+"""
+
+import argparse
+import sys
+import time
+
+from models import db, ParkingLot, ParkingSpot
+from benchmarks.common import temp_app, seed, login
+
+
+def create(client, name, spots, spots_per_level=''):
+    started = time.perf_counter()
+    response = client.post('/admin/lots/create', data={
+        'prime_location_name': name, 'address': '1 Multi Level Garage Road', 'pincode': '560001',
+        'price_per_hour': '30', 'maximum_number_of_spots': str(spots), 'spots_per_level': spots_per_level,
+    })
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 302, f'create {name} returned {response.status_code}'
+    return elapsed
+
+
+def check(name, spots):
+    lot = ParkingLot.query.filter_by(prime_location_name=name).one()
+    numbers = [number for (number,) in db.session.query(ParkingSpot.spot_number).filter_by(lot_id=lot.id)]
+    assert len(numbers) == spots, f'{name}: {len(numbers)} spots, expected {spots}'
+    assert len(set(numbers)) == spots, f'{name}: duplicate spot numbers'
+    assert (lot.available_spots, lot.occupied_spots) == (spots, 0), f'{name}: counters off'
+    return numbers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--spots', type=int, default=10000)
+    parser.add_argument('--limit', type=float, default=1.0, help='seconds allowed per lot')
+    args = parser.parse_args()
+
+    app, tmp = temp_app(MAX_SPOTS_PER_LOT=args.spots)
+    with app.app_context():
+        seed(lots=2, spots_per_lot=20, users=5, reservations=50)
+    client = login(app.test_client(), 'admin')
+
+    flat = create(client, 'Flat Garage', args.spots)
+    levels = create(client, 'Level Garage', args.spots, str(max(args.spots // 8, 1)))
+    with app.app_context():
+        numbers = check('Flat Garage', args.spots)
+        print(f'flat lot:    {args.spots} spots in {flat:.3f}s  ({numbers[0]} .. {numbers[-1]})')
+        numbers = check('Level Garage', args.spots)
+        print(f'level lot:   {args.spots} spots in {levels:.3f}s  ({numbers[0]} .. {numbers[-1]})')
+    tmp.cleanup()
+
+    if max(flat, levels) > args.limit:
+        print(f'FAIL: over {args.limit}s')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# benchmarks/delete_lot.py
+"""Delete a large lot with years of history and check nothing is lost.
+
+Measures the longest single transaction of the chunked delete (how long a
+booking elsewhere may wait on SQLite's write lock), checks that every
+reservation of the lot reached the archive, that the other lots and the
+search index are intact, and that a lot with parked cars is refused.
+Then deletes a lot above LOT_DELETE_INLINE_ROWS through the admin route
+and checks the request returns before the removal, which finishes in the
+background, and that a lot created next does not get the deleted lot's id.
+
+Run from the project root:
+    python -m benchmarks.delete_lot [--spots 5000] [--reservations 200000] [--limit 0.5]
+"""
+
+import argparse
+import sys
+import time
+
+from sqlalchemy import func, text
+from models import db, ParkingLot, ParkingSpot, Reservation, ReservationArchive
+from services.lot_removal import close_lot, remove_closed_lot
+from services.search import SEARCH_TABLE
+from services.reports import lot_report
+from benchmarks.common import temp_app, seed, login
+
+
+def lot_reservations(lot_id):
+    return (db.session.query(func.count(Reservation.id))
+            .join(ParkingSpot, ParkingSpot.id == Reservation.spot_id)
+            .filter(ParkingSpot.lot_id == lot_id).scalar())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--spots', type=int, default=5000, help='spots per lot')
+    parser.add_argument('--reservations', type=int, default=200000)
+    parser.add_argument('--limit', type=float, default=0.5, help='seconds allowed per transaction')
+    args = parser.parse_args()
+
+    app, tmp = temp_app()
+    with app.app_context():
+        seed(lots=2, spots_per_lot=args.spots, users=200, reservations=args.reservations)
+        #lot 2 keeps its parked cars, lot 1 is emptied first
+        db.session.execute(text("UPDATE reservations SET leaving_timestamp = parking_timestamp, total_cost = 0 "
+                                "WHERE leaving_timestamp IS NULL AND spot_id IN (SELECT id FROM parking_spots WHERE lot_id = 1)"))
+        db.session.execute(text("UPDATE parking_spots SET status = 'A' WHERE lot_id = 1"))
+        db.session.execute(text('UPDATE parking_lots SET available_spots = :n, occupied_spots = 0 WHERE id = 1'),
+                           {'n': args.spots})
+        db.session.commit()
+        expected = lot_reservations(1)
+        other_spots = ParkingSpot.query.filter_by(lot_id=2).count()
+        other_reservations = lot_reservations(2)
+
+        assert close_lot(2) > 0, 'lot with parked cars was closed'
+        assert ParkingSpot.query.filter_by(lot_id=2, status='R').count() == 0, 'refused close left retired spots'
+
+        assert close_lot(1) == 0
+        chunks = []
+        last = [time.perf_counter()]
+
+        def progress(stage, done, total):
+            now = time.perf_counter()
+            chunks.append(now - last[0])
+            last[0] = now
+
+        started = time.perf_counter()
+        archived, deleted = remove_closed_lot(1, progress=progress)
+        elapsed = time.perf_counter() - started
+
+        assert archived == expected, f'archived {archived} of {expected} reservations'
+        assert ReservationArchive.query.filter_by(lot_id=1).count() == expected, 'archive rows missing'
+        assert deleted == args.spots, f'deleted {deleted} spots'
+        assert db.session.get(ParkingLot, 1) is None, 'lot still there'
+        assert ParkingSpot.query.filter_by(lot_id=1).count() == 0, 'spots left behind'
+        assert ParkingSpot.query.filter_by(lot_id=2).count() == other_spots, 'other lot lost spots'
+        assert lot_reservations(2) == other_reservations, 'other lot lost reservations'
+        orphans = db.session.execute(text('SELECT count(*) FROM reservations WHERE spot_id NOT IN (SELECT id FROM parking_spots)')).scalar()
+        assert orphans == 0, f'{orphans} orphaned reservations'
+        documents = db.session.execute(text(f'SELECT count(*) FROM {SEARCH_TABLE}')).scalar()
+        assert documents == other_spots, f'{documents} search documents for {other_spots} spots'
+
+    #the route goes through the same path
+    client = login(app.test_client(), 'admin')
+    response = client.post('/admin/lots/delete/2')
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.get(ParkingLot, 2) is not None, 'occupied lot deleted through the route'
+    tmp.cleanup()
+
+    app, tmp = temp_app(LOT_DELETE_INLINE_ROWS=100)
+    with app.app_context():
+        seed(lots=1, spots_per_lot=200, users=50, reservations=5000, occupied_ratio=0)
+        expected = lot_reservations(1)
+    client = login(app.test_client(), 'admin')
+    started = time.perf_counter()
+    response = client.post('/admin/lots/delete/1', follow_redirects=True)
+    request_ms = (time.perf_counter() - started) * 1000
+    assert 'being deleted in the background' in response.get_data(as_text=True), 'large lot deleted inline'
+    deadline = time.monotonic() + 60
+    with app.app_context():
+        while db.session.get(ParkingLot, 1) is not None and time.monotonic() < deadline:
+            db.session.rollback()
+            time.sleep(0.1)
+        assert db.session.get(ParkingLot, 1) is None, 'background removal did not finish'
+        assert ReservationArchive.query.filter_by(lot_id=1).count() == expected, 'background removal lost reservations'
+    assert not app.extensions['lot_removals'], 'finished removal is still listed'
+    #the deleted lot had the highest id, a new lot must not take it over with its archived history
+    client.post('/admin/lots/create', data={'prime_location_name': 'Successor Lot', 'address': '2 Benchmark Road',
+                                            'pincode': '560002', 'price_per_hour': '10',
+                                            'maximum_number_of_spots': '5'})
+    with app.app_context():
+        successor = ParkingLot.query.filter_by(prime_location_name='Successor Lot').one()
+        assert successor.id != 1, 'new lot reused the id of the deleted one'
+        assert lot_report(lot_ids=[successor.id])[0][2] == 0, 'new lot shows the deleted lot\'s revenue'
+    tmp.cleanup()
+    print(f'large lot through the route: request returned in {request_ms:.0f}ms, removal finished in the background')
+
+    longest = max(chunks)
+    print(f'archived {archived} reservations and {deleted} spots in {elapsed:.2f}s, '
+          f'{len(chunks)} transactions, longest {longest * 1000:.1f}ms')
+    if longest > args.limit:
+        print(f'FAIL: a transaction took over {args.limit}s')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# benchmarks/instrumentation.py
+"""Check the SQL instrumentation and measure what it costs per request.
+
+Verifies that Server-Timing reports the statements a request really ran,
+that repeated statements are logged as a possible N+1 and slow ones as slow
+queries, and that apps without SQL_INSTRUMENTATION are left untouched.
+
+Run from the project root:
+    python -m benchmarks.instrumentation [--rounds 200]
+"""
+
+import argparse
+import logging
+import re
+import statistics
+import sys
+import time
+
+from models import db, ParkingLot
+from benchmarks.common import temp_app, seed, login, count_queries
+
+
+class Captured(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def p50(client, url, rounds):
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        client.get(url)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    app, tmp = temp_app(SQL_INSTRUMENTATION=True, SLOW_QUERY_MS=1000, N_PLUS_ONE_THRESHOLD=5)
+    plain, plain_tmp = temp_app()
+    for target in (app, plain):
+        with target.app_context():
+            seed(lots=5, spots_per_lot=50, users=50, reservations=2000)
+
+    #a page with an N+1 loop: one lot lookup per id
+    @app.route('/n-plus-one')
+    def n_plus_one():
+        return str([db.session.get(ParkingLot, lot_id, populate_existing=True).id for lot_id in range(1, 6)])
+
+    captured = Captured()
+    app.logger.addHandler(captured)
+    client = login(app.test_client(), 'admin')
+    failures = []
+
+    with app.app_context():
+        engine = db.engine
+    with count_queries(engine) as statements:
+        response = client.get('/admin/dashboard')
+    timing = response.headers.get('Server-Timing', '')
+    match = re.search(r'desc="(\d+) queries"', timing)
+    if not (match and all(part in timing for part in ('db;dur=', 'template;dur=', 'total;dur='))):
+        failures.append(f'unexpected Server-Timing header: {timing!r}')
+    elif int(match.group(1)) != len(statements):
+        failures.append(f'header says {match.group(1)} queries, {len(statements)} ran')
+
+    client.get('/n-plus-one')
+    if not any(message.startswith('possible N+1 on GET /n-plus-one: 5 x') for message in captured.messages):
+        failures.append('N+1 loop was not logged')
+
+    app.config['SLOW_QUERY_MS'] = 0
+    client.get('/admin/dashboard')
+    if not any(message.startswith('slow query') and 'GET /admin/dashboard' in message for message in captured.messages):
+        failures.append('slow query was not logged')
+    app.config['SLOW_QUERY_MS'] = 1000
+
+    plain_client = login(plain.test_client(), 'admin')
+    if 'Server-Timing' in plain_client.get('/admin/dashboard').headers:
+        failures.append('app without SQL_INSTRUMENTATION got a Server-Timing header')
+
+    on = p50(client, '/admin/dashboard', args.rounds)
+    off = p50(plain_client, '/admin/dashboard', args.rounds)
+    print(f'/admin/dashboard p50: {off:.2f}ms plain, {on:.2f}ms instrumented ({on - off:+.2f}ms)')
+    print(f'Server-Timing: {timing}')
+    tmp.cleanup()
+    plain_tmp.cleanup()
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# benchmarks/live_updates.py
+"""Check the live availability stream and measure the fan-out to many streams.
+
+Verifies that a stream starts with a snapshot of every lot, that a booking
+and a release each reach every open stream as one availability event, that
+counters changed by another process are picked up by the poller, that a
+stream which stops reading is resynced with a snapshot, and that closed
+streams unsubscribe (stopping the poller).
+
+Run from the project root:
+    python -m benchmarks.live_updates [--streams 1000]
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+from models import db, Reservation, IST
+from services.lot_stats import lot_counts_changed
+from benchmarks.common import temp_app, seed, login, free_username
+
+
+def open_stream(client):
+    response = client.get('/availability/stream', buffered=False)
+    return response, iter(response.response)
+
+
+def commit_counts(app, database, lot_id, available, occupied):
+    """Write a lot's counters and announce them, as a committed booking would"""
+    connection = sqlite3.connect(database)
+    connection.execute('UPDATE parking_lots SET available_spots = ?, occupied_spots = ? WHERE id = ?',
+                       (available, occupied, lot_id))
+    connection.commit()
+    connection.close()
+    lot_counts_changed.send(app, counts={lot_id: (f'Lot {lot_id}', available, occupied)})
+
+
+def read_event(chunks):
+    """(event name, data) of the next event, keepalives are skipped"""
+    while True:
+        chunk = next(chunks)
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        fields = dict(line.split(': ', 1) for line in chunk.splitlines() if ': ' in line and not line.startswith(':'))
+        if 'event' in fields:
+            return fields['event'], json.loads(fields['data'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streams', type=int, default=1000)
+    args = parser.parse_args()
+
+    app, tmp = temp_app(LIVE_POLL_SECONDS=0.2, LIVE_QUEUE_SIZE=2, API_TOKENS={'kiosk-token'})
+    app.config['LIVE_KEEPALIVE_SECONDS'] = 0.5
+    with app.app_context():
+        seed(lots=3, spots_per_lot=10, users=50, reservations=200)
+        database = db.engine.url.database
+    channel = app.extensions['live_updates']
+    user = login(app.test_client(), free_username(app))
+    failures = []
+
+    anonymous = app.test_client().get('/availability/stream')
+    if anonymous.status_code != 401:
+        failures.append(f'anonymous stream answered {anonymous.status_code}')
+    kiosk = app.test_client().get('/availability/stream', buffered=False,
+                                  headers={'Authorization': 'Bearer kiosk-token'})
+    if kiosk.status_code != 200:
+        failures.append(f'stream with an API token answered {kiosk.status_code}')
+    kiosk.close()
+
+    response, chunks = open_stream(login(app.test_client(), free_username(app)))
+    event, data = read_event(chunks)
+    lots = {lot['id']: lot for lot in data['lots']}
+    if event != 'snapshot' or sorted(lots) != [1, 2, 3] or lots[1]['available'] != 5:
+        failures.append(f'unexpected first event {event}: {data}')
+
+    user.post('/user/book/1', data={'vehicle_no': 'KA01XY1234'})
+    event, data = read_event(chunks)
+    if (event, data['lots'][0]['id'], data['lots'][0]['available']) != ('availability', 1, 4):
+        failures.append(f'booking sent {event}: {data}')
+    with app.app_context():
+        reservation_id = (db.session.query(Reservation.id)
+                          .filter_by(vehicle_no='KA01XY1234', leaving_timestamp=None).scalar())
+    user.post(f'/user/release/{reservation_id}',
+              data={'releasing_time': datetime.now(IST).strftime('%Y-%m-%dT%H:%M'), 'action': 'release'})
+    event, data = read_event(chunks)
+    if data['lots'][0]['available'] != 5:
+        failures.append(f'release sent {event}: {data}')
+
+    #another worker process books in lot 2, only the database changes
+    connection = sqlite3.connect(database)
+    connection.execute('UPDATE parking_lots SET available_spots = available_spots - 1, '
+                       'occupied_spots = occupied_spots + 1 WHERE id = 2')
+    connection.commit()
+    connection.close()
+    event, data = read_event(chunks)
+    if (event, data['lots'][0]['id'], data['lots'][0]['available']) != ('availability', 2, 4):
+        failures.append(f'change from another process sent {event}: {data}')
+
+    #a stream that stops reading falls behind by more than LIVE_QUEUE_SIZE events
+    for available in (3, 2, 1):
+        commit_counts(app, database, 3, available, 10 - available)
+    event, data = read_event(chunks)
+    if event != 'snapshot' or {lot['id']: lot['available'] for lot in data['lots']}[3] != 1:
+        failures.append(f'overflowed stream got {event} instead of a fresh snapshot')
+    response.close()
+    if channel.subscribers:
+        failures.append('closed stream is still subscribed')
+
+    #fan-out: one change queued to many open streams
+    app.config['LIVE_QUEUE_SIZE'] = 100
+    client = login(app.test_client(), 'admin')
+    streams = [open_stream(client) for _ in range(args.streams)]
+    for _, stream_chunks in streams:
+        read_event(stream_chunks)
+    started = time.perf_counter()
+    commit_counts(app, database, 1, 0, 10)
+    publish_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    received = sum(read_event(stream_chunks)[1]['lots'][0]['available'] == 0 for _, stream_chunks in streams)
+    deliver_ms = (time.perf_counter() - started) * 1000
+    if received != args.streams:
+        failures.append(f'{received} of {args.streams} streams got the update')
+    for stream_response, _ in streams:
+        stream_response.close()
+    time.sleep(app.config['LIVE_POLL_SECONDS'] * 3)
+    if channel.poller is not None:
+        failures.append('poller kept running without streams')
+    print(f'one change to {args.streams} streams: {publish_ms:.2f}ms to commit and publish, {deliver_ms:.2f}ms to read them all')
+    tmp.cleanup()
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# benchmarks/lot_cache.py
+"""Check the lot listing cache and measure the lot pages with and without it.
+
+Verifies that bookings, releases and admin lot changes show up on the next
+page view, that the number of cached searches stays within LOT_CACHE_SIZE,
+and that repeated views of /user/lots run no lot query while cached.
+
+Run from the project root:
+    python -m benchmarks.lot_cache [--rounds 300] [--lots 100]
+"""
+
+import argparse
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from models import db, Reservation, IST
+from services.lot_cache import lot_cache
+from benchmarks.common import temp_app, seed, login, free_username, count_queries
+
+
+def lot_badge(html, lot_id):
+    """available/maximum shown for a lot on /user/lots"""
+    match = re.search(rf'/user/book/{lot_id}"', html)
+    before = html[:match.start()] if match else html
+    counts = re.findall(r'data-lot-available="\d+">(\d+)</span>/(\d+)', before)
+    return tuple(map(int, counts[-1])) if counts else None
+
+
+def measure(apps, rounds):
+    """(p50 ms, lot queries) of /user/lots per app, requests alternate between the apps"""
+    runs = []
+    for app in apps:
+        with app.app_context():
+            engine = db.engine
+        runs.append((login(app.test_client(), free_username(app)), engine, [], []))
+    for _ in range(rounds):
+        for client, engine, samples, lot_queries in runs:
+            with count_queries(engine) as statements:
+                started = time.perf_counter()
+                client.get('/user/lots')
+                samples.append((time.perf_counter() - started) * 1000)
+            lot_queries.append(sum('FROM parking_lots' in statement for statement in statements))
+    return [(statistics.median(samples), sum(lot_queries)) for _, _, samples, lot_queries in runs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=300)
+    parser.add_argument('--lots', type=int, default=100)
+    args = parser.parse_args()
+
+    app, tmp = temp_app(LOT_CACHE_SIZE=8)
+    with app.app_context():
+        seed(lots=3, spots_per_lot=10, users=50, reservations=200)
+    user = login(app.test_client(), free_username(app))
+    admin = login(app.test_client(), 'admin')
+    failures = []
+
+    def shown(lot_id=1):
+        return lot_badge(user.get('/user/lots').get_data(as_text=True), lot_id)
+
+    if shown() != (5, 10):
+        failures.append(f'lot 1 shows {shown()} before booking, expected (5, 10)')
+    user.post('/user/book/1', data={'vehicle_no': 'KA01XY1234'})
+    if shown() != (4, 10):
+        failures.append('booking did not show up on the lot page')
+    with app.app_context():
+        reservation_id = (db.session.query(Reservation.id)
+                          .filter_by(vehicle_no='KA01XY1234', leaving_timestamp=None).scalar())
+    user.post(f'/user/release/{reservation_id}',
+              data={'releasing_time': datetime.now(IST).strftime('%Y-%m-%dT%H:%M'), 'action': 'release'})
+    if shown() != (5, 10):
+        failures.append('release did not show up on the lot page')
+
+    admin.post('/admin/lots/edit/1', data={'prime_location_name': 'Lot 1', 'address': '1 Benchmark Road, Test City',
+                                           'pincode': '100001', 'price_per_hour': '20',
+                                           'maximum_number_of_spots': '12'})
+    if shown() != (7, 12):
+        failures.append(f'resize did not show up on the lot page: {shown()}')
+    admin.post('/admin/lots/create', data={'prime_location_name': 'Cache Lot', 'address': '2 Cache Street',
+                                           'pincode': '560002', 'price_per_hour': '10',
+                                           'maximum_number_of_spots': '6'})
+    if shown(4) != (6, 6):
+        failures.append('created lot is missing from the lot page')
+    admin.post('/admin/lots/delete/4')
+    if 'Cache Lot' in user.get('/user/lots').get_data(as_text=True):
+        failures.append('deleted lot is still on the lot page')
+
+    for i in range(20):
+        user.post('/user/dashboard', data={'search': f'no such lot {i}'})
+    if 'Lot 2' not in user.post('/user/dashboard', data={'search': 'lot 2'}).get_data(as_text=True):
+        failures.append('dashboard search lost its results')
+    if lot_cache.stats()['entries'] > 8:
+        failures.append(f"{lot_cache.stats()['entries']} lists cached, LOT_CACHE_SIZE is 8")
+    tmp.cleanup()
+
+    apps = []
+    for ttl in (0, 30):
+        bench, bench_tmp = temp_app(LOT_CACHE_TTL=ttl)
+        with bench.app_context():
+            seed(lots=args.lots, spots_per_lot=20, users=args.lots * 20, reservations=1000)
+        apps.append((bench, bench_tmp))
+    uncached, cached = measure([bench for bench, _ in apps], args.rounds)
+    for _, bench_tmp in apps:
+        bench_tmp.cleanup()
+    if cached[1] > 1:
+        failures.append(f'{cached[1]} lot queries in {args.rounds} cached views, expected at most 1')
+    print(f'/user/lots with {args.lots} lots, {args.rounds} views')
+    print(f'  uncached: p50 {uncached[0]:.2f}ms, {uncached[1]} lot queries')
+    print(f'  cached:   p50 {cached[0]:.2f}ms, {cached[1]} lot queries')
+    print(f'  stats: {lot_cache.stats()}')
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
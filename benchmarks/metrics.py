@@ -0,0 +1,162 @@
+# benchmarks/metrics.py
+"""Check the /metrics endpoint and measure what it costs per request.
+
+Verifies that bookings, releases and turned-away bookings are counted, that
+the lot gauges follow bookings, releases and admin changes without a query
+per scrape, that worker processes sharing METRICS_DIR are added up (and the
+files of exited ones taken over), and that METRICS_TOKEN protects the endpoint.
+
+Run from the project root:
+    python -m benchmarks.metrics [--rounds 200] [--workers 3]
+"""
+
+import argparse
+import multiprocessing
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from models import db, Reservation, IST
+from benchmarks.common import temp_app, seed, login, free_username, count_queries
+
+
+def sample(text, name, **labels):
+    """Value of one series in an exposition, None if it is missing"""
+    wanted = ','.join(f'{label}="{value}"' for label, value in labels.items())
+    for line in text.splitlines():
+        match = re.match(r'(\w+)(?:\{(.*)\})? (\S+)$', line)
+        if match and match.group(1) == name and all(part in (match.group(2) or '').split(',')
+                                                    for part in wanted.split(',') if part):
+            return float(match.group(3))
+    return None
+
+
+def p50s(clients, url, rounds):
+    """Median latency per client, requests alternate so drift hits all of them alike"""
+    samples = [[] for _ in clients]
+    for _ in range(rounds):
+        for client, values in zip(clients, samples):
+            started = time.perf_counter()
+            client.get(url)
+            values.append((time.perf_counter() - started) * 1000)
+    return [statistics.median(values) for values in samples]
+
+
+def worker(app, requests):
+    client = app.test_client()
+    for _ in range(requests):
+        client.get('/user/login')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=3)
+    args = parser.parse_args()
+
+    app, tmp = temp_app(METRICS=True, METRICS_FLUSH_SECONDS=0)
+    with app.app_context():
+        seed(lots=3, spots_per_lot=10, users=50, reservations=200)
+        engine = db.engine
+    scraper = app.test_client()
+    failures = []
+
+    text = scraper.get('/metrics').get_data(as_text=True)
+    occupied = sample(text, 'parking_lot_occupied_spots', lot_id=1)
+    if occupied != 5:
+        failures.append(f'lot 1 gauge starts at {occupied}, expected 5')
+
+    user = login(app.test_client(), free_username(app))
+    user.post('/user/book/1', data={'vehicle_no': 'KA01XY1234'})
+    user.post('/user/book/1', data={'vehicle_no': 'KA01XY1234'})
+    with app.app_context():
+        reservation_id = (db.session.query(Reservation.id)
+                          .filter_by(vehicle_no='KA01XY1234', leaving_timestamp=None).scalar())
+    with count_queries(engine) as statements:
+        text = scraper.get('/metrics').get_data(as_text=True)
+    if statements:
+        failures.append(f'scrape ran {len(statements)} statements')
+    if sample(text, 'parking_bookings_total', lot_id=1) != 1:
+        failures.append('booking was not counted')
+    if sample(text, 'parking_booking_failures_total', reason='active_reservation') != 1:
+        failures.append('second booking was not counted as a failure')
+    if sample(text, 'parking_lot_occupied_spots', lot_id=1) != 6:
+        failures.append('lot gauge did not follow the booking')
+
+    user.post(f'/user/release/{reservation_id}',
+              data={'releasing_time': datetime.now(IST).strftime('%Y-%m-%dT%H:%M'), 'action': 'release'})
+    text = scraper.get('/metrics').get_data(as_text=True)
+    if sample(text, 'parking_releases_total', lot_id=1) != 1:
+        failures.append('release was not counted')
+    if sample(text, 'parking_lot_occupied_spots', lot_id=1) != 5:
+        failures.append('lot gauge did not follow the release')
+    if not sample(text, 'parking_request_duration_seconds_count', endpoint='user.book', method='POST') == 2:
+        failures.append('book requests missing from the latency histogram')
+
+    admin = login(app.test_client(), 'admin')
+    admin.post('/admin/lots/create', data={'prime_location_name': 'Metrics Lot', 'address': '1 Gauge Street',
+                                           'pincode': '560001', 'price_per_hour': '10',
+                                           'maximum_number_of_spots': '7'})
+    text = scraper.get('/metrics').get_data(as_text=True)
+    if sample(text, 'parking_lot_available_spots', lot_id=4) != 7:
+        failures.append('created lot is missing from the gauges')
+    admin.post('/admin/lots/delete/4')
+    text = scraper.get('/metrics').get_data(as_text=True)
+    if sample(text, 'parking_lot_available_spots', lot_id=4) is not None:
+        failures.append('deleted lot is still in the gauges')
+
+    #forked workers sharing a directory, each flushing after every request
+    app.config['METRICS_DIR'] = os.path.join(tmp.name, 'metrics')
+    store = app.extensions['metrics']
+    store.directory = app.config['METRICS_DIR']
+    os.makedirs(store.directory)
+    before = sample(scraper.get('/metrics').get_data(as_text=True), 'parking_request_duration_seconds_count',
+                    endpoint='user.login', method='GET') or 0
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=worker, args=(app, 10)) for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    text = scraper.get('/metrics').get_data(as_text=True)
+    after = sample(text, 'parking_request_duration_seconds_count', endpoint='user.login', method='GET')
+    if after != before + 10 * args.workers:
+        failures.append(f'{args.workers} workers x 10 logins shared {after - before:.0f}, expected {10 * args.workers}')
+    if sample(text, 'parking_bookings_total', lot_id=1) != 1:
+        failures.append('workers repeated the parent process counters')
+    if os.listdir(store.directory) != [store.filename]:
+        failures.append(f'files of exited workers left in METRICS_DIR: {sorted(os.listdir(store.directory))}')
+    text = scraper.get('/metrics').get_data(as_text=True)
+    if sample(text, 'parking_request_duration_seconds_count', endpoint='user.login', method='GET') != after:
+        failures.append('totals went down after the exited workers were taken over')
+
+    app.config['METRICS_TOKEN'] = 'secret'
+    if scraper.get('/metrics').status_code != 401:
+        failures.append('scrape without the token was allowed')
+    if scraper.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code != 200:
+        failures.append('scrape with the token was refused')
+
+    plain, plain_tmp = temp_app(METRICS=False)
+    with plain.app_context():
+        seed(lots=3, spots_per_lot=10, users=50, reservations=200)
+    if plain.test_client().get('/metrics').status_code != 404:
+        failures.append('app without METRICS serves /metrics')
+    app.config['METRICS_FLUSH_SECONDS'] = 1
+    on, off = p50s([login(app.test_client(), 'admin'), login(plain.test_client(), 'admin')],
+                   '/admin/dashboard', args.rounds)
+    print(f'/admin/dashboard p50: {off:.2f}ms without metrics, {on:.2f}ms with ({on - off:+.2f}ms)')
+    tmp.cleanup()
+    plain_tmp.cleanup()
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
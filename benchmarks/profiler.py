@@ -0,0 +1,100 @@
+# benchmarks/profiler.py
+"""Check the on-demand request profiler.
+
+Verifies that a flagged admin request writes a .prof and a .collapsed file
+under its route, that unflagged and non-admin requests are not profiled,
+that only PROFILE_KEEP runs per route are kept, that the admin page lists
+the runs and serves their files, and that apps without PROFILING have no
+profiler at all.
+
+Run from the project root:
+    python -m benchmarks.profiler
+"""
+
+import os
+import pstats
+import sys
+
+from benchmarks.common import temp_app, seed, login
+
+
+def saved_runs(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if name.endswith('.prof'))
+
+
+def main():
+    app, tmp = temp_app(PROFILING=True, PROFILE_KEEP=3)
+    #keep the runs next to the throwaway database instead of instance/
+    app.config['PROFILE_DIR'] = os.path.join(tmp.name, 'profiles')
+    plain, plain_tmp = temp_app()
+    for target in (app, plain):
+        with target.app_context():
+            seed(lots=3, spots_per_lot=20, users=10, reservations=200)
+
+    admin = login(app.test_client(), 'admin')
+    user = login(app.test_client(), 'user1')
+    route_dir = os.path.join(app.config['PROFILE_DIR'], 'admin.dashboard')
+    failures = []
+
+    admin.get('/admin/dashboard')
+    user.get('/user/dashboard?_profile=1')
+    if os.path.isdir(app.config['PROFILE_DIR']) and os.listdir(app.config['PROFILE_DIR']):
+        failures.append('an unflagged or non-admin request was profiled')
+
+    response = admin.get('/admin/dashboard', headers={'X-Profile': '1'})
+    saved = response.headers.get('X-Profile-Saved', '')
+    prof = os.path.join(app.config['PROFILE_DIR'], saved + '.prof')
+    collapsed = os.path.join(app.config['PROFILE_DIR'], saved + '.collapsed')
+    if not (saved.startswith('admin.dashboard/') and os.path.exists(prof) and os.path.exists(collapsed)):
+        failures.append(f'flagged request did not save its profile: {saved!r}')
+    else:
+        stats = pstats.Stats(prof)
+        if not any(name == 'dashboard' for _, _, name in stats.stats):
+            failures.append('the view function is missing from the .prof file')
+        with open(collapsed) as f:
+            lines = f.read().splitlines()
+        if not lines or not all(line.rsplit(' ', 1)[1].isdigit() for line in lines):
+            failures.append('the .collapsed file is not in folded stack format')
+        elif not any('dashboard (admin.py' in line for line in lines):
+            failures.append('the view function is missing from the collapsed stacks')
+
+    for _ in range(4):
+        admin.get('/admin/dashboard?_profile=1')
+    if len(saved_runs(route_dir)) != 3:
+        failures.append(f'{len(saved_runs(route_dir))} runs kept, expected PROFILE_KEEP=3')
+    if len(os.listdir(route_dir)) != 6:
+        failures.append('.prof and .collapsed files were not rotated together')
+
+    page = admin.get('/admin/profiles')
+    name = saved_runs(route_dir)[0]
+    if page.status_code != 200 or name[:-len('.prof')].encode() not in page.data:
+        failures.append('the profiles page does not list the saved runs')
+    download = admin.get(f'/admin/profiles/admin.dashboard/{name}')
+    if download.status_code != 200 or not download.data:
+        failures.append(f'downloading a profile returned {download.status_code}')
+    if admin.get('/admin/profiles/admin.dashboard/..%2F..%2Fbench.db').status_code != 404:
+        failures.append('a path outside PROFILE_DIR was served')
+    if user.get('/admin/profiles').status_code != 302:
+        failures.append('a non-admin could open the profiles page')
+
+    plain_admin = login(plain.test_client(), 'admin')
+    if plain_admin.get('/admin/profiles').status_code != 404:
+        failures.append('the profiles page exists without PROFILING')
+    if 'X-Profile-Saved' in plain_admin.get('/admin/dashboard?_profile=1').headers:
+        failures.append('app without PROFILING profiled a request')
+
+    print(f'saved {saved}')
+    tmp.cleanup()
+    plain_tmp.cleanup()
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/query_counts.py
+"""Check that pages run a fixed, small number of SQL statements.
+
+Each page is requested against a small and a much larger dataset. The check
+fails if a page goes over its budget or if its statement count grows with
+the data (the usual sign of an N+1 loop creeping back in).
+
+Run from the project root:
+    python -m benchmarks.query_counts
+"""
+
+import sys
+
+from benchmarks.common import temp_app, seed, login, count_queries, app_engines
+
+#(who, url, max statements per request) - login's user lookup included
+BUDGETS = [
+    ('admin', '/admin/dashboard', 4),
+    ('admin', '/admin/summary', 3),
+    ('admin', '/admin/summary?start=2020-01-01&end=2030-12-31&lot_id=1&lot_id=2', 3),
+    ('admin', '/admin/users', 6),
+    ('admin', '/admin/users?sort=spent&after=5', 7),
+    ('admin', '/admin/lots/1/spots', 3),
+    ('admin', '/admin/search?search_term=Lot&search_type=all', 4),
+    ('admin', '/admin/search?search_term=occupied&search_type=status', 4),
+    ('admin', '/admin/vehicles/KA01CD000001', 2),
+]
+
+SIZES = [
+    {'lots': 3, 'spots_per_lot': 10, 'users': 10, 'reservations': 50},
+    {'lots': 30, 'spots_per_lot': 200, 'users': 500, 'reservations': 20000},
+]
+
+
+def measure(size):
+    app, tmp = temp_app()
+    with app.app_context():
+        seed(**size)
+        engines = app_engines()
+    clients = {'admin': login(app.test_client(), 'admin'),
+               'user': login(app.test_client(), 'user1')}
+    counts = {}
+    for who, url, _ in BUDGETS:
+        with count_queries(*engines) as statements:
+            response = clients[who].get(url)
+        assert response.status_code == 200, f'{url} returned {response.status_code}'
+        counts[url] = len(statements)
+    tmp.cleanup()
+    return counts
+
+
+def main():
+    results = [measure(size) for size in SIZES]
+    failed = False
+    width = max(len(url) for _, url, _ in BUDGETS) + 2
+    print(f"{'page':<{width}}{'budget':>8}" + ''.join(f"{'size ' + str(i + 1):>10}" for i in range(len(SIZES))))
+    for _, url, budget in BUDGETS:
+        counts = [result[url] for result in results]
+        problem = ''
+        if max(counts) > budget:
+            problem = 'over budget'
+        elif len(set(counts)) > 1:
+            problem = 'grows with data'
+        failed = failed or bool(problem)
+        print(f"{url:<{width}}{budget:>8}" + ''.join(f'{c:>10}' for c in counts) + (f'  FAIL: {problem}' if problem else ''))
+    if failed:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# benchmarks/query_plans.py
+"""Fail if a hot route query falls back to a full table scan.
+
+Every statement the hot pages run is replayed through EXPLAIN QUERY PLAN;
+a bare `SCAN <table>` on one of the big tables means an index is missing.
+Full aggregations in the admin reports are expected to scan and are not
+checked here.
+
+Run from the project root:
+    python -m benchmarks.query_plans
+"""
+
+import re
+import sys
+
+from sqlalchemy import event
+
+from models import db, User, Reservation
+from benchmarks.common import temp_app, seed, login, app_engines
+
+#tables that grow with traffic; parking_lots is small and may be scanned
+HOT_TABLES = ('parking_spots', 'reservations', 'users')
+
+HOT_PAGES = [
+    ('parked', '/user/dashboard'),
+    ('user', '/user/book/1'),
+    ('parked', '/user/history'),
+    ('parked', '/user/summary'),
+    ('parked', '/user/release/{reservation_id}'),
+    ('admin', '/admin/dashboard'),
+    ('admin', '/admin/lots/1/spots'),
+    ('admin', '/admin/vehicles/KA01CD000001'),
+]
+
+FULL_SCAN = re.compile(r'\bSCAN (\w+)(?: AS \w+)?$')
+
+
+def main():
+    app, tmp = temp_app()
+    with app.app_context():
+        seed(lots=5, spots_per_lot=50, users=200, reservations=5000)
+        engines = app_engines()
+        engine = db.engine
+        #one user parked right now (release page) and one free to book
+        active = Reservation.query.filter_by(leaving_timestamp=None).first()
+        parked, reservation_id = active.user.username, active.id
+        free = User.query.filter(User.is_admin.is_(False),
+                                 ~User.reservations.any(Reservation.leaving_timestamp.is_(None))).first().username
+
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            captured.append((page, statement, parameters))
+
+    clients = {'admin': login(app.test_client(), 'admin'),
+               'parked': login(app.test_client(), parked),
+               'user': login(app.test_client(), free)}
+    #reports run on the read-only engine, their statements are planned on the writer like the rest
+    for listened in engines:
+        event.listen(listened, 'before_cursor_execute', before_cursor_execute)
+    for who, url in HOT_PAGES:
+        page = url.format(reservation_id=reservation_id)
+        response = clients[who].get(page)
+        assert response.status_code == 200, f'{page} returned {response.status_code}'
+    for listened in engines:
+        event.remove(listened, 'before_cursor_execute', before_cursor_execute)
+
+    failures = []
+    with engine.connect() as conn:
+        for page, statement, parameters in captured:
+            plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+            for row in plan:
+                match = FULL_SCAN.search(row[-1])
+                if match and match.group(1).split('_1')[0] in HOT_TABLES:
+                    failures.append((page, row[-1], ' '.join(statement.split())[:160]))
+    tmp.cleanup()
+
+    print(f'checked {len(captured)} statements from {len(HOT_PAGES)} pages')
+    for page, step, statement in failures:
+        print(f'FAIL {page}: {step}\n     {statement}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# benchmarks/resize_lot.py
+"""Time and check resizing a large, partly occupied lot through admin.edit_lot.
+
+Shrinks the lot (retiring free spots), grows it past its old size (reviving
+retired spots, then inserting new ones) and checks after each step that
+occupied spots were left alone, the counters match the spots and the search
+index has no retired spots. Fails on a wrong result or a step over --limit.
+
+Run from the project root:
+    python -m benchmarks.resize_lot [--spots 10000] [--limit 1.0]
+"""
+
+import argparse
+import sys
+import time
+
+from sqlalchemy import func, text
+from models import db, ParkingLot, ParkingSpot
+from services.lot_stats import check_lot_counters
+from services.search import SEARCH_TABLE
+from benchmarks.common import temp_app, seed, login
+
+
+def resize(client, lot, size, expected_status=302):
+    started = time.perf_counter()
+    response = client.post(f'/admin/lots/edit/{lot.id}', data={
+        'prime_location_name': lot.prime_location_name, 'address': lot.address, 'pincode': lot.pincode,
+        'price_per_hour': str(lot.price_per_hour), 'maximum_number_of_spots': str(size),
+    })
+    elapsed = time.perf_counter() - started
+    assert response.status_code == expected_status, f'resize to {size} returned {response.status_code}'
+    return elapsed
+
+
+def check(lot_id, size, occupied_ids):
+    lot = db.session.get(ParkingLot, lot_id)
+    by_status = dict(db.session.query(ParkingSpot.status, func.count(ParkingSpot.id))
+                     .filter_by(lot_id=lot_id).group_by(ParkingSpot.status).all())
+    assert lot.maximum_number_of_spots == size, f'lot size {lot.maximum_number_of_spots}, expected {size}'
+    assert by_status.get('A', 0) + by_status.get('O', 0) == size, f'{by_status} does not add up to {size}'
+    still_occupied = {spot_id for (spot_id,) in db.session.query(ParkingSpot.id).filter_by(lot_id=lot_id, status='O')}
+    assert still_occupied == occupied_ids, 'occupied spots changed'
+    assert not check_lot_counters(), 'lot counters drifted'
+    numbers = db.session.query(ParkingSpot.spot_number).filter_by(lot_id=lot_id).all()
+    assert len(numbers) == len(set(numbers)), 'duplicate spot numbers'
+    documents = db.session.execute(text(f'SELECT count(*) FROM {SEARCH_TABLE} WHERE rowid IN '
+                                        f'(SELECT id FROM parking_spots WHERE lot_id = :lot_id)'),
+                                   {'lot_id': lot_id}).scalar()
+    assert documents == size, f'{documents} search documents for {size} spots'
+    return by_status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--spots', type=int, default=10000)
+    parser.add_argument('--limit', type=float, default=1.0, help='seconds allowed per resize')
+    args = parser.parse_args()
+
+    app, tmp = temp_app(MAX_SPOTS_PER_LOT=args.spots * 2)
+    with app.app_context():
+        seed(lots=1, spots_per_lot=args.spots, users=args.spots, reservations=1000)
+        lot = db.session.get(ParkingLot, 1)
+        occupied_ids = {spot_id for (spot_id,) in db.session.query(ParkingSpot.id).filter_by(lot_id=1, status='O')}
+    client = login(app.test_client(), 'admin')
+
+    #shrink, shrink to one free spot, grow past the original size, back to it
+    steps = [args.spots // 2 + args.spots // 10, len(occupied_ids) + 1, args.spots + args.spots // 2, args.spots]
+    slowest = 0.0
+    for size in steps:
+        with app.app_context():
+            elapsed = resize(client, lot, size)
+            by_status = check(lot.id, size, occupied_ids)
+        slowest = max(slowest, elapsed)
+        print(f'resize to {size:>6}: {elapsed:.3f}s  {by_status}')
+
+    #shrinking below the occupied spots is refused and changes nothing
+    with app.app_context():
+        resize(client, lot, len(occupied_ids) - 1, expected_status=200)
+        check(lot.id, args.spots, occupied_ids)
+    tmp.cleanup()
+
+    if slowest > args.limit:
+        print(f'FAIL: over {args.limit}s')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+# benchmarks/routes.py
+"""Latency and SQL statements per request for every blueprint route.
+
+Each route is driven through the Flask test client against generated
+datasets of several sizes (create_db.generate_dataset). For every size and
+route it reports p50/p99 latency and statements per request, then fails if
+
+  * a route runs more statements than its budget,
+  * a route's statement count grows with the data (an N+1 loop),
+  * compared to the stored baseline, a route runs more statements or its
+    p50/p99 got slower by more than --threshold.
+
+Baselines are machine specific. Record one with --update-baseline and
+compare later runs on the same machine against it.
+
+Run from the project root:
+    python -m benchmarks.routes [--sizes small,medium] [--rounds 30] [--threshold 0.5]
+    python -m benchmarks.routes --database /tmp/big.db   # a copy of an existing database
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import func
+from app import create_app
+from migrations import upgrade
+from models import db, User, ParkingLot, Reservation, IST
+from benchmarks.common import login, count_queries, app_engines
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baselines', 'routes.json')
+
+#enough users that some are left without a parked car at 60% occupancy
+SIZES = {
+    'small': {'lots': 3, 'spots_per_lot': 20, 'users': 50, 'reservations': 2000},
+    'medium': {'lots': 20, 'spots_per_lot': 200, 'users': 5000, 'reservations': 100000},
+    'large': {'lots': 100, 'spots_per_lot': 1000, 'users': 100000, 'reservations': 1000000},
+}
+
+#(endpoint, client, method, url, max statements per request); run in this order every
+#round, so book always finds the free user unparked and release has its reservation
+ROUTES = [
+    ('admin.dashboard', 'admin', 'GET', '/admin/dashboard', 4),
+    ('admin.summary', 'admin', 'GET', '/admin/summary', 3),
+    ('admin.view_users', 'admin', 'GET', '/admin/users', 6),
+    ('admin.view_spots', 'admin', 'GET', '/admin/lots/{lot_id}/spots', 3),
+    ('admin.search_spots', 'admin', 'GET', '/admin/search?search_term={search_term}&search_type=all', 4),
+    ('user.dashboard', 'parked', 'GET', '/user/dashboard', 3),
+    ('user.view_lots', 'parked', 'GET', '/user/lots', 2),
+    ('user.reservation_history', 'parked', 'GET', '/user/history', 2),
+    ('user.book', 'free', 'POST', '/user/book/{lot_id}', 10),
+    ('user.release_spot', 'free', 'POST', '/user/release/{reservation_id}', 8),
+]
+
+
+def build(size, database=None):
+    """App on a generated (or copied) database and the ids the routes need"""
+    tmp = tempfile.TemporaryDirectory()
+    path = os.path.join(tmp.name, 'bench.db')
+    if database:
+        shutil.copy(database, path)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path})
+    with app.app_context():
+        upgrade()
+        if not database:
+            import create_db
+            with contextlib.redirect_stdout(io.StringIO()):
+                create_db.create_default_admin()
+                create_db.generate_dataset(**SIZES[size], seed=1)
+        active = (db.session.query(Reservation.user_id)
+                  .filter(Reservation.leaving_timestamp.is_(None)))
+        #the busiest parked user has the longest history, the worst case for the user pages
+        parked = (db.session.query(User.username)
+                  .join(Reservation, Reservation.user_id == User.id)
+                  .filter(User.id.in_(active))
+                  .group_by(User.id)
+                  .order_by(func.count(Reservation.id).desc())
+                  .first())[0]
+        free = (User.query.filter(User.is_admin.is_(False), User.id.notin_(active))
+                .order_by(User.id).first())
+        assert free is not None, 'every user is parked, book/release need one who is not'
+        lot_id = db.session.query(func.min(ParkingLot.id)).scalar()
+        state = {'lot_id': lot_id, 'search_term': 'Parking', 'free_id': free.id, 'reservation_id': None}
+        engines = app_engines()
+    clients = {'admin': login(app.test_client(), 'admin', 'admin123'),
+               'parked': login(app.test_client(), parked),
+               'free': login(app.test_client(), free.username)}
+    return app, tmp, engines, clients, state
+
+
+def request(clients, state, endpoint, who, method, url):
+    data = None
+    if endpoint == 'user.book':
+        data = {'vehicle_no': 'BENCH0001'}
+    elif endpoint == 'user.release_spot':
+        data = {'releasing_time': datetime.now(IST).strftime('%Y-%m-%dT%H:%M'), 'action': 'release'}
+    return clients[who].open(url.format(**state), method=method, data=data)
+
+
+def measure(size, rounds, database=None):
+    app, tmp, engines, clients, state = build(size, database)
+    samples = {endpoint: [] for endpoint, *_ in ROUTES}
+    statements = {endpoint: [] for endpoint, *_ in ROUTES}
+    for round_number in range(rounds + 2):
+        for endpoint, who, method, url, _ in ROUTES:
+            with count_queries(*engines) as executed:
+                started = time.perf_counter()
+                response = request(clients, state, endpoint, who, method, url)
+                elapsed = (time.perf_counter() - started) * 1000
+            expected = 302 if method == 'POST' else 200
+            assert response.status_code == expected, f'{endpoint} returned {response.status_code}'
+            if endpoint == 'user.book':
+                with app.app_context():
+                    state['reservation_id'] = (db.session.query(Reservation.id)
+                                               .filter_by(user_id=state['free_id'], leaving_timestamp=None)
+                                               .scalar())
+                assert state['reservation_id'], 'booking did not create a reservation'
+            #the first two rounds warm caches and the allocator
+            if round_number >= 2:
+                samples[endpoint].append(elapsed)
+                statements[endpoint].append(len(executed))
+    tmp.cleanup()
+    results = {}
+    for endpoint, values in samples.items():
+        values.sort()
+        results[endpoint] = {
+            'p50_ms': round(statistics.median(values), 2),
+            'p99_ms': round(values[max(int(len(values) * 0.99) - 1, 0)], 2),
+            'statements': max(statements[endpoint]),
+        }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Problems per (size, endpoint): budget, growth with data, regression vs baseline"""
+    budgets = {endpoint: budget for endpoint, _, _, _, budget in ROUTES}
+    problems = {}
+    for size, routes in results.items():
+        for endpoint, result in routes.items():
+            found = []
+            if result['statements'] > budgets[endpoint]:
+                found.append(f"over budget ({result['statements']} > {budgets[endpoint]})")
+            if len({results[other][endpoint]['statements'] for other in results}) > 1:
+                found.append('statements grow with data')
+            before = baseline.get(size, {}).get(endpoint)
+            if before:
+                if result['statements'] > before['statements']:
+                    found.append(f"statements {before['statements']} -> {result['statements']}")
+                for key in ('p50_ms', 'p99_ms'):
+                    #1ms of slack keeps sub-millisecond noise from failing the run
+                    if result[key] > before[key] * (1 + threshold) + 1:
+                        found.append(f'{key} {before[key]} -> {result[key]}')
+            if found:
+                problems[(size, endpoint)] = found
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='small,medium', help=f"comma separated, from {', '.join(SIZES)}")
+    parser.add_argument('--database', help='benchmark a copy of this sqlite file instead of generated data')
+    parser.add_argument('--rounds', type=int, default=30)
+    parser.add_argument('--threshold', type=float, default=0.5, help='allowed latency growth over the baseline')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help='store this run as the new baseline')
+    args = parser.parse_args()
+
+    if args.database:
+        sizes = [os.path.basename(args.database)]
+        results = {sizes[0]: measure(None, args.rounds, args.database)}
+    else:
+        sizes = args.sizes.split(',')
+        results = {size: measure(size, args.rounds) for size in sizes}
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    problems = compare(results, baseline, args.threshold)
+
+    width = max(len(endpoint) for endpoint, *_ in ROUTES) + 2
+    for size in sizes:
+        print(f"\n{size}: {SIZES.get(size, args.database)}")
+        print(f"{'route':<{width}}{'p50 ms':>10}{'p99 ms':>10}{'stmts':>8}")
+        for endpoint, result in results[size].items():
+            problem = problems.get((size, endpoint))
+            print(f"{endpoint:<{width}}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['statements']:>8}"
+                  + (f"  FAIL: {'; '.join(problem)}" if problem else ''))
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        stored = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                stored = json.load(f)
+        stored.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+        print(f'\nbaseline written to {args.baseline}')
+    elif not baseline:
+        print(f'\nno baseline at {args.baseline}, record one with --update-baseline')
+    if problems:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
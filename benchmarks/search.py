@@ -0,0 +1,117 @@
+# benchmarks/search.py
+"""Check the admin search finds parts of spot numbers and plates, and time it.
+
+Seeds a dataset, compares the trigram index with the LIKE scans it replaced
+for single words on every column, checks that plates match whatever the
+spacing and that words shorter than a trigram still match, and that an index
+built with the old tokenizer is recreated by upgrade(). Reports the p50 of
+index and LIKE searches.
+
+Run from the project root:
+    python -m benchmarks.search [--lots 50] [--spots 200] [--rounds 50]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+from sqlalchemy import text
+from migrations import upgrade
+from models import db, ParkingSpot, Reservation
+from services import search as search_index
+from services.search import SEARCH_TABLE, SEARCH_COLUMNS, search_spot_ids, _like_spot_ids
+from benchmarks.common import temp_app, seed
+
+#(search_type, single word) answered the same by the index and the LIKE scans
+SAME_AS_LIKE = [
+    ('spot_number', 'S1'), ('spot_number', '10'), ('spot_number', 'S12'), ('spot_number', '7'),
+    ('lot_name', 'Lot'), ('lot_name', '3'), ('lot_name', 'ot'), ('username', 'user1'), ('username', 'r4'),
+    ('vehicle_no', '000001'), ('vehicle_no', 'CD0000'), ('vehicle_no', 'KA01'), ('vehicle_no', '12'),
+]
+
+
+def all_ids(term, search_type):
+    return search_spot_ids(term, search_type, per_page=10 ** 6)[0]
+
+
+def like_ids(term, search_type):
+    return [spot_id for (spot_id,) in _like_spot_ids(term, search_index.SEARCH_TYPES[search_type])]
+
+
+def like_page(term, search_type):
+    """What the LIKE fallback runs for one page: its ids and the count"""
+    query = _like_spot_ids(term, search_index.SEARCH_TYPES[search_type])
+    return query.limit(50).all(), query.count()
+
+
+def p50_ms(call, rounds):
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lots', type=int, default=50)
+    parser.add_argument('--spots', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+    failures = []
+
+    app, tmp = temp_app()
+    with app.app_context():
+        seed(lots=args.lots, spots_per_lot=args.spots, users=args.lots * args.spots, reservations=0)
+        for search_type, term in SAME_AS_LIKE:
+            found, expected = sorted(all_ids(term, search_type)), sorted(like_ids(term, search_type))
+            if found != expected:
+                failures.append(f'{search_type} "{term}": {len(found)} spots, LIKE finds {len(expected)}')
+
+        #the seed parks KA01CD000001 in spot 1
+        plate = db.session.query(Reservation.vehicle_no).filter_by(spot_id=1, leaving_timestamp=None).scalar()
+        for search_type, term in (('vehicle_no', '000001'), ('vehicle_no', 'CD000001'),
+                                  ('vehicle_no', 'ka-01 cd 000001'), ('all', 'KA-01CD-000001'),
+                                  ('all', 'cd000001')):
+            if search_spot_ids(term, search_type)[0] != [1]:
+                failures.append(f'{search_type} "{term}" does not find {plate} alone')
+        a10 = ParkingSpot(lot_id=1, spot_number='A10', status='A')
+        db.session.add(a10)
+        db.session.commit()
+        search_index.reindex_spot(a10.id)
+        db.session.commit()
+        if a10.id not in all_ids('10', 'spot_number') or a10.id not in all_ids('10', 'all'):
+            failures.append('"10" does not find spot A10')
+        if all_ids('S1 10', 'spot_number') != sorted(set(all_ids('S1', 'spot_number')) & set(all_ids('10', 'spot_number'))):
+            failures.append('every word of a search must match')
+
+        timings = [(f'{search_type} "{term}"', p50_ms(lambda: search_spot_ids(term, search_type), args.rounds),
+                    p50_ms(lambda: like_page(term, search_type), args.rounds))
+                   for search_type, term in (('vehicle_no', 'CD0000'), ('spot_number', 'S12'),
+                                             ('lot_name', 'Lot'), ('spot_number', '10'))]
+
+        #an index from before the trigram tokenizer is replaced on upgrade
+        db.session.execute(text(f'DROP TABLE {SEARCH_TABLE}'))
+        columns = ', '.join(SEARCH_COLUMNS).replace('vehicle_key', 'vehicle_no')
+        db.session.execute(text(f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5({columns}, prefix='2 3')"))
+        db.session.commit()
+        if SEARCH_TABLE not in upgrade() or search_spot_ids('000001', 'vehicle_no')[0] != [1]:
+            failures.append('upgrade() did not recreate an index with the old tokenizer')
+        if SEARCH_TABLE in upgrade():
+            failures.append('a second upgrade() recreated the index again')
+    tmp.cleanup()
+
+    print(f'{args.lots * args.spots} spots')
+    for label, indexed, scanned in timings:
+        print(f'  {label:24} index p50 {indexed:6.2f}ms  LIKE p50 {scanned:6.2f}ms')
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
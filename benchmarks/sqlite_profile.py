@@ -0,0 +1,158 @@
+# benchmarks/sqlite_profile.py
+"""Check the SQLite engine profile and measure read/write throughput with and without it.
+
+Verifies the pragmas of the writer and read-only connections, that the
+admin reports run on the read-only connections and cannot write there.
+Then runs writer threads (book -> release loops) next to reader threads
+(/admin/summary and /admin/users) for a few seconds, once with SQLite
+defaults and once with the profile, and reports both throughputs and
+failed requests (e.g. "database is locked").
+
+Run from the project root:
+    python -m benchmarks.sqlite_profile [--seconds 5] [--writers 8] [--readers 4]
+"""
+
+import argparse
+import collections
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from models import db, User, Reservation, IST
+from services.engine_profile import engine_profile, ReadOnlySession
+from benchmarks.common import temp_app, seed, login, count_queries
+
+
+def free_usernames(app, count):
+    with app.app_context():
+        active = db.session.query(Reservation.user_id).filter(Reservation.leaving_timestamp.is_(None))
+        return [username for (username,) in db.session.query(User.username)
+                .filter(User.is_admin.is_(False), User.id.notin_(active)).order_by(User.id).limit(count)]
+
+
+def run(app, seconds, writers, readers):
+    """(writes/s, reads/s, write p95 ms, read p95 ms, failed requests by kind) of concurrent book/release and report traffic"""
+    lock = threading.Lock()
+    totals = {'writes': 0, 'reads': 0}
+    failed = collections.Counter()
+    write_ms, read_ms = [], []
+
+    def write(client, username):
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            response = client.post('/user/book/1', data={'vehicle_no': f'KA01{username[-6:]}'})
+            booked_ms = (time.perf_counter() - started) * 1000
+            with app.app_context():
+                reservation_id = (db.session.query(Reservation.id).join(User)
+                                  .filter(User.username == username, Reservation.leaving_timestamp.is_(None))
+                                  .scalar())
+            if reservation_id is None:
+                with lock:
+                    failed[f'booking {response.status_code}, no reservation'] += 1
+                continue
+            started = time.perf_counter()
+            released = client.post(f'/user/release/{reservation_id}', data={
+                'releasing_time': datetime.now(IST).strftime('%Y-%m-%dT%H:%M'), 'action': 'release'})
+            with lock:
+                totals['writes'] += 2
+                write_ms.extend([booked_ms, (time.perf_counter() - started) * 1000])
+                if released.status_code >= 500:
+                    failed[f'release {released.status_code}'] += 1
+
+    def read(client):
+        paths = ('/admin/summary', '/admin/users')
+        n = 0
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            response = client.get(paths[n % 2])
+            elapsed = (time.perf_counter() - started) * 1000
+            n += 1
+            with lock:
+                totals['reads'] += 1
+                read_ms.append(elapsed)
+                if response.status_code != 200:
+                    failed[f'report {response.status_code}'] += 1
+
+    #logins hash passwords, they happen before the clock starts
+    threads = ([threading.Thread(target=write, args=(login(app.test_client(), username), username))
+                for username in free_usernames(app, writers)]
+               + [threading.Thread(target=read, args=(login(app.test_client(), 'admin'),)) for _ in range(readers)])
+    stop = time.monotonic() + seconds
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return (totals['writes'] / elapsed, totals['reads'] / elapsed, p95(write_ms), p95(read_ms), failed)
+
+
+def p95(samples):
+    return statistics.quantiles(samples, n=20)[-1] if len(samples) > 1 else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=4)
+    args = parser.parse_args()
+    failures = []
+
+    app, tmp = temp_app()
+    with app.app_context():
+        seed(lots=3, spots_per_lot=10, users=50, reservations=200)
+        writer_engine, reader_engine = db.engine, engine_profile.reader()
+        for name, engine, expected in (('writer', writer_engine, ('wal', 1, 0)), ('reader', reader_engine, ('wal', 1, 1))):
+            with engine.connect() as connection:
+                found = tuple(connection.exec_driver_sql(f'PRAGMA {pragma}').scalar()
+                              for pragma in ('journal_mode', 'synchronous', 'query_only'))
+            if found != expected:
+                failures.append(f'{name} connections: journal_mode/synchronous/query_only {found}')
+        reader = ReadOnlySession(db)
+        try:
+            reader.execute(text("UPDATE parking_lots SET address = 'x'"))
+            failures.append('the read-only connections accepted a write')
+        except OperationalError:
+            pass
+        finally:
+            reader.close()
+    admin = login(app.test_client(), 'admin')
+    admin.get('/admin/summary')
+    for path in ('/admin/summary', '/admin/users'):
+        with count_queries(writer_engine) as written, count_queries(reader_engine) as read:
+            status = admin.get(path).status_code
+        if status != 200 or written or not read:
+            failures.append(f'{path}: {status}, {len(written)} statements on the writer, {len(read)} read-only')
+    tmp.cleanup()
+
+    results = {}
+    for profile in (False, True):
+        bench, bench_tmp = temp_app(SQLITE_PROFILE=profile)
+        with bench.app_context():
+            seed(lots=20, spots_per_lot=50, users=1000, reservations=20000)
+        results[profile] = run(bench, args.seconds, args.writers, args.readers)
+        bench_tmp.cleanup()
+    print(f'{args.writers} writers (book/release) and {args.readers} readers (/admin/summary, /admin/users), '
+          f'{args.seconds:g}s each')
+    for profile, label in ((False, 'SQLite defaults'), (True, 'profile')):
+        writes, reads, write_p95, read_p95, failed = results[profile]
+        print(f'  {label:16} {writes:6.1f} writes/s (p95 {write_p95:6.1f}ms)  {reads:5.1f} reads/s '
+              f'(p95 {read_p95:6.1f}ms)  {sum(failed.values())} failed {dict(failed) if failed else ""}')
+    if results[True][4]:
+        failures.append(f'failed requests with the profile: {dict(results[True][4])}')
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
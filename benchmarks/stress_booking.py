@@ -0,0 +1,137 @@
+# benchmarks/stress_booking.py
+"""Hammer book/release from many threads and check no spot is double-booked.
+
+Every thread logs in as its own user and loops book -> release through the
+Flask test client against a lot with fewer spots than threads, so claims
+constantly collide. Exits non-zero if any spot was handed to two drivers or
+a lot or user counter drifted.
+
+Run from the project root:
+    python -m benchmarks.stress_booking --threads 16 --cycles 200
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import func
+
+from app import create_app
+from models import db, User, ParkingLot, ParkingSpot, Reservation
+from services.user_stats import check_user_counters
+
+
+def setup(app, threads, spots):
+    with app.app_context():
+        db.create_all()
+        lot = ParkingLot(prime_location_name='Stress Lot', address='1 Stress Avenue, Test City',
+                         pincode='000000', price_per_hour=10.0, maximum_number_of_spots=spots,
+                         available_spots=spots)
+        db.session.add(lot)
+        db.session.flush()
+        for i in range(1, spots + 1):
+            db.session.add(ParkingSpot(lot_id=lot.id, spot_number=f'S{i}', status='A'))
+        users = []
+        for i in range(threads):
+            user = User(username=f'stress{i}')
+            user.set_password('password123')
+            db.session.add(user)
+            users.append(user)
+        db.session.commit()
+        return lot.id, [(user.id, user.username) for user in users]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--cycles', type=int, default=200, help='book/release cycles per thread')
+    parser.add_argument('--spots', type=int, default=None, help='defaults to half the thread count')
+    args = parser.parse_args()
+    spots = args.spots or max(1, args.threads // 2)
+
+    tmp = tempfile.TemporaryDirectory()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp.name, 'stress.db')})
+    lot_id, users = setup(app, args.threads, spots)
+
+    held = {}  # spot_id -> user_id, as observed by the clients
+    held_lock = threading.Lock()
+    stats = {'booked': 0, 'full': 0, 'released': 0, 'errors': 0, 'double': 0}
+    stats_lock = threading.Lock()
+
+    def bump(key):
+        with stats_lock:
+            stats[key] += 1
+
+    def worker(user_id, username):
+        client = app.test_client()
+        client.post('/user/login', data={'username': username, 'password': 'password123'})
+        for _ in range(args.cycles):
+            try:
+                client.post(f'/user/book/{lot_id}', data={'vehicle_no': f'KA01{user_id:04d}'})
+                with app.app_context():
+                    reservation = Reservation.query.filter_by(user_id=user_id, leaving_timestamp=None).first()
+                    active = (reservation.id, reservation.spot_id) if reservation else None
+                if active is None:
+                    bump('full')
+                    continue
+                reservation_id, spot_id = active
+                with held_lock:
+                    if spot_id in held:
+                        bump('double')
+                    held[spot_id] = user_id
+                bump('booked')
+
+                with held_lock:
+                    held.pop(spot_id, None)
+                client.post(f'/user/release/{reservation_id}', data={
+                    'releasing_time': datetime.now().strftime('%Y-%m-%dT%H:%M'),
+                    'action': 'release',
+                })
+                bump('released')
+            except Exception as e:
+                bump('errors')
+                print(f'{username}: {e!r}', file=sys.stderr)
+
+    workers = [threading.Thread(target=worker, args=user) for user in users]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        #every spot may have at most one open reservation
+        overbooked = (db.session.query(Reservation.spot_id)
+                      .filter(Reservation.leaving_timestamp.is_(None))
+                      .group_by(Reservation.spot_id)
+                      .having(func.count(Reservation.id) > 1)
+                      .count())
+        occupied = ParkingSpot.query.filter_by(lot_id=lot_id, status='O').count()
+        active = Reservation.query.filter_by(leaving_timestamp=None).count()
+        lot = db.session.get(ParkingLot, lot_id)
+        counters = (lot.available_spots, lot.occupied_spots)
+        users_drifted = len(check_user_counters())
+    tmp.cleanup()
+
+    cycles = stats['booked'] + stats['full']
+    print(f"{args.threads} threads x {args.cycles} cycles on {spots} spots in {elapsed:.1f}s "
+          f"({cycles / elapsed:.0f} bookings/s)")
+    print(f"booked={stats['booked']} full={stats['full']} released={stats['released']} errors={stats['errors']}")
+    print(f"double allocations seen by clients: {stats['double']}")
+    print(f"spots with >1 active reservation: {overbooked}, occupied spots: {occupied}, active reservations: {active}")
+    print(f"lot counters available/occupied: {counters[0]}/{counters[1]}, users with drifted counters: {users_drifted}")
+
+    if (stats['double'] or overbooked or occupied != active or counters != (spots - occupied, occupied)
+            or users_drifted):
+        print('FAIL: spot allocation is not consistent')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
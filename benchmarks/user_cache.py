@@ -0,0 +1,114 @@
+# benchmarks/user_cache.py
+"""Check the logged-in user cache and measure page views with and without it.
+
+Verifies that repeated page views of a logged-in user run no query for the
+user, that a profile edit (including a password change) and a user deletion
+take effect on the next request, and that the number of cached users stays
+within USER_CACHE_SIZE.
+
+Run from the project root:
+    python -m benchmarks.user_cache [--rounds 300]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+from models import db, User
+from services.user_cache import user_cache
+from benchmarks.common import temp_app, seed, login, free_username, count_queries, PASSWORD
+
+
+def user_queries(statements):
+    return sum('FROM users' in statement for statement in statements)
+
+
+def measure(apps, rounds, path):
+    """(p50 ms, user queries) of `path` per app, requests alternate between the apps"""
+    runs = []
+    for app in apps:
+        with app.app_context():
+            engine = db.engine
+        runs.append((login(app.test_client(), free_username(app)), engine, [], []))
+    for _ in range(rounds):
+        for client, engine, samples, queries in runs:
+            with count_queries(engine) as statements:
+                started = time.perf_counter()
+                client.get(path)
+                samples.append((time.perf_counter() - started) * 1000)
+            queries.append(user_queries(statements))
+    return [(statistics.median(samples), sum(queries)) for _, _, samples, queries in runs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=300)
+    args = parser.parse_args()
+
+    app, tmp = temp_app(USER_CACHE_SIZE=4)
+    with app.app_context():
+        seed(lots=3, spots_per_lot=10, users=50, reservations=200)
+        engine = db.engine
+    username = free_username(app)
+    user = login(app.test_client(), username)
+    failures = []
+
+    user.get('/user/dashboard')
+    with count_queries(engine) as statements:
+        page = user.get('/user/dashboard').get_data(as_text=True)
+    if user_queries(statements):
+        failures.append(f'{user_queries(statements)} user queries on a repeated page view')
+    if f'Welcome, {username}!' not in page:
+        failures.append('dashboard does not greet the cached user')
+
+    user.post('/user/edit_profile', data={'username': 'renamed_user', 'current_password': PASSWORD,
+                                          'new_password': 'changed1', 'confirm_password': 'changed1'})
+    if 'Welcome, renamed_user!' not in user.get('/user/dashboard').get_data(as_text=True):
+        failures.append('profile edit did not show up on the next page')
+    relogin = app.test_client()
+    relogin.post('/user/login', data={'username': 'renamed_user', 'password': 'changed1'})
+    if relogin.get('/user/dashboard').status_code != 200:
+        failures.append('changed password does not log in')
+    with app.app_context():
+        stored = User.query.filter_by(username='renamed_user').first()
+        if stored is None or not stored.check_password('changed1'):
+            failures.append('profile edit of a cached user was not saved')
+        db.session.delete(stored)
+        db.session.commit()
+    if user.get('/user/dashboard').status_code != 302:
+        failures.append('deleted user is still logged in')
+
+    for i in range(1, 11):
+        client = app.test_client()
+        client.post('/user/login', data={'username': f'user{i}', 'password': PASSWORD})
+        client.get('/user/lots')
+    if user_cache.stats()['entries'] > 4:
+        failures.append(f"{user_cache.stats()['entries']} users cached, USER_CACHE_SIZE is 4")
+    tmp.cleanup()
+
+    apps = []
+    for ttl in (0, 60):
+        bench, bench_tmp = temp_app(USER_CACHE_TTL=ttl)
+        with bench.app_context():
+            seed(lots=20, spots_per_lot=20, users=400, reservations=1000)
+        apps.append((bench, bench_tmp))
+    uncached, cached = measure([bench for bench, _ in apps], args.rounds, '/user/lots')
+    for _, bench_tmp in apps:
+        bench_tmp.cleanup()
+    if cached[1] > 1:
+        failures.append(f'{cached[1]} user queries in {args.rounds} cached views, expected at most 1')
+    print(f'/user/lots, {args.rounds} views')
+    print(f'  uncached: p50 {uncached[0]:.2f}ms, {uncached[1]} user queries')
+    print(f'  cached:   p50 {cached[0]:.2f}ms, {cached[1]} user queries')
+    print(f'  stats: {user_cache.stats()}')
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
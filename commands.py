@@ -0,0 +1,110 @@
+# commands.py
+"""Maintenance commands, run with `flask --app app <command>`"""
+
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from migrations import upgrade
+from models import db, ParkingLot
+from services.lot_stats import check_lot_counters
+from services.user_stats import check_user_counters
+from services import search as search_index
+from services.allocator import spot_allocator
+from services.lot_removal import close_lot, remove_closed_lot, CHUNK_SIZE
+from services.archive import archive_completed
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """Apply pending schema changes to the database"""
+    applied = upgrade()
+    if applied:
+        for name in applied:
+            click.echo(f'✅ Applied {name}')
+    else:
+        click.echo('ℹ️  Database is up to date')
+
+
+@click.command('check-counters')
+@with_appcontext
+@click.option('--repair', is_flag=True, help='Overwrite drifted counters with the real counts.')
+def check_counters_command(repair):
+    """Verify the per-lot spot counters and the per-user reservation counters"""
+    drifted = check_lot_counters(repair=repair)
+    drifted_users = check_user_counters(repair=repair)
+    if not drifted and not drifted_users:
+        click.echo('✅ All lot and user counters are consistent')
+        return
+    for lot, stored, actual in drifted:
+        click.echo(f'⚠️  {lot.prime_location_name}: stored available/occupied {stored[0]}/{stored[1]}, '
+                   f'actual {actual[0]}/{actual[1]}')
+    for user, stored, actual in drifted_users:
+        click.echo(f'⚠️  {user.username}: stored reservations/spent {stored[0]}/{stored[1]:.2f}, '
+                   f'actual {actual[0]}/{actual[1]:.2f}')
+    if repair:
+        click.echo(f'✅ Repaired {len(drifted)} lot(s) and {len(drifted_users)} user(s)')
+    else:
+        raise SystemExit(1)
+
+
+@click.command('rebuild-search')
+@with_appcontext
+def rebuild_search_command():
+    """Recreate the full-text search index from the live tables"""
+    if not search_index.is_enabled():
+        if not search_index.create_index():
+            click.echo('⚠️  SQLite FTS5 is not available, admin search uses LIKE scans')
+            return
+    else:
+        search_index.rebuild()
+    click.echo('✅ Search index rebuilt')
+
+
+@click.command('delete-lot')
+@with_appcontext
+@click.argument('lot_id', type=int)
+@click.option('--chunk-size', default=CHUNK_SIZE, show_default=True, help='Rows per transaction.')
+def delete_lot_command(lot_id, chunk_size):
+    """Archive a lot's reservations and delete it in chunks, with progress"""
+    if db.session.get(ParkingLot, lot_id) is None:
+        click.echo(f'⚠️  No lot with id {lot_id}')
+        raise SystemExit(1)
+    occupied = close_lot(lot_id)
+    if occupied:
+        click.echo(f'⚠️  Lot {lot_id} has {occupied} occupied spots')
+        raise SystemExit(1)
+    spot_allocator.invalidate(lot_id)
+
+    def progress(stage, done, total):
+        click.echo(f'   {stage}: {done}/{total}')
+    archived, spots = remove_closed_lot(lot_id, chunk_size=chunk_size, progress=progress)
+    click.echo(f'✅ Deleted lot {lot_id}: {spots} spots, {archived} reservations archived')
+
+
+@click.command('archive-reservations')
+@with_appcontext
+@click.option('--days', type=int, help='Archive reservations released more than this many days ago '
+                                       '[default: ARCHIVE_AFTER_DAYS].')
+@click.option('--chunk-size', type=int, help='Rows per transaction [default: ARCHIVE_CHUNK_SIZE].')
+def archive_reservations_command(days, chunk_size):
+    """Move old completed reservations to reservation_archive in chunks, with progress"""
+    config = current_app.config
+    days = config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    before = datetime.utcnow() - timedelta(days=days)
+
+    def progress(done, total):
+        click.echo(f'   reservations: {done}/{total}')
+    archived = archive_completed(before, chunk_size or config['ARCHIVE_CHUNK_SIZE'], progress=progress)
+    click.echo(f'✅ Archived {archived} reservations released before {before:%Y-%m-%d}')
+
+
+def register_commands(app):
+    """Attach the maintenance commands to the app CLI"""
+    app.cli.add_command(upgrade_db_command)
+    app.cli.add_command(check_counters_command)
+    app.cli.add_command(rebuild_search_command)
+    app.cli.add_command(delete_lot_command)
+    app.cli.add_command(archive_reservations_command)
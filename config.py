@@ -4,4 +4,58 @@ class Config:
     SECRET_KEY = os.environ.get('qwertyuiopasdfghjkl') or 'vehicle-parking-app-secret-key-2024'
     SQLALCHEMY_DATABASE_URI = 'sqlite:///vehicle_parking.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLite connection profile: WAL, pragmas, pool sizes and read-only connections for reports
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', '1') == '1'
+    DB_JOURNAL_MODE = os.environ.get('DB_JOURNAL_MODE', 'WAL')
+    DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL')  # NORMAL is durable in WAL mode except on power loss
+    DB_CACHE_KIB = int(os.environ.get('DB_CACHE_KIB', 16384))  # page cache per connection
+    DB_MMAP_BYTES = int(os.environ.get('DB_MMAP_BYTES', 128 * 1024 * 1024))
+    DB_BUSY_TIMEOUT = float(os.environ.get('DB_BUSY_TIMEOUT', 10))  # seconds to wait for a lock
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_READ_POOL_SIZE = int(os.environ.get('DB_READ_POOL_SIZE', 4))
+    DB_POOL_OVERFLOW = int(os.environ.get('DB_POOL_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+    # bookings and releases through one writer thread per process, committed in groups
+    BOOKING_QUEUE = os.environ.get('BOOKING_QUEUE') == '1'
+    BOOKING_QUEUE_WAIT_MS = float(os.environ.get('BOOKING_QUEUE_WAIT_MS', 2))  # how long a group collects
+    BOOKING_QUEUE_BATCH = int(os.environ.get('BOOKING_QUEUE_BATCH', 64))
+    BOOKING_QUEUE_TIMEOUT = float(os.environ.get('BOOKING_QUEUE_TIMEOUT', 10))  # seconds a request waits for its result
+    BOOKING_QUEUE_IDLE_SECONDS = 30
+    # `flask archive-reservations` moves reservations released more than this many days ago to reservation_archive
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+    ARCHIVE_CHUNK_SIZE = int(os.environ.get('ARCHIVE_CHUNK_SIZE', 1000))  # reservations per transaction
     DEBUG = True
+    MAX_SPOTS_PER_LOT = int(os.environ.get('MAX_SPOTS_PER_LOT', 10000))
+    # lots with more spots + reservations than this are deleted in a background thread, not in the admin's request
+    LOT_DELETE_INLINE_ROWS = int(os.environ.get('LOT_DELETE_INLINE_ROWS', 5000))
+    # per-request SQL counts/timing, slow-query and N+1 logs, Server-Timing header
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION') == '1'
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10))
+    # admins can cProfile a request with the X-Profile header or ?_profile=1
+    PROFILING = os.environ.get('PROFILING') == '1'
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')  # default: instance/profiles
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 20))  # runs kept per route
+    PROFILE_HEADER = 'X-Profile'
+    # Prometheus metrics at /metrics, off unless METRICS=1; worker processes share them through files in METRICS_DIR
+    METRICS = os.environ.get('METRICS') == '1'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # when set, scrapes need "Authorization: Bearer <token>"
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 1))
+    METRICS_GAUGE_REFRESH = float(os.environ.get('METRICS_GAUGE_REFRESH', 300))  # seconds between lot re-reads
+    # lot listings of the user pages, cleared by every booking, release and lot change; 0 turns the cache off
+    LOT_CACHE_TTL = float(os.environ.get('LOT_CACHE_TTL', 30))
+    LOT_CACHE_SIZE = int(os.environ.get('LOT_CACHE_SIZE', 256))  # lists kept (full listing + searches)
+    # logged-in users, so a page view does not query its user; cleared by profile edits and deletions, 0 turns it off
+    USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 60))
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+    # Server-Sent Events stream of lot availability at /availability/stream
+    LIVE_UPDATES = os.environ.get('LIVE_UPDATES', '1') == '1'
+    LIVE_POLL_SECONDS = float(os.environ.get('LIVE_POLL_SECONDS', 2))  # picks up other worker processes' changes
+    LIVE_KEEPALIVE_SECONDS = 15
+    LIVE_MAX_SECONDS = float(os.environ.get('LIVE_MAX_SECONDS', 300))  # browsers reconnect after this
+    LIVE_RETRY_SECONDS = 3
+    LIVE_QUEUE_SIZE = 100  # events a slow stream may fall behind before it is resynced
+    # read-only JSON API at /api, for a logged-in session or `Authorization: Bearer <token>`
+    API_TOKENS = {token for token in os.environ.get('API_TOKENS', '').split(',') if token}
+    API_VERSION_TTL = float(os.environ.get('API_VERSION_TTL', 2))  # how long another worker's change can go unseen
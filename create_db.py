@@ -1,7 +1,16 @@
-from app import app
-from models import db, User, ParkingLot, ParkingSpot
+from app import app, create_app
+from models import db, User, ParkingLot, ParkingSpot, Reservation, IST
+from migrations import upgrade, add_missing_indexes
+from services.lot_builder import spot_number
+from services import search as search_index
+from werkzeug.security import generate_password_hash
+from datetime import datetime, timedelta
+import argparse
+import math
+import os
 import string
 import random
+import time
 
 def create_default_admin():
     """Create default admin user if not exists"""
@@ -17,9 +26,7 @@ def create_default_admin():
 
 def generate_spot_number(lot_id, spot_index):
     """Generate spot number like A1, A2, B1, B2, etc."""
-    section = chr(65 + (spot_index - 1) // 10)  # A, B, C, etc.
-    number = ((spot_index - 1) % 10) + 1
-    return f"{section}{number}"
+    return spot_number(spot_index)
 
 def seed_demo_data():
     """Seed demo parking lots and spots"""
@@ -60,7 +67,7 @@ def seed_demo_data():
     ]
     
     for lot_data in lots_data:
-        lot = ParkingLot(**lot_data)
+        lot = ParkingLot(**lot_data, available_spots=lot_data['maximum_number_of_spots'])
         db.session.add(lot)
         db.session.commit()
         
@@ -69,6 +76,8 @@ def seed_demo_data():
             spot_number = generate_spot_number(lot.id, i)
             spot = ParkingSpot(lot_id=lot.id, spot_number=spot_number, status='A')
             db.session.add(spot)
+        #upgrade() built the search index before there were lots
+        search_index.reindex_lot(lot.id)
         
         print(f"✅ Created {lot.prime_location_name} with {lot.maximum_number_of_spots} spots")
     
@@ -94,24 +103,229 @@ def create_demo_users():
     
     db.session.commit()
 
-def main():
+# Synthetic dataset for benchmarking at production volumes. Everything is
+# drawn from one random.Random(seed), so the same arguments give the same
+# database. Rows go in through executemany on the raw connection with the
+# reservation indexes dropped, and the indexes are rebuilt once at the end.
+
+# relative share of arrivals per hour of the day (morning and evening peaks)
+HOURLY_ARRIVALS = [1, 1, 1, 1, 1, 2, 4, 8, 12, 14, 12, 10, 10, 10, 9, 9, 10, 12, 14, 12, 8, 5, 3, 2]
+WEEKEND_FACTOR = 0.7
+# stay length is log-normal: median about 2h, long tail of all-day parkers
+DURATION_MEDIAN_HOURS = 2.0
+DURATION_SIGMA = 0.8
+MAX_DURATION_HOURS = 24.0
+PRICES = [10.0, 15.0, 20.0, 25.0, 30.0, 40.0, 50.0]
+AREAS = ['Central', 'Airport', 'Station', 'Market', 'Harbour', 'Tech Park', 'Stadium', 'Hospital',
+         'University', 'Old Town', 'Riverside', 'Mall', 'Lakeside', 'Civic Centre', 'Industrial']
+KINDS = ['Parking', 'Garage', 'Multi Level Parking', 'Parking Zone', 'Car Park']
+STATES = ['KA', 'MH', 'DL', 'TN', 'TS', 'KL', 'GJ', 'RJ', 'UP', 'WB']
+BATCH_SIZE = 50000
+
+def sqlite_datetime(value):
+    """A whole-second datetime in SQLAlchemy's sqlite storage format, without the slow strftime"""
+    return f'{value}.000000'
+
+def scaled_int(value):
+    """Parse counts like 500, 200k or 20M"""
+    value = value.strip().lower()
+    factor = {'k': 1000, 'm': 1000000}.get(value[-1:], 1)
+    return int(float(value[:-1] if factor > 1 else value) * factor)
+
+def vehicle_for(user_id):
+    """Registration number of a user's car, stable for a given user id"""
+    return f"{STATES[user_id % len(STATES)]}{user_id % 99 + 1:02d}{chr(65 + user_id % 26)}{chr(65 + user_id // 26 % 26)}{user_id % 10000:04d}"
+
+def cumulative(weights):
+    total = 0
+    result = []
+    for weight in weights:
+        total += weight
+        result.append(total)
+    return result
+
+def _insert(connection, sql, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        connection.exec_driver_sql(sql, rows[start:start + BATCH_SIZE])
+
+def generate_dataset(lots, spots_per_lot, users, reservations, seed=42, occupancy=0.6, days=365):
+    """Fill an empty database with a reproducible dataset of the given size.
+
+    Lots get a skewed popularity, arrivals follow HOURLY_ARRIVALS with
+    quieter weekends, stays are log-normal and reservations on the same spot
+    never overlap. `occupancy` of the spots end up with a car parked now.
+    """
+    if ParkingLot.query.first() or User.query.filter_by(is_admin=False).first():
+        print("⚠️  The generator needs an empty database (delete vehicle_parking.db first)")
+        return False
+    rng = random.Random(seed)
+    now = datetime.now(IST).replace(tzinfo=None, microsecond=0)
+    history_end = now - timedelta(hours=12)
+    #arrival offsets count from midnight so HOURLY_ARRIVALS lines up with the clock
+    history_start = (now - timedelta(days=days)).replace(hour=0, minute=0, second=0)
+    started = time.perf_counter()
+
+    connection = db.session.connection()
+    if db.engine.dialect.name == 'sqlite':
+        #generation is all or nothing, skip the per-batch fsyncs
+        connection.exec_driver_sql('PRAGMA synchronous = OFF')
+    indexes = sorted(Reservation.__table__.indexes, key=lambda index: index.name)
+    for index in indexes:
+        index.drop(bind=connection, checkfirst=True)
+
+    # users, all sharing the demo password
+    password_hash = generate_password_hash('password123')
+    user_rows = [(f'user{i}', password_hash, False,
+                  sqlite_datetime(history_start - timedelta(days=rng.randint(0, 365))))
+                 for i in range(1, users + 1)]
+    _insert(connection, 'INSERT INTO users (username, password_hash, is_admin, created_at) VALUES (?, ?, ?, ?)', user_rows)
+    user_ids = [user_id for (user_id,) in connection.exec_driver_sql(
+        'SELECT id FROM users WHERE is_admin = 0 ORDER BY id')]
+    del user_rows
+    # a few regulars park far more often than most users
+    user_cum = cumulative(1 / (rank + 1) ** 0.8 for rank in range(len(user_ids)))
+    plates = {user_id: vehicle_for(user_id) for user_id in user_ids}
+    print(f"✅ {len(user_ids)} users")
+
+    # lots and their spots
+    spots_per_level = 500 if spots_per_lot > 1000 else None
+    lot_rows = []
+    for i in range(1, lots + 1):
+        area = AREAS[i % len(AREAS)]
+        lot_rows.append((f'{area} {KINDS[i % len(KINDS)]} {i}', rng.choice(PRICES),
+                         f'{rng.randint(1, 999)} {area} Road, Sector {rng.randint(1, 60)}',
+                         f'{rng.randint(110001, 855999)}', spots_per_lot, spots_per_level, 0, 0,
+                         sqlite_datetime(history_start)))
+    _insert(connection, 'INSERT INTO parking_lots (prime_location_name, price_per_hour, address, pincode, '
+                        'maximum_number_of_spots, spots_per_level, available_spots, occupied_spots, created_at) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', lot_rows)
+    lot_prices = list(connection.exec_driver_sql('SELECT id, price_per_hour FROM parking_lots ORDER BY id'))
+    created = sqlite_datetime(history_start)
+    for lot_id, _ in lot_prices:
+        _insert(connection, 'INSERT INTO parking_spots (lot_id, spot_number, status, created_at) VALUES (?, ?, ?, ?)',
+                [(lot_id, spot_number(i, spots_per_level), 'A', created) for i in range(1, spots_per_lot + 1)])
+    print(f"✅ {lots} lots with {lots * spots_per_lot} spots")
+
+    # lot popularity is skewed, each lot's share is spread over its spots
+    popularity = [1 / (rank + 1) ** 0.7 for rank in range(lots)]
+    rng.shuffle(popularity)
+    total_popularity = sum(popularity)
+    day_weights = [WEEKEND_FACTOR if (history_start + timedelta(days=d)).weekday() >= 5 else 1.0 for d in range(days)]
+    day_cum = cumulative(day_weights)
+    hour_cum = cumulative(HOURLY_ARRIVALS)
+    mu = math.log(DURATION_MEDIAN_HOURS)
+    window = int((history_end - history_start).total_seconds())
+
+    # active reservations: distinct users, so each is parked once, and at
+    # most half of the users so there is always someone free to book
+    occupied_per_lot = min(int(spots_per_lot * occupancy), len(user_ids) // 2 // max(lots, 1))
+    parked_users = rng.sample(user_ids, occupied_per_lot * lots)
+
+    rows = []
+    written = 0
+    sql = ('INSERT INTO reservations (spot_id, user_id, parking_timestamp, leaving_timestamp, parking_cost_per_hour, '
+           'total_cost, created_at, vehicle_no, vehicle_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)')
+    for lot_index, (lot_id, price) in enumerate(lot_prices):
+        spot_ids = [spot_id for (spot_id,) in connection.exec_driver_sql(
+            'SELECT id FROM parking_spots WHERE lot_id = ? ORDER BY id', (lot_id,))]
+        lot_total = round(reservations * popularity[lot_index] / total_popularity)
+        per_spot, extra = divmod(lot_total, len(spot_ids))
+        extra_spots = set(rng.sample(range(len(spot_ids)), extra))
+        for position, spot_id in enumerate(spot_ids):
+            count = per_spot + (position in extra_spots)
+            if not count:
+                continue
+            days_drawn = rng.choices(range(days), cum_weights=day_cum, k=count)
+            hours_drawn = rng.choices(range(24), cum_weights=hour_cum, k=count)
+            arrivals = sorted(min((d * 24 + h) * 3600 + rng.randrange(3600), window)
+                              for d, h in zip(days_drawn, hours_drawn))
+            drivers = rng.choices(user_ids, cum_weights=user_cum, k=count)
+            free_from = 0
+            for i, arrival in enumerate(arrivals):
+                #a car arriving while the spot is taken waits for it to free up
+                arrival = max(arrival, free_from)
+                seconds = int(min(rng.lognormvariate(mu, DURATION_SIGMA), MAX_DURATION_HOURS) * 3600)
+                #and leaves before the next car arrives
+                next_arrival = arrivals[i + 1] if i + 1 < count else window
+                seconds = max(min(seconds, next_arrival - arrival), 60)
+                free_from = arrival + seconds + 1
+                start = history_start + timedelta(seconds=arrival)
+                start_text = sqlite_datetime(start)
+                vehicle_no = plates[drivers[i]]
+                rows.append((spot_id, drivers[i], start_text, sqlite_datetime(start + timedelta(seconds=seconds)),
+                             price, round(max(seconds / 3600, 0.5) * price, 2), start_text, vehicle_no, vehicle_no))
+            if len(rows) >= BATCH_SIZE:
+                _insert(connection, sql, rows)
+                written += len(rows)
+                rows = []
+        if (lot_index + 1) % max(lots // 10, 1) == 0:
+            print(f"   {lot_index + 1}/{lots} lots, {written + len(rows)} reservations")
+
+        # cars parked right now in the first spots of the lot
+        for position in range(occupied_per_lot):
+            user_id = parked_users[lot_index * occupied_per_lot + position]
+            start_text = sqlite_datetime(now - timedelta(minutes=rng.randint(5, 600)))
+            vehicle_no = plates[user_id]
+            rows.append((spot_ids[position], user_id, start_text, None, price, None, start_text,
+                         vehicle_no, vehicle_no))
+        connection.exec_driver_sql("UPDATE parking_spots SET status = 'O' WHERE lot_id = ? AND id <= ?",
+                                   (lot_id, spot_ids[occupied_per_lot - 1] if occupied_per_lot else 0))
+    _insert(connection, sql, rows)
+    written += len(rows)
+    connection.exec_driver_sql('UPDATE parking_lots SET occupied_spots = ?, available_spots = ?',
+                               (occupied_per_lot, spots_per_lot - occupied_per_lot))
+    db.session.commit()
+    print(f"✅ {written} reservations ({occupied_per_lot * lots} active)")
+
+    #rebuild what was dropped or bypassed during the load
+    add_missing_indexes()
+    search_index.rebuild()
+    print(f"✅ Indexes rebuilt, done in {time.perf_counter() - started:.0f}s")
+    return True
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Set up the database with demo data, or a generated dataset "
+                                                 "when --lots/--spots-per-lot/--users/--reservations are given.")
+    parser.add_argument('--database', help='sqlite file to create instead of the app database')
+    parser.add_argument('--lots', type=scaled_int)
+    parser.add_argument('--spots-per-lot', type=scaled_int)
+    parser.add_argument('--users', type=scaled_int)
+    parser.add_argument('--reservations', type=scaled_int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--occupancy', type=float, default=0.6, help='share of spots occupied now')
+    parser.add_argument('--days', type=int, default=365, help='days of reservation history')
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main function to set up the database"""
-    with app.app_context():
+    args = parse_args(argv)
+    generate = any(value is not None for value in (args.lots, args.spots_per_lot, args.users, args.reservations))
+    target = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.abspath(args.database)}'}) if args.database else app
+    with target.app_context():
         print("🚀 Setting up Vehicle Parking App Database...")
         print("=" * 50)
         
-        # Create all tables
-        db.create_all()
+        # Create all tables and upgrade older databases
+        applied = upgrade()
         print("✅ Database tables created")
+        for name in applied:
+            print(f"✅ Applied schema change {name}")
         
         # Create admin user
         create_default_admin()
         
-        # Create demo users
-        create_demo_users()
-        
-        # Seed demo data
-        seed_demo_data()
+        if generate:
+            # Generated dataset at the requested scale
+            if not generate_dataset(args.lots or 10, args.spots_per_lot or 100, args.users or 1000,
+                                    args.reservations or 100000, seed=args.seed, occupancy=args.occupancy,
+                                    days=args.days):
+                return
+        else:
+            # Create demo users
+            create_demo_users()
+            
+            # Seed demo data
+            seed_demo_data()
         
         print("\n" + "=" * 50)
         print("🎉 Database setup completed successfully!")
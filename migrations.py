@@ -0,0 +1,141 @@
+# migrations.py
+"""Bring an existing vehicle_parking.db up to date with models.py.
+
+db.create_all() only creates missing tables, so columns and indexes added to
+the models after a database was created are applied here. Every step is
+idempotent and `upgrade()` is safe to run on a fresh or an already upgraded
+database.
+"""
+
+import re
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+from models import db, normalize_vehicle_no
+from services.lot_stats import check_lot_counters
+from services.user_stats import check_user_counters
+from services.search import create_index, SEARCH_TABLE
+
+#(table, column, column DDL) added after the first release
+COLUMNS = [
+    ('parking_lots', 'available_spots', 'INTEGER NOT NULL DEFAULT 0'),
+    ('parking_lots', 'occupied_spots', 'INTEGER NOT NULL DEFAULT 0'),
+    ('parking_lots', 'spots_per_level', 'INTEGER'),
+    ('parking_lots', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+    ('reservations', 'vehicle_key', 'VARCHAR(20)'),
+    ('users', 'reservation_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('users', 'total_spent', 'FLOAT NOT NULL DEFAULT 0'),
+]
+
+#(table, reservation_archive column holding its ids) that need AUTOINCREMENT,
+#so SQLite never reuses the id of a deleted lot or archived reservation
+AUTOINCREMENT_TABLES = [
+    ('parking_lots', 'lot_id'),
+    ('reservations', 'id'),
+]
+
+BATCH_SIZE = 5000
+
+
+def add_missing_columns():
+    """ALTER TABLE ... ADD COLUMN for every column the database lacks"""
+    inspector = inspect(db.engine)
+    added = []
+    for table, column, ddl in COLUMNS:
+        existing = {col['name'] for col in inspector.get_columns(table)}
+        if column not in existing:
+            db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+            added.append(f'{table}.{column}')
+    db.session.commit()
+    return added
+
+
+def add_missing_indexes():
+    """CREATE INDEX for every index declared on the models but not in the database"""
+    inspector = inspect(db.engine)
+    added = []
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                index.create(bind=db.engine)
+                added.append(index.name)
+    return added
+
+
+def backfill_vehicle_keys():
+    """Fill reservations.vehicle_key from vehicle_no in batches.
+
+    Older data may have the same vehicle parked twice; only the earliest of
+    those active reservations keeps its key so the unique index can be built.
+    """
+    last_id = 0
+    parked = set()
+    while True:
+        rows = db.session.execute(
+            text('SELECT id, vehicle_no, leaving_timestamp IS NULL FROM reservations '
+                 'WHERE id > :last_id ORDER BY id LIMIT :limit'),
+            {'last_id': last_id, 'limit': BATCH_SIZE}
+        ).all()
+        if not rows:
+            break
+        updates = []
+        for reservation_id, vehicle_no, active in rows:
+            key = normalize_vehicle_no(vehicle_no)
+            if key and active:
+                if key in parked:
+                    key = None
+                else:
+                    parked.add(key)
+            updates.append({'id': reservation_id, 'key': key})
+        db.session.execute(text('UPDATE reservations SET vehicle_key = :key WHERE id = :id'), updates)
+        db.session.commit()
+        last_id = rows[-1][0]
+
+
+def add_autoincrement():
+    """Rebuild tables created without AUTOINCREMENT; new ids start above every live and archived one.
+
+    Follows SQLite's copy / drop / rename procedure; the indexes are
+    recreated by add_missing_indexes afterwards.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return []
+    rebuilt = []
+    for name, archived in AUTOINCREMENT_TABLES:
+        schema = db.session.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                    {'name': name}).scalar()
+        if 'AUTOINCREMENT' in schema.upper():
+            continue
+        table = db.metadata.tables[name]
+        columns = ', '.join(column.name for column in table.columns)
+        ddl = str(CreateTable(table).compile(dialect=db.engine.dialect))
+        db.session.execute(text(re.sub(rf'CREATE TABLE {name}\b', f'CREATE TABLE {name}_rebuilt', ddl, count=1)))
+        db.session.execute(text(f'INSERT INTO {name}_rebuilt ({columns}) SELECT {columns} FROM {name}'))
+        db.session.execute(text(f'DROP TABLE {name}'))
+        db.session.execute(text(f'ALTER TABLE {name}_rebuilt RENAME TO {name}'))
+        db.session.execute(text('DELETE FROM sqlite_sequence WHERE name = :name'), {'name': name})
+        db.session.execute(text(f'INSERT INTO sqlite_sequence (name, seq) SELECT :name, max('
+                                f'coalesce((SELECT max(id) FROM {name}), 0), '
+                                f'coalesce((SELECT max({archived}) FROM reservation_archive), 0))'), {'name': name})
+        db.session.commit()
+        rebuilt.append(f'{name} AUTOINCREMENT')
+    return rebuilt
+
+
+def upgrade():
+    """Create missing tables, columns and indexes, then backfill derived data"""
+    db.create_all()
+    applied = add_missing_columns()
+    if any(name.startswith('parking_lots.') for name in applied):
+        #new counter columns start at 0, fill them from parking_spots
+        check_lot_counters(repair=True)
+    if 'reservations.vehicle_key' in applied:
+        backfill_vehicle_keys()
+    if any(name.startswith('users.') for name in applied):
+        #new counter columns start at 0, fill them from the reservations
+        check_user_counters(repair=True)
+    applied += add_autoincrement()
+    applied += add_missing_indexes()
+    if create_index():
+        applied.append(SEARCH_TABLE)
+    return applied
@@ -2,13 +2,24 @@
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import text
+from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from collections import namedtuple
 from pytz import timezone
+import re
 IST = timezone('Asia/Kolkata')
 
 db = SQLAlchemy()
 
+
+def normalize_vehicle_no(vehicle_no):
+    """Canonical plate for lookups: 'ka-01 ab 1234' -> 'KA01AB1234'"""
+    if not vehicle_no:
+        return None
+    return re.sub(r'[^A-Z0-9]', '', vehicle_no.upper()) or None
+
 # ======================
 # User Models
 # ======================
@@ -16,6 +27,11 @@ db = SQLAlchemy()
 class User(UserMixin, db.Model):
     """User model for regular users and admin"""
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_is_admin_created_at', 'is_admin', 'created_at'),
+        db.Index('ix_users_is_admin_reservation_count', 'is_admin', 'reservation_count'),
+        db.Index('ix_users_is_admin_total_spent', 'is_admin', 'total_spent'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -23,8 +39,15 @@ class User(UserMixin, db.Model):
     is_admin = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Reservations made and money spent, archive included, kept in step by the
+    # booking service in the same transaction (see `flask check-counters`)
+    reservation_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_spent = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+
     # Relationships
     reservations = db.relationship('Reservation', backref='user', lazy=True, cascade='all, delete-orphan')
+    archived_reservations = db.relationship('ReservationArchive', backref='user', lazy=True,
+                                            cascade='all, delete-orphan')
 
     def set_password(self, password):
         """Hash and set password"""
@@ -45,6 +68,8 @@ class User(UserMixin, db.Model):
 class ParkingLot(db.Model):
     """Parking lot model"""
     __tablename__ = 'parking_lots'
+    # ids live on in reservation_archive, a deleted lot's id must not be handed out again
+    __table_args__ = {'sqlite_autoincrement': True}
     
     id = db.Column(db.Integer, primary_key=True)
     prime_location_name = db.Column(db.String(120), nullable=False, unique=True)
@@ -52,25 +77,33 @@ class ParkingLot(db.Model):
     address = db.Column(db.String(200), nullable=False)
     pincode = db.Column(db.String(10), nullable=False)
     maximum_number_of_spots = db.Column(db.Integer, nullable=False)
+    spots_per_level = db.Column(db.Integer)  # None = single level lot
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Denormalized spot counters, kept in step with spot status by the
+    # booking service in the same transaction (see `flask check-counters`)
+    available_spots = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    occupied_spots = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped by every change to the lot or its spots, the API's ETags come from it
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
     # Relationships
     spots = db.relationship('ParkingSpot', backref='lot', lazy=True, cascade='all, delete-orphan')
 
     def get_available_spots_count(self):
         """Get count of available spots"""
-        return ParkingSpot.query.filter_by(lot_id=self.id, status='A').count()
+        return self.available_spots or 0
     
     def get_occupied_spots_count(self):
         """Get count of occupied spots"""
-        return ParkingSpot.query.filter_by(lot_id=self.id, status='O').count()
+        return self.occupied_spots or 0
     
     def get_occupancy_percentage(self):
         """Get occupancy percentage"""
-        total = len(self.spots)
+        occupied = self.get_occupied_spots_count()
+        total = self.get_available_spots_count() + occupied
         if total == 0:
             return 0
-        occupied = self.get_occupied_spots_count()
         return round((occupied / total) * 100, 1)
 
     def __repr__(self):
@@ -80,10 +113,13 @@ class ParkingLot(db.Model):
 class ParkingSpot(db.Model):
     """Parking spot model"""
     __tablename__ = 'parking_spots'
+    __table_args__ = (
+        db.Index('ix_parking_spots_lot_id_status', 'lot_id', 'status'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     lot_id = db.Column(db.Integer, db.ForeignKey('parking_lots.id'), nullable=False)
-    status = db.Column(db.String(1), nullable=False, default='A')  # A = Available, O = Occupied
+    status = db.Column(db.String(1), nullable=False, default='A')  # A = Available, O = Occupied, R = Retired by a resize
     spot_number = db.Column(db.String(10), nullable=False)  # e.g., "A1", "B2"
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -109,6 +145,18 @@ class ParkingSpot(db.Model):
 class Reservation(db.Model):
     """Reservation model for parking spot bookings"""
     __tablename__ = 'reservations'
+    __table_args__ = (
+        db.Index('ix_reservations_spot_id_leaving_timestamp', 'spot_id', 'leaving_timestamp'),
+        db.Index('ix_reservations_user_id_leaving_timestamp', 'user_id', 'leaving_timestamp'),
+        db.Index('ix_reservations_leaving_timestamp', 'leaving_timestamp'),
+        db.Index('ix_reservations_created_at', 'created_at'),
+        # a vehicle can only be parked in one spot at a time
+        db.Index('ux_reservations_active_vehicle_key', 'vehicle_key', unique=True,
+                 sqlite_where=text('leaving_timestamp IS NULL'),
+                 postgresql_where=text('leaving_timestamp IS NULL')),
+        # archived reservations keep their id, it must not be handed out again
+        {'sqlite_autoincrement': True},
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     spot_id = db.Column(db.Integer, db.ForeignKey('parking_spots.id'), nullable=False)
@@ -119,6 +167,12 @@ class Reservation(db.Model):
     total_cost = db.Column(db.Float)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     vehicle_no = db.Column(db.String(20))
+    vehicle_key = db.Column(db.String(20))  # normalized vehicle_no, set automatically
+
+    @validates('vehicle_no')
+    def _set_vehicle_key(self, key, vehicle_no):
+        self.vehicle_key = normalize_vehicle_no(vehicle_no)
+        return vehicle_no
 
     def is_active(self):
         """Check if reservation is active (not completed)"""
@@ -145,6 +199,16 @@ class Reservation(db.Model):
             return round(duration_hours * self.parking_cost_per_hour, 2)
         return 0
     
+    def calculate_cost_at(self, end):
+        """Cost if the reservation ended at `end` (live estimate for active ones)"""
+        start = self.parking_timestamp
+        if start.tzinfo is None:
+            start = IST.localize(start)
+        if end.tzinfo is None:
+            end = IST.localize(end)
+        duration_hours = max((end - start).total_seconds() / 3600, 0.5)  # Minimum 30 minutes
+        return round(duration_hours * self.parking_cost_per_hour, 2)
+
     def get_formatted_duration(self):
         """Get formatted duration string"""
         if self.leaving_timestamp:
@@ -161,3 +225,51 @@ class Reservation(db.Model):
         return (f"<Reservation(id={self.id}, user_id={self.user_id}, spot_id={self.spot_id}, "
                 f"parking_timestamp={self.parking_timestamp}, leaving_timestamp={self.leaving_timestamp}, "
                 f"total_cost={self.total_cost})>")
+
+
+ArchivedSpot = namedtuple('ArchivedSpot', 'spot_number lot')
+ArchivedLot = namedtuple('ArchivedLot', 'prime_location_name address')
+
+
+class ReservationArchive(db.Model):
+    """Completed reservation moved out of the live table.
+
+    Keeps its original id and a copy of the spot number and lot name, so it
+    stays readable after the spot or lot is gone.
+    """
+    __tablename__ = 'reservation_archive'
+    __table_args__ = (
+        db.Index('ix_reservation_archive_user_id_leaving_timestamp', 'user_id', 'leaving_timestamp'),
+        db.Index('ix_reservation_archive_lot_id', 'lot_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    spot_id = db.Column(db.Integer, nullable=False)
+    lot_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    spot_number = db.Column(db.String(10), nullable=False)
+    lot_name = db.Column(db.String(120), nullable=False)
+    parking_timestamp = db.Column(db.DateTime, nullable=False)
+    leaving_timestamp = db.Column(db.DateTime)
+    parking_cost_per_hour = db.Column(db.Float, nullable=False)
+    total_cost = db.Column(db.Float)
+    created_at = db.Column(db.DateTime)
+    vehicle_no = db.Column(db.String(20))
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # the lot may be gone, it only supplies the address while it exists
+    lot = db.relationship('ParkingLot', primaryjoin='foreign(ReservationArchive.lot_id) == ParkingLot.id',
+                          viewonly=True)
+
+    # read like a live reservation on the history pages
+    is_active = Reservation.is_active
+    get_formatted_duration = Reservation.get_formatted_duration
+
+    @property
+    def spot(self):
+        """Stand-in for the spot: its number and the lot under its archived name"""
+        return ArchivedSpot(self.spot_number, ArchivedLot(self.lot_name, self.lot.address if self.lot else ''))
+
+    def __repr__(self):
+        return (f"<ReservationArchive(id={self.id}, user_id={self.user_id}, lot_name='{self.lot_name}', "
+                f"spot_number='{self.spot_number}', total_cost={self.total_cost})>")
@@ -1,10 +1,21 @@
 # routes/admin.py
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
+from flask import (Blueprint, render_template, redirect, url_for, flash, request, abort, jsonify, current_app,
+                   send_from_directory)
 from flask_login import login_user, logout_user, login_required, current_user
-from models import db, User, ParkingLot, ParkingSpot, Reservation
-from datetime import datetime
+from models import db, User, ParkingLot, ParkingSpot, IST
+from datetime import datetime, timedelta
 import re
+from services.allocator import spot_allocator
+from services.reports import (spot_totals, active_reservation_count, recent_reservations, lot_report,
+                             reservation_totals, user_listing, USER_SORTS, lot_spot_grid)
+from services import search as search_index
+from services.vehicles import find_parked_vehicle
+from services.lot_builder import insert_spots, resize_lot
+from services.lot_removal import close_lot, remove_closed_lot, lot_size, lot_removals
+from services.profiler import request_profiler
+from services.lot_stats import stage_lot_counts, announce_lot
+from services.engine_profile import read_only
 
 admin_bp = Blueprint('admin', __name__, template_folder='../templates')
 
@@ -27,25 +38,18 @@ def dashboard():
         flash('Access denied.', 'danger')
         return redirect(url_for('user.dashboard'))
     
-    #fetch records from sql database
+    #lots carry their own spot counters, so the totals need no extra query
     lots = ParkingLot.query.all()
-    spots = ParkingSpot.query.all()
-    reservations = Reservation.query.all()
-
-     #computing stats
-    total = len(spots)
-    available = len([s for s in spots if s.status == 'A'])
-    occupied = len([s for s in spots if s.status == 'O'])
-    active_reservations = len([r for r in reservations if r.leaving_timestamp is None])
+    total, available, occupied = spot_totals(lots)
+    active_reservations = active_reservation_count()
 
     #chart using lot name and occupancy
     lot_names = [lot.prime_location_name for lot in lots]
     lot_occupancy = [lot.get_occupancy_percentage() for lot in lots]
 
-    #present last 7 actions as recent activity
-    recent_reservations = Reservation.query.order_by(Reservation.created_at.desc()).limit(7).all()
+    #present last 7 actions as recent activity, user/spot/lot come eager-loaded
     recent_activity = []
-    for res in recent_reservations:
+    for res in recent_reservations(7):
         user = res.user.username if res.user else 'Unknown User'
         lot = res.spot.lot.prime_location_name if res.spot and res.spot.lot else 'Unknown Lot'
         
@@ -71,7 +75,8 @@ def dashboard():
         active_reservations=active_reservations,
         lot_names=lot_names,
         lot_occupancy=lot_occupancy,
-        recent_activity=recent_activity
+        recent_activity=recent_activity,
+        removals=lot_removals.progress()
     )
 
 
@@ -94,6 +99,8 @@ def create_lot():
         pincode = request.form.get('pincode', '').strip()
         price_per_hour = request.form.get('price_per_hour', '')
         maximum_number_of_spots = request.form.get('maximum_number_of_spots', '')
+        spots_per_level = request.form.get('spots_per_level', '').strip()
+        max_spots = current_app.config['MAX_SPOTS_PER_LOT']
         
         # validating string with their lengths and integers with values as well as length
         errors = []
@@ -116,21 +123,29 @@ def create_lot():
         
         try:
             maximum_number_of_spots = int(maximum_number_of_spots)
-            if maximum_number_of_spots <= 0 or maximum_number_of_spots > 100:
-                errors.append('Maximum spots must be between 1 and 100.')
+            if maximum_number_of_spots <= 0 or maximum_number_of_spots > max_spots:
+                errors.append(f'Maximum spots must be between 1 and {max_spots}.')
         except (ValueError, TypeError):
             errors.append('Invalid maximum spots value.')
         
+        #optional, splits the spots into levels numbered L1-A1, L2-A1, ...
+        try:
+            spots_per_level = int(spots_per_level) if spots_per_level else None
+            if spots_per_level is not None and spots_per_level <= 0:
+                errors.append('Spots per level must be greater than 0.')
+        except ValueError:
+            errors.append('Invalid spots per level value.')
+        
         #flashing errors on the screen
         if errors:
             for error in errors:
                 flash(error, 'danger')
-            return render_template('admin/create_lot.html')
+            return render_template('admin/create_lot.html', max_spots=max_spots)
         
         #check if the location already exists
         if ParkingLot.query.filter_by(prime_location_name=prime_location_name).first():
             flash('A parking lot with this location name already exists.', 'danger')
-            return render_template('admin/create_lot.html')
+            return render_template('admin/create_lot.html', max_spots=max_spots)
         
         #all things are checked and verified and create parking lot
         try:
@@ -139,18 +154,20 @@ def create_lot():
                 address=address,
                 pincode=pincode,
                 price_per_hour=price_per_hour,
-                maximum_number_of_spots=maximum_number_of_spots
+                maximum_number_of_spots=maximum_number_of_spots,
+                spots_per_level=spots_per_level,
+                available_spots=maximum_number_of_spots,
+                occupied_spots=0
             )
             db.session.add(lot)
-            db.session.commit()
+            db.session.flush()
             
-            # generating spots
-            from create_db import generate_spot_number
-            for i in range(1, maximum_number_of_spots + 1):
-                spot_number = generate_spot_number(lot.id, i)
-                spot = ParkingSpot(lot_id=lot.id, spot_number=spot_number, status='A')
-                db.session.add(spot)
+            #generating spots, lot and spots go in one transaction
+            insert_spots(lot.id, 1, maximum_number_of_spots, spots_per_level)
+            search_index.reindex_lot(lot.id)
+            stage_lot_counts(lot.id, prime_location_name, maximum_number_of_spots, 0)
             db.session.commit()
+            spot_allocator.invalidate(lot.id)
             
             #this part is hence completed and is required to give a message that the lot has been created
             flash(f'Parking lot "{prime_location_name}" created successfully with {maximum_number_of_spots} spots.', 'success')
@@ -159,9 +176,9 @@ def create_lot():
         except Exception as e:
             db.session.rollback()
             flash('Error creating parking lot. Please try again.', 'danger')
-            return render_template('admin/create_lot.html')
+            return render_template('admin/create_lot.html', max_spots=max_spots)
 
-    return render_template('admin/create_lot.html')
+    return render_template('admin/create_lot.html', max_spots=current_app.config['MAX_SPOTS_PER_LOT'])
 
 
 #edit parking slots
@@ -182,6 +199,8 @@ def edit_lot(lot_id):
         address = request.form.get('address', '').strip()
         pincode = request.form.get('pincode', '').strip()
         price_per_hour = request.form.get('price_per_hour', '')
+        maximum_number_of_spots = request.form.get('maximum_number_of_spots', lot.maximum_number_of_spots)
+        max_spots = current_app.config['MAX_SPOTS_PER_LOT']
         
         # validating form data
         errors = []
@@ -202,17 +221,27 @@ def edit_lot(lot_id):
         except (ValueError, TypeError):
             errors.append('Invalid price per hour.')
         
+        #resizing can retire free spots only, never below the occupied ones
+        try:
+            maximum_number_of_spots = int(maximum_number_of_spots)
+            if maximum_number_of_spots <= 0 or maximum_number_of_spots > max_spots:
+                errors.append(f'Maximum spots must be between 1 and {max_spots}.')
+            elif maximum_number_of_spots < lot.get_occupied_spots_count():
+                errors.append(f'Cannot shrink below the {lot.get_occupied_spots_count()} occupied spots.')
+        except (ValueError, TypeError):
+            errors.append('Invalid maximum spots value.')
+        
         #pop the errors
         if errors:
             for error in errors:
                 flash(error, 'danger')
-            return render_template('admin/edit_lot.html', lot=lot)
+            return render_template('admin/edit_lot.html', lot=lot, max_spots=max_spots)
         
         #check if location already exists except current one
         existing_lot = ParkingLot.query.filter_by(prime_location_name=prime_location_name).first()
         if existing_lot and existing_lot.id != lot.id:
             flash('A parking lot with this location name already exists.', 'danger')
-            return render_template('admin/edit_lot.html', lot=lot)
+            return render_template('admin/edit_lot.html', lot=lot, max_spots=max_spots)
         
         #now update the lot
         try:
@@ -220,18 +249,28 @@ def edit_lot(lot_id):
             lot.address = address
             lot.pincode = pincode
             lot.price_per_hour = price_per_hour
+            lot.version = ParkingLot.version + 1
+            requested = maximum_number_of_spots - lot.maximum_number_of_spots
+            change = resize_lot(lot, maximum_number_of_spots)
+            search_index.reindex_lot(lot.id)
             db.session.commit()
+            if change:
+                spot_allocator.invalidate(lot.id)
+            announce_lot(lot.id)
             
             flash(f'Parking lot "{prime_location_name}" updated successfully.', 'success')
+            if change != requested:
+                #spots booked while resizing are left in place
+                flash(f'Only {abs(change)} free spots could be retired.', 'warning')
             return redirect(url_for('admin.dashboard'))
         
         #if lot not updated
         except Exception as e:
             db.session.rollback()
             flash('Error updating parking lot. Please try again.', 'danger')
-            return render_template('admin/edit_lot.html', lot=lot)
+            return render_template('admin/edit_lot.html', lot=lot, max_spots=max_spots)
 
-    return render_template('admin/edit_lot.html', lot=lot)
+    return render_template('admin/edit_lot.html', lot=lot, max_spots=current_app.config['MAX_SPOTS_PER_LOT'])
 
 
 #delete lot
@@ -245,23 +284,38 @@ def delete_lot(lot_id):
 
     #initialise for lot_id
     lot = ParkingLot.query.get_or_404(lot_id)
+    lot_name = lot.prime_location_name
+    if lot_removals.running(lot_id):
+        flash(f'Parking lot "{lot_name}" is already being deleted.', 'info')
+        return redirect(url_for('admin.dashboard'))
     
-    # check if spots are occupied
-    occupied_spots = ParkingSpot.query.filter_by(lot_id=lot.id, status='O').count()
+    # close the lot to new bookings, refused while spots are occupied
+    occupied_spots = close_lot(lot.id)
     if occupied_spots > 0:
-        flash(f'Cannot delete lot "{lot.prime_location_name}" - {occupied_spots} spots are currently occupied.', 'danger')
+        flash(f'Cannot delete lot "{lot_name}" - {occupied_spots} spots are currently occupied.', 'danger')
         return redirect(url_for('admin.dashboard'))
-    
+    spot_allocator.invalidate(lot.id)
+
+    #large lots would outlast the worker timeout, they are finished in the background
+    if lot_size(lot_id) > current_app.config['LOT_DELETE_INLINE_ROWS']:
+        if lot_removals.start(lot_id, lot_name):
+            flash(f'Parking lot "{lot_name}" is closed and is being deleted in the background; the dashboard shows '
+                  f'the progress. If it stops, delete it again or run "flask --app app delete-lot {lot_id}".', 'info')
+        else:
+            flash(f'Parking lot "{lot_name}" is already being deleted.', 'info')
+        return redirect(url_for('admin.dashboard'))
+
     try:
-        #now delete all spots
-        ParkingSpot.query.filter_by(lot_id=lot.id).delete()
-        db.session.delete(lot)
-        db.session.commit()
+        #history goes to the archive, then spots and lot are deleted in short transactions
+        def progress(stage, done, total):
+            current_app.logger.info('deleting lot %s: %s %d/%d', lot_id, stage, done, total)
+        archived, _ = remove_closed_lot(lot_id, progress=progress)
         
-        flash(f'Parking lot "{lot.prime_location_name}" deleted successfully.', 'success')
+        flash(f'Parking lot "{lot_name}" deleted successfully. {archived} reservations archived.', 'success')
         
     except Exception as e:
         db.session.rollback()
+        #the lot stays closed, deleting again picks up where this stopped
         flash('Error deleting parking lot. Please try again.', 'danger')
     
     return redirect(url_for('admin.dashboard'))
@@ -272,37 +326,43 @@ def delete_lot(lot_id):
 #viewing user and their reservation
 @admin_bp.route('/users')
 @login_required
+@read_only
 def view_users():
     #check for admin
     if not current_user.is_admin:
         flash('Access denied. Admin privileges required.', 'danger')
         return redirect(url_for('user.dashboard'))
 
-    #all users (not admin)
-    users = User.query.filter_by(is_admin=False).order_by(User.created_at.desc()).all()
-    
-    # calculating stats
-    total_reservations = sum(len(user.reservations) for user in users)
-    active_users = len([user for user in users if user.reservations])
-    total_revenue = sum(
-        sum(res.total_cost for res in user.reservations if res.total_cost)
-        for user in users
-    )
-    
-    # get all the reservation sorted by date
-    all_reservations = []
-    for user in users:
-        all_reservations.extend(user.reservations)
-    
+    #listing options from the query string
+    sort = request.args.get('sort', 'newest')
+    if sort not in USER_SORTS:
+        sort = 'newest'
+    search = request.args.get('q', '').strip()
+    active_only = request.args.get('active') == '1'
+    after = request.args.get('after', type=int)
+
+    #one page of users, their stats are grouped in SQL
+    users, next_after = user_listing(sort=sort, search=search, active_only=active_only, after=after)
+    user_count = User.query.filter_by(is_admin=False).count()
+
+    # calculating stats over all reservations
+    total_reservations, active_users, total_revenue = reservation_totals()
+
     # now get only the recent 5 only for presenting
-    recent_reservations = sorted(all_reservations, key=lambda x: x.created_at, reverse=True)[:5]
+    recent = recent_reservations(5)
     
     return render_template('admin/users.html', 
                          users=users,
+                         user_count=user_count,
+                         sort=sort,
+                         search=search,
+                         active_only=active_only,
+                         after=after,
+                         next_after=next_after,
                          total_reservations=total_reservations,
                          active_users=active_users,
                          total_revenue=total_revenue,
-                         recent_reservations=recent_reservations)
+                         recent_reservations=recent)
 
 
 #viewing spots of a lot
@@ -315,24 +375,21 @@ def view_spots(lot_id):
         return redirect(url_for('user.dashboard'))
 
     lot = ParkingLot.query.get_or_404(lot_id)
-    spots = ParkingSpot.query.filter_by(lot_id=lot.id).order_by(ParkingSpot.spot_number).all()
+    #spots joined to their active reservation and user in a single query
+    spots, occupied_spots = lot_spot_grid(lot.id)
     
-    # current reservation of occupied spots
-    occupied_spots = {}
-    for spot in spots:
-        if spot.status == 'O':
-            #query conditions
-            active_reservation = Reservation.query.filter_by(
-                spot_id=spot.id, 
-                leaving_timestamp=None
-            ).first()
-            if active_reservation:
-                occupied_spots[spot.id] = active_reservation
+    #counts come from the same rows
+    available = len([spot for spot in spots if spot.status == 'A'])
+    occupied = len([spot for spot in spots if spot.status == 'O'])
+    occupancy = round(occupied / len(spots) * 100, 1) if spots else 0
     
     return render_template('admin/lot_spots.html', 
                          lot=lot, 
                          spots=spots,
-                         occupied_spots=occupied_spots)
+                         occupied_spots=occupied_spots,
+                         available=available,
+                         occupied=occupied,
+                         occupancy=occupancy)
 
 
 
@@ -345,31 +402,99 @@ def search_spots():
         flash('Access denied. Admin privileges required.', 'danger')
         return redirect(url_for('user.dashboard'))
 
-    #seaching according to filters given
+    #seaching according to filters given, the form posts and page links use GET
+    search_term = request.values.get('search_term', '').strip()
+    search_type = request.values.get('search_type', 'all')
+    page = max(request.values.get('page', 1, type=int), 1)
+    per_page = 50
     search_results = []
-    if request.method == 'POST':
-        search_term = request.form.get('search_term', '').strip()
-        search_type = request.form.get('search_type', 'spot_number')
-        
-        if search_term:
-            if search_type == 'spot_number':
-                spots = ParkingSpot.query.filter(ParkingSpot.spot_number.contains(search_term)).all()
-            elif search_type == 'lot_name':
-                lots = ParkingLot.query.filter(ParkingLot.prime_location_name.contains(search_term)).all()
-                spots = []
-                for lot in lots:
-                    spots.extend(lot.spots)
-            else:  #status
-                status = 'O' if search_term.lower() in ['occupied', 'o'] else 'A'
-                spots = ParkingSpot.query.filter_by(status=status).all()
-            
-            #spots stored in search_results
-            search_results = spots
+    active_reservations = {}
+    total = 0
+
+    if search_term:
+        if search_type == 'status':
+            status = 'O' if search_term.lower() in ['occupied', 'o'] else 'A'
+            query = db.session.query(ParkingSpot.id).filter_by(status=status)
+            spot_ids = [spot_id for (spot_id,) in query.order_by(ParkingSpot.id).offset((page - 1) * per_page).limit(per_page)]
+            total = query.count()
+        else:
+            #full-text match over lot, spot, user and vehicle
+            spot_ids, total = search_index.search_spot_ids(search_term, search_type, page, per_page)
+        #spots stored in search_results with lot and active reservation preloaded
+        search_results, active_reservations = search_index.load_spots(spot_ids)
     
-    return render_template('admin/search.html', search_results=search_results)
+    return render_template('admin/search.html',
+                           search_results=search_results,
+                           active_reservations=active_reservations,
+                           search_term=search_term,
+                           search_type=search_type,
+                           page=page,
+                           total=total,
+                           has_next=page * per_page < total)
+
+
+
+
+#gate lookup: where is this vehicle parked right now
+@admin_bp.route('/vehicles/<vehicle_no>')
+@login_required
+def vehicle_lookup(vehicle_no):
+    #json endpoint so errors are json too
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required.'}), 403
+
+    reservation = find_parked_vehicle(vehicle_no)
+    if reservation is None:
+        return jsonify({'error': f'Vehicle {vehicle_no} is not parked right now.'}), 404
+
+    #timestamps are stored as IST wall time
+    now_ist = datetime.now(IST)
+    parked_at = reservation.parking_timestamp
+    if parked_at.tzinfo is None:
+        parked_at = IST.localize(parked_at)
+    return jsonify({
+        'reservation_id': reservation.id,
+        'vehicle_no': reservation.vehicle_no,
+        'lot': {
+            'id': reservation.spot.lot.id,
+            'name': reservation.spot.lot.prime_location_name,
+            'address': reservation.spot.lot.address,
+        },
+        'spot': {'id': reservation.spot.id, 'number': reservation.spot.spot_number},
+        'user': {'id': reservation.user.id, 'username': reservation.user.username},
+        'parked_at': parked_at.isoformat(),
+        'elapsed_minutes': int((now_ist - parked_at).total_seconds() // 60),
+        'cost_so_far': reservation.calculate_cost_at(now_ist),
+    })
+
+
+#slowest profiled requests, only when PROFILING is on
+@admin_bp.route('/profiles')
+@login_required
+def profiles():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('user.dashboard'))
+    if 'request_profiler' not in current_app.extensions:
+        abort(404)
 
+    return render_template('admin/profiles.html',
+                           profiles=request_profiler.profiles(),
+                           header=current_app.config['PROFILE_HEADER'],
+                           keep=current_app.config['PROFILE_KEEP'])
 
 
+#downloading a saved .prof or .collapsed file
+@admin_bp.route('/profiles/<route>/<filename>')
+@login_required
+def download_profile(route, filename):
+    if not current_user.is_admin or 'request_profiler' not in current_app.extensions:
+        abort(404)
+    if not filename.endswith(('.prof', '.collapsed')):
+        abort(404)
+    #send_from_directory refuses paths that leave PROFILE_DIR
+    return send_from_directory(current_app.config['PROFILE_DIR'], f'{route}/{filename}', as_attachment=True)
+
 
 #admin logout
 @admin_bp.route('/logout')
@@ -384,28 +509,43 @@ def logout():
 #summary(the stats required by the admin)
 @admin_bp.route('/summary')
 @login_required
+@read_only
 def summary():
     if not current_user.is_admin:
         flash('Access denied.', 'danger')
         return redirect(url_for('user.dashboard'))
-    lots = ParkingLot.query.all()
-    #revenue generated per lot
-    lot_names = []
-    lot_revenues = []
-    available_counts = []
-    occupied_counts = []
-    for lot in lots:
-        lot_names.append(lot.prime_location_name)
-        #sum total_cost for all the spots in the lots
-        reservations = Reservation.query.join(ParkingSpot).filter(ParkingSpot.lot_id == lot.id, Reservation.leaving_timestamp != None).all()
-        revenue = sum(res.total_cost or 0 for res in reservations)
-        lot_revenues.append(revenue)
-
-        #availability count
-        available_counts.append(lot.get_available_spots_count())
-        occupied_counts.append(lot.get_occupied_spots_count())
+
+    #optional filters: release date range (inclusive, YYYY-MM-DD) and lots
+    start_str = request.args.get('start', '').strip()
+    end_str = request.args.get('end', '').strip()
+    lot_ids = request.args.getlist('lot_id', type=int)
+    start = end = None
+    try:
+        if start_str:
+            start = datetime.strptime(start_str, '%Y-%m-%d')
+        if end_str:
+            end = datetime.strptime(end_str, '%Y-%m-%d') + timedelta(days=1)
+    except ValueError:
+        flash('Invalid date, use the YYYY-MM-DD format.', 'danger')
+        start = end = None
+        start_str = end_str = ''
+
+    #revenue and availability of every lot in one grouped query
+    rows = lot_report(start=start, end=end, lot_ids=lot_ids)
+    lot_names = [row[1] for row in rows]
+    lot_revenues = [round(row[2], 2) for row in rows]
+    available_counts = [row[3] for row in rows]
+    occupied_counts = [row[4] for row in rows]
+
+    #lot choices for the filter form
+    all_lots = db.session.query(ParkingLot.id, ParkingLot.prime_location_name).order_by(ParkingLot.id).all()
     return render_template('admin/summary.html',
                            lot_names=lot_names,
                            lot_revenues=lot_revenues,
                            available_counts=available_counts,
-                           occupied_counts=occupied_counts)
+                           occupied_counts=occupied_counts,
+                           total_revenue=sum(lot_revenues),
+                           all_lots=all_lots,
+                           selected_lot_ids=lot_ids,
+                           start=start_str,
+                           end=end_str)
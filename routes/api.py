@@ -0,0 +1,102 @@
+# routes/api.py
+
+from flask import Blueprint, jsonify, request, current_app
+from models import db, ParkingLot, ParkingSpot
+from services.access import login_or_token_error
+from services.lot_versions import lot_versions, lot_etag, listing_etag
+
+api_bp = Blueprint('api', __name__)
+
+LOT_COLUMNS = (ParkingLot.id, ParkingLot.prime_location_name, ParkingLot.address, ParkingLot.pincode,
+               ParkingLot.price_per_hour, ParkingLot.available_spots, ParkingLot.occupied_spots,
+               ParkingLot.version)
+SPOT_STATUS = {'A': 'available', 'O': 'occupied'}
+
+
+def _lot_json(row):
+    return {
+        'id': row.id,
+        'name': row.prime_location_name,
+        'address': row.address,
+        'pincode': row.pincode,
+        'price_per_hour': row.price_per_hour,
+        'total_spots': row.available_spots + row.occupied_spots,
+        'available_spots': row.available_spots,
+        'occupied_spots': row.occupied_spots,
+        'version': row.version,
+    }
+
+
+def _not_modified(etag):
+    """304 for a client that already has this version, else None"""
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def _tagged(response, etag):
+    response.set_etag(etag)
+    #clients may keep the body but must revalidate it, which is the cheap 304
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+#kiosks send an API token, browsers and the app use their login session
+@api_bp.before_request
+def authenticate():
+    return login_or_token_error()
+
+
+#every lot with its availability
+@api_bp.route('/lots')
+def lots():
+    not_modified = _not_modified(listing_etag(lot_versions.all()))
+    if not_modified:
+        return not_modified
+
+    rows = db.session.query(*LOT_COLUMNS).order_by(ParkingLot.id).all()
+    #the tag describes exactly the rows sent
+    return _tagged(jsonify({'lots': [_lot_json(row) for row in rows]}),
+                   listing_etag({row.id: row.version for row in rows}))
+
+
+#one lot with its availability
+@api_bp.route('/lots/<int:lot_id>')
+def lot(lot_id):
+    version = lot_versions.get(lot_id)
+    if version is not None:
+        not_modified = _not_modified(lot_etag(lot_id, version))
+        if not_modified:
+            return not_modified
+
+    row = db.session.query(*LOT_COLUMNS).filter(ParkingLot.id == lot_id).first()
+    if row is None:
+        return jsonify({'error': f'No lot with id {lot_id}.'}), 404
+    return _tagged(jsonify(_lot_json(row)), lot_etag(row.id, row.version))
+
+
+#status of every spot of a lot
+@api_bp.route('/lots/<int:lot_id>/spots')
+def lot_spots(lot_id):
+    version = lot_versions.get(lot_id)
+    if version is not None:
+        not_modified = _not_modified(lot_etag(lot_id, version, 'spots'))
+        if not_modified:
+            return not_modified
+
+    #version before spots: a change in between makes the tag older than the body, so it is refetched
+    version = db.session.query(ParkingLot.version).filter(ParkingLot.id == lot_id).scalar()
+    if version is None:
+        return jsonify({'error': f'No lot with id {lot_id}.'}), 404
+    spots = (db.session.query(ParkingSpot.id, ParkingSpot.spot_number, ParkingSpot.status)
+             .filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status != 'R')
+             .order_by(ParkingSpot.id)
+             .all())
+    return _tagged(jsonify({
+        'lot_id': lot_id,
+        'version': version,
+        'spots': [{'id': spot.id, 'number': spot.spot_number, 'status': SPOT_STATUS[spot.status]}
+                  for spot in spots],
+    }), lot_etag(lot_id, version, 'spots'))
@@ -2,10 +2,16 @@
 
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
-from models import db, User, ParkingLot, ParkingSpot, Reservation
+from models import db, User, ParkingLot, ParkingSpot, Reservation, normalize_vehicle_no
 from datetime import datetime
 import re
 from pytz import timezone
+from services.booking import next_free_spot, book_spot, release_reservation
+from services.booking_queue import booking_queue
+from services.search import reindex_user
+from services.reports import user_reservations, reservation_stats
+from services.metrics import metrics
+from services.lot_cache import lot_cache
 
 user_bp = Blueprint('user', __name__, template_folder='../templates')
 
@@ -124,23 +130,17 @@ def dashboard():
 
     #initially empty search query, shows all of them
     search_query = ''
-    lots = ParkingLot.query.all()
     if request.method == 'POST':
         search_query = request.form.get('search', '').strip()
 
-        #getting form data and filtering according to it
-        if search_query:
-            lots = ParkingLot.query.filter(
-                (ParkingLot.prime_location_name.ilike(f'%{search_query}%')) |
-                (ParkingLot.pincode.ilike(f'%{search_query}%'))
-            ).all()
-
-    for lot in lots:
-        lot.available_spots = lot.get_available_spots_count()
-        lot.occupied_spots = lot.get_occupied_spots_count()
+    #lot list and searches come from the shared listing cache
+    if search_query:
+        lots = lot_cache.search(search_query)
+    else:
+        lots = lot_cache.all_lots()
     
-    #get all the users reservation
-    reservations = Reservation.query.filter_by(user_id=current_user.id).order_by(Reservation.created_at.desc()).all()
+    #get all the users reservation, spots and lots come in the same query
+    reservations = user_reservations(current_user.id)
     
     #calculatr reservation stats
     active_reservations = [r for r in reservations if r.is_active()]
@@ -198,14 +198,16 @@ def book(lot_id):
     
     #user needs to release the active one to book new reservation
     if active_reservation:
+        metrics.count('parking_booking_failures_total', reason='active_reservation')
         flash('You already have an active reservation. Please release it before booking a new spot.', 'danger')
         return redirect(url_for('user.dashboard'))
     
-    #find first empty spot
-    available_spot = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').first()
+    #next free spot comes from the in-memory allocator instead of scanning the lot
+    available_spot = next_free_spot(lot_id)
     
     #in case unavailability of spots
     if not available_spot:
+        metrics.count('parking_booking_failures_total', reason='lot_full')
         flash(f'No available spots in {lot.prime_location_name}. Please try another lot.', 'danger')
         return redirect(url_for('user.dashboard'))
     
@@ -213,25 +215,36 @@ def book(lot_id):
     if request.method == 'POST':
         vehicle_no = request.form.get('vehicle_no', '').strip()
 
-        if not vehicle_no or len(vehicle_no) < 4:
+        #spaces and dashes are ignored, 'KA-01 AB 1234' is the same vehicle as 'KA01AB1234'
+        if len(normalize_vehicle_no(vehicle_no) or '') < 4:
+            metrics.count('parking_booking_failures_total', reason='invalid_vehicle')
             flash('Please enter a valid vehicle number.', 'danger')
             return render_template('user/book.html', lot=lot, spot=available_spot, vehicle_no=vehicle_no)
         
-        #reserve the spot
+        #reserve the spot, in its own commit or through the single writer
         parking_time_ist = datetime.utcnow().replace(tzinfo=timezone('UTC')).astimezone(IST)
-        available_spot.status = 'O'
-        reservation = Reservation(
-            user_id=current_user.id,
-            spot_id=available_spot.id,
-            parking_timestamp=parking_time_ist,
-            parking_cost_per_hour=lot.price_per_hour,
-            total_cost=None,
-            created_at=parking_time_ist
-        )
-        #forward the cheanges to the db
-        reservation.vehicle_no = vehicle_no
-        db.session.add(reservation)
-        db.session.commit()
+        if booking_queue.enabled():
+            try:
+                result, spot_id = booking_queue.book(lot_id, current_user.id, vehicle_no, lot.price_per_hour,
+                                                     parking_time_ist)
+            except Exception:
+                result, spot_id = 'error', None
+        else:
+            result, spot_id = book_spot(lot_id, current_user.id, vehicle_no, lot.price_per_hour, parking_time_ist)
+
+        if result != 'booked':
+            metrics.count('parking_booking_failures_total', reason=result)
+            if result == 'lot_full':
+                flash(f'No available spots in {lot.prime_location_name}. Please try another lot.', 'danger')
+            elif result == 'vehicle_parked':
+                flash(f'Vehicle {vehicle_no} is already parked. Release it before booking again.', 'danger')
+            elif result == 'active_reservation':
+                flash('You already have an active reservation. Please release it before booking a new spot.', 'danger')
+            else:
+                flash('Error booking the spot. Please try again.', 'danger')
+            return redirect(url_for('user.dashboard'))
+        available_spot = db.session.get(ParkingSpot, spot_id)
+        metrics.count('parking_bookings_total', lot_id=lot_id)
         flash(f'Spot {available_spot.spot_number} booked successfully in {lot.prime_location_name}!', 'success')
         return redirect(url_for('user.dashboard'))
     return render_template('user/book.html', lot=lot, spot=available_spot, vehicle_no='')
@@ -281,11 +294,19 @@ def release_spot(reservation_id):
             return render_template('user/release.html', reservation=reservation, now_str=releasing_time_str, cost=cost, ist_format=True, ist_tz=IST)
         
         elif action == 'release':
-            reservation.leaving_timestamp = releasing_time
-            reservation.total_cost = reservation.calculate_total_cost()
-            spot = ParkingSpot.query.get(reservation.spot_id)
-            spot.status = 'A'
-            db.session.commit()
+            #conditional update, a concurrent or repeated release is a no-op
+            if booking_queue.enabled():
+                try:
+                    released = booking_queue.release(reservation.id, releasing_time)
+                except Exception:
+                    #timed out or failed in the writer; if it was applied after all, a retry says so
+                    flash('Error releasing the spot. Please try again.', 'danger')
+                    return redirect(url_for('user.dashboard'))
+            else:
+                released = release_reservation(reservation, releasing_time)
+            if not released:
+                flash('This reservation has already been completed.', 'info')
+                return redirect(url_for('user.dashboard'))
             flash('Spot released successfully!', 'success')
             return redirect(url_for('user.dashboard'))
         
@@ -300,7 +321,7 @@ def reservation_history():
         return redirect(url_for('admin.dashboard'))
     
     #get all the reservations of the cuurent user
-    reservations = Reservation.query.filter_by(user_id=current_user.id).order_by(Reservation.created_at.desc()).all()
+    reservations = user_reservations(current_user.id)
     
     return render_template('user/history.html', reservations=reservations)
 
@@ -313,11 +334,8 @@ def view_lots():
     if current_user.is_admin:
         return redirect(url_for('admin.dashboard'))
     
-    #get all the parking lots with information about their availablity
-    lots = ParkingLot.query.all()
-    for lot in lots:
-        lot.available_spots = lot.get_available_spots_count()
-        lot.occupied_spots = lot.get_occupied_spots_count()
+    #get all the parking lots, availability comes from their counters via the listing cache
+    lots = lot_cache.all_lots()
     
     return render_template('user/lots.html', lots=lots)
 
@@ -366,6 +384,8 @@ def edit_profile():
         #update password
         if new_password:
             current_user.set_password(new_password)
+        #the search index holds the username of parked users
+        reindex_user(current_user.id)
         #commit to db
         db.session.commit()
         flash('Profile updated successfully.', 'success')
@@ -379,10 +399,11 @@ def edit_profile():
 @login_required
 #stats related to reservation , no. of bookings, released info,or parked out
 def summary():
-    reservations = Reservation.query.filter_by(user_id=current_user.id).all()
-    booked = len(reservations)
-    released = len([r for r in reservations if r.leaving_timestamp is not None])
-    parked_out = len([r for r in reservations if r.leaving_timestamp is None])
+    #counted in SQL over the live and archived reservations
+    stats = reservation_stats([current_user.id]).one_or_none()
+    booked = stats.reservations if stats else 0
+    parked_out = stats.active if stats else 0
+    released = booked - parked_out
     return render_template('user/summary.html', booked=booked, released=released, parked_out=parked_out)
 
 
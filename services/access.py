@@ -0,0 +1,23 @@
+# services/access.py
+
+import hmac
+from flask import jsonify, request, current_app
+from flask_login import current_user
+
+
+def login_or_token_error():
+    """None if the request has a login session or one of API_TOKENS as a Bearer token, else a JSON 401.
+
+    For machine-readable endpoints (the JSON API, the availability stream),
+    where a redirect to the login page would be of no use: kiosks send an
+    API token, browsers and the app use their login session.
+    """
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        token = header[len('Bearer '):]
+        if any(hmac.compare_digest(token, allowed) for allowed in current_app.config['API_TOKENS']):
+            return None
+        return jsonify({'error': 'Invalid API token.'}), 401
+    if current_user.is_authenticated:
+        return None
+    return jsonify({'error': 'Login or an API token required.'}), 401
@@ -0,0 +1,105 @@
+# services/allocator.py
+
+from threading import Lock
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, ParkingSpot
+
+
+class SpotAllocator:
+    """In-memory pool of free spot ids per parking lot.
+
+    The database stays the source of truth; the pool only saves the
+    `status='A'` scan on every booking. Each lot is loaded lazily (or all
+    at once by `warm`) and can be rebuilt from the database at any time.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        # lot_id -> {spot_id: None}; dicts keep insertion order so popitem() is O(1) LIFO
+        self._free = {}
+
+    def init_app(self, app):
+        """Attach to the app and preload every lot if the tables exist"""
+        app.extensions['spot_allocator'] = self
+        with app.app_context():
+            try:
+                self.warm()
+            except SQLAlchemyError:
+                #tables not created yet (e.g. create_db.py), lots load on first use
+                db.session.rollback()
+
+    def warm(self):
+        """Load the free spots of every lot in a single query"""
+        rows = (db.session.query(ParkingSpot.lot_id, ParkingSpot.id)
+                .filter(ParkingSpot.status == 'A')
+                .order_by(ParkingSpot.lot_id, ParkingSpot.id.desc())
+                .all())
+        free = {}
+        for lot_id, spot_id in rows:
+            free.setdefault(lot_id, {})[spot_id] = None
+        with self._lock:
+            self._free = free
+        return sum(len(spots) for spots in free.values())
+
+    def _load_lot(self, lot_id):
+        """Read the free spots of one lot, lowest id is handed out first"""
+        rows = (db.session.query(ParkingSpot.id)
+                .filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status == 'A')
+                .order_by(ParkingSpot.id.desc())
+                .all())
+        return {spot_id: None for (spot_id,) in rows}
+
+    def _pool(self, lot_id):
+        pool = self._free.get(lot_id)
+        if pool is None:
+            pool = self._free[lot_id] = self._load_lot(lot_id)
+        return pool
+
+    def rebuild(self, lot_id=None):
+        """Drop the cached pool and reload it from the database"""
+        if lot_id is None:
+            return self.warm()
+        pool = self._load_lot(lot_id)
+        with self._lock:
+            self._free[lot_id] = pool
+        return len(pool)
+
+    def invalidate(self, lot_id=None):
+        """Forget a lot (or everything) so it is reloaded on next use"""
+        with self._lock:
+            if lot_id is None:
+                self._free = {}
+            else:
+                self._free.pop(lot_id, None)
+
+    def peek(self, lot_id):
+        """Spot id that the next acquire() would return, or None"""
+        with self._lock:
+            pool = self._pool(lot_id)
+            if not pool:
+                return None
+            return next(reversed(pool))
+
+    def acquire(self, lot_id):
+        """Take a free spot id out of the pool, or None if the lot is full"""
+        with self._lock:
+            pool = self._pool(lot_id)
+            if not pool:
+                return None
+            spot_id, _ = pool.popitem()
+            return spot_id
+
+    def release(self, lot_id, spot_id):
+        """Give a spot id back to the pool"""
+        with self._lock:
+            pool = self._free.get(lot_id)
+            #lot not loaded yet, it will pick the spot up from the database
+            if pool is not None:
+                pool[spot_id] = None
+
+    def free_count(self, lot_id):
+        with self._lock:
+            return len(self._pool(lot_id))
+
+
+spot_allocator = SpotAllocator()
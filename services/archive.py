@@ -0,0 +1,57 @@
+# services/archive.py
+
+from datetime import datetime
+from sqlalchemy import bindparam, func, text
+from models import db, Reservation
+
+# Completed reservations move to reservation_archive so the live table only
+# holds what bookings, releases and the spot grids still look at. History
+# pages and reports read both tables (services/reports.py).
+
+ARCHIVE_SQL = """
+    INSERT INTO reservation_archive (id, spot_id, lot_id, user_id, spot_number, lot_name, parking_timestamp,
+                                     leaving_timestamp, parking_cost_per_hour, total_cost, created_at,
+                                     vehicle_no, archived_at)
+    SELECT r.id, r.spot_id, s.lot_id, r.user_id, s.spot_number, l.prime_location_name, r.parking_timestamp,
+           r.leaving_timestamp, r.parking_cost_per_hour, r.total_cost, r.created_at, r.vehicle_no, :now
+    FROM reservations r
+    JOIN parking_spots s ON s.id = r.spot_id
+    JOIN parking_lots l ON l.id = s.lot_id
+    WHERE r.id IN :ids
+"""
+
+
+def in_ids(sql):
+    """text() statement taking the list bound to :ids"""
+    return text(sql).bindparams(bindparam('ids', expanding=True))
+
+
+def move_to_archive(reservation_ids):
+    """Copy the reservations to the archive and delete them from the live table (not committed)"""
+    db.session.execute(in_ids(ARCHIVE_SQL), {'ids': reservation_ids, 'now': datetime.utcnow()})
+    db.session.execute(in_ids('DELETE FROM reservations WHERE id IN :ids'), {'ids': reservation_ids})
+
+
+def archive_completed(before, chunk_size, progress=None):
+    """Move reservations released before `before` to the archive.
+
+    Runs one short transaction per chunk, so bookings keep going in
+    between; an interrupted run is finished by running it again.
+    `progress(done, total)` is called after every committed chunk.
+    Returns the number of reservations archived.
+    """
+    completed = db.session.query(Reservation.id).filter(Reservation.leaving_timestamp < before)
+    total = completed.with_entities(func.count(Reservation.id)).scalar()
+    done = 0
+    while True:
+        #released reservations never become active again, so each chunk is re-read from what is left
+        chunk = [reservation_id for (reservation_id,) in
+                 completed.order_by(Reservation.leaving_timestamp).limit(chunk_size)]
+        if not chunk:
+            break
+        move_to_archive(chunk)
+        db.session.commit()
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+    return done
@@ -0,0 +1,151 @@
+# services/booking.py
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from models import db, ParkingSpot, Reservation
+from services.allocator import spot_allocator
+from services.lot_stats import spot_moved
+from services.metrics import metrics
+from services.search import reindex_spot
+from services.user_stats import reservation_booked, reservation_released
+
+#how many pool candidates a booking tries before giving up on a lot
+CLAIM_ATTEMPTS = 5
+
+
+def next_free_spot(lot_id):
+    """Spot the next booking in this lot will most likely get (read only).
+
+    Another worker may have changed the spot since the pool was loaded, so a
+    stale or empty answer triggers one rebuild from the database.
+    """
+    for _ in range(2):
+        spot_id = spot_allocator.peek(lot_id)
+        if spot_id is not None:
+            spot = db.session.get(ParkingSpot, spot_id)
+            if spot is not None and spot.status == 'A':
+                return spot
+        spot_allocator.rebuild(lot_id)
+    return None
+
+
+def claim_spot(lot_id):
+    """Atomically mark a free spot of the lot as occupied.
+
+    The status flip is a conditional UPDATE ... WHERE status='A', so when two
+    workers race for the same spot only one update matches a row and the
+    loser simply moves on to the next candidate. Returns the spot id, or None
+    if the lot is full. The caller commits (or rolls back) the transaction.
+    """
+    for attempt in range(CLAIM_ATTEMPTS):
+        spot_id = spot_allocator.acquire(lot_id)
+        if spot_id is None:
+            #pool may be stale (another process released spots), reload once
+            if attempt or not spot_allocator.rebuild(lot_id):
+                return None
+            continue
+        result = db.session.execute(
+            update(ParkingSpot)
+            .where(ParkingSpot.id == spot_id,
+                   ParkingSpot.lot_id == lot_id,
+                   ParkingSpot.status == 'A')
+            .values(status='O')
+        )
+        if result.rowcount == 1:
+            spot_moved(lot_id, 'O')
+            return spot_id
+        #lost the race, the spot is taken so it does not go back to the pool
+    return None
+
+
+def add_reservation(spot_id, user_id, vehicle_no, price_per_hour, parked_at):
+    """Reservation for a claimed spot, in the caller's transaction"""
+    reservation = Reservation(
+        user_id=user_id,
+        spot_id=spot_id,
+        parking_timestamp=parked_at,
+        parking_cost_per_hour=price_per_hour,
+        total_cost=None,
+        created_at=parked_at
+    )
+    reservation.vehicle_no = vehicle_no
+    db.session.add(reservation)
+    reservation_booked(user_id)
+    reindex_spot(spot_id)
+    return reservation
+
+
+def book_spot(lot_id, user_id, vehicle_no, price_per_hour, parked_at):
+    """Claim a spot and reserve it in one transaction.
+
+    Returns (result, spot_id), result being 'booked', 'lot_full',
+    'vehicle_parked' or 'error'. A failed booking hands its claim back.
+    """
+    #claim atomically, the spot may differ from the one shown on GET
+    spot_id = claim_spot(lot_id)
+    if spot_id is None:
+        return 'lot_full', None
+    try:
+        add_reservation(spot_id, user_id, vehicle_no, price_per_hour, parked_at)
+        db.session.commit()
+    except IntegrityError:
+        #unique index on active vehicles, the undone claim goes back to the pool
+        db.session.rollback()
+        spot_allocator.release(lot_id, spot_id)
+        return 'vehicle_parked', None
+    except Exception:
+        db.session.rollback()
+        spot_allocator.release(lot_id, spot_id)
+        return 'error', None
+    return 'booked', spot_id
+
+
+def close_reservation(reservation, releasing_time):
+    """Close an active reservation and free its spot (part of the caller's transaction).
+
+    Only the call whose UPDATE ... WHERE leaving_timestamp IS NULL matches
+    gets to free the spot, so a double submit cannot release twice.
+    Returns (lot_id, spot_id) of the freed spot, or None if the reservation
+    was already closed. After the commit the spot goes back to the pool.
+    """
+    #closed already as loaded, the cost calculation below must not undo that before the autoflush
+    if not reservation.is_active():
+        return None
+    reservation.leaving_timestamp = releasing_time
+    total_cost = reservation.calculate_total_cost()
+    reservation.leaving_timestamp = None
+
+    result = db.session.execute(
+        update(Reservation)
+        .where(Reservation.id == reservation.id, Reservation.leaving_timestamp.is_(None))
+        .values(leaving_timestamp=releasing_time, total_cost=total_cost)
+    )
+    if result.rowcount != 1:
+        return None
+    reservation_released(reservation.user_id, total_cost)
+
+    spot = db.session.get(ParkingSpot, reservation.spot_id)
+    result = db.session.execute(
+        update(ParkingSpot)
+        .where(ParkingSpot.id == spot.id, ParkingSpot.status == 'O')
+        .values(status='A')
+    )
+    if result.rowcount == 1:
+        spot_moved(spot.lot_id, 'A')
+    reindex_spot(spot.id)
+    return spot.lot_id, spot.id
+
+
+def release_reservation(reservation, releasing_time):
+    """Close an active reservation and free its spot in one transaction.
+
+    Returns True if this call released the reservation.
+    """
+    freed = close_reservation(reservation, releasing_time)
+    if freed is None:
+        db.session.rollback()
+        return False
+    db.session.commit()
+    spot_allocator.release(*freed)
+    metrics.count('parking_releases_total', lot_id=freed[0])
+    return True
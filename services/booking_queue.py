@@ -0,0 +1,171 @@
+# services/booking_queue.py
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from flask import current_app
+from models import db, Reservation, normalize_vehicle_no
+from services.allocator import spot_allocator
+from services.booking import claim_spot, add_reservation, close_reservation
+from services.metrics import metrics
+
+
+class BookingQueue:
+    """Single writer for bookings and releases, committing them in groups.
+
+    With BOOKING_QUEUE on, the book and release routes hand their write to
+    one writer thread per process and wait for its answer. The writer
+    collects whatever arrives within BOOKING_QUEUE_WAIT_MS (at most
+    BOOKING_QUEUE_BATCH operations), applies them in order in one
+    transaction and commits once, so a rush of bookings costs one commit
+    (one fsync) per group instead of one each, and never waits on a lock
+    held by another request of the same process.
+
+    If the group commit fails (e.g. a vehicle parked through another
+    process in the meantime) it is rolled back and every operation is
+    retried in its own transaction, so each caller still gets its own
+    result. The writer stops after BOOKING_QUEUE_IDLE_SECONDS without work.
+
+    The caller's session is closed while it waits (its objects become
+    detached), so its connection is free for the writer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        if app.config['BOOKING_QUEUE']:
+            app.extensions['booking_queue'] = {'queue': queue.Queue(), 'writer': None}
+
+    def enabled(self):
+        return 'booking_queue' in current_app.extensions
+
+    def book(self, lot_id, user_id, vehicle_no, price_per_hour, parked_at):
+        """(result, spot_id): result is 'booked', 'active_reservation', 'vehicle_parked' or 'lot_full'"""
+        return self._submit(_book, lot_id, user_id, vehicle_no, price_per_hour, parked_at)
+
+    def release(self, reservation_id, releasing_time):
+        """True if this call released the reservation"""
+        return self._submit(_release, reservation_id, releasing_time)
+
+    def _submit(self, operation, *args):
+        app = current_app._get_current_object()
+        state = app.extensions['booking_queue']
+        #hand the request's connection back while it waits, or waiting requests
+        #can hold every pooled connection the writer needs; loaded objects stay readable
+        db.session.close()
+        future = Future()
+        state['queue'].put((operation, args, future))
+        #after the put, a writer that is just stopping sees the item or has cleared 'writer'
+        with self._lock:
+            if state['writer'] is None:
+                state['writer'] = threading.Thread(target=self._write, args=(app, state),
+                                                   name='booking-writer', daemon=True)
+                state['writer'].start()
+        try:
+            return future.result(timeout=app.config['BOOKING_QUEUE_TIMEOUT'])
+        except TimeoutError:
+            #not applied unless the writer already started on it
+            future.cancel()
+            raise
+
+    def _write(self, app, state):
+        config = app.config
+        with app.app_context():
+            while True:
+                try:
+                    first = state['queue'].get(timeout=config['BOOKING_QUEUE_IDLE_SECONDS'])
+                except queue.Empty:
+                    with self._lock:
+                        if state['queue'].empty():
+                            state['writer'] = None
+                            return
+                    continue
+                batch = [first]
+                deadline = time.monotonic() + config['BOOKING_QUEUE_WAIT_MS'] / 1000
+                while len(batch) < config['BOOKING_QUEUE_BATCH']:
+                    try:
+                        batch.append(state['queue'].get(timeout=max(deadline - time.monotonic(), 0)))
+                    except queue.Empty:
+                        break
+                try:
+                    self._commit(batch)
+                finally:
+                    db.session.remove()
+
+    def _commit(self, batch):
+        """Apply `batch` in one transaction, or each operation in its own if that fails"""
+        #callers that gave up before their turn are skipped
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            self._apply(batch)
+            return
+        except Exception as error:
+            if len(batch) == 1:
+                batch[0][2].set_exception(error)
+                return
+            current_app.logger.warning('booking queue: group of %d failed (%r), retrying one by one',
+                                       len(batch), error)
+        for item in batch:
+            try:
+                self._apply([item])
+            except Exception as error:
+                item[2].set_exception(error)
+
+    def _apply(self, batch):
+        """Run the operations in one transaction and answer their callers, or roll back and raise"""
+        applied = []
+        try:
+            for operation, args, _ in batch:
+                applied.append(operation(*args))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for _, undo, _ in applied:
+                if undo:
+                    undo()
+            raise
+        for (_, _, future), (result, _, done) in zip(batch, applied):
+            if done:
+                done()
+            future.set_result(result)
+
+
+#operations run by the writer: (result, undo after a rollback, follow-up after the commit)
+
+def _book(lot_id, user_id, vehicle_no, price_per_hour, parked_at):
+    #the routes checked these before queueing, an earlier booking of the group may have changed them
+    if db.session.query(Reservation.id).filter_by(user_id=user_id, leaving_timestamp=None).first():
+        return ('active_reservation', None), None, None
+    if (db.session.query(Reservation.id)
+            .filter_by(vehicle_key=normalize_vehicle_no(vehicle_no), leaving_timestamp=None).first()):
+        return ('vehicle_parked', None), None, None
+    spot_id = claim_spot(lot_id)
+    if spot_id is None:
+        return ('lot_full', None), None, None
+    undo = lambda: spot_allocator.release(lot_id, spot_id)
+    try:
+        add_reservation(spot_id, user_id, vehicle_no, price_per_hour, parked_at)
+    except Exception:
+        undo()
+        raise
+    return ('booked', spot_id), undo, None
+
+
+def _release(reservation_id, releasing_time):
+    reservation = db.session.get(Reservation, reservation_id)
+    freed = close_reservation(reservation, releasing_time) if reservation else None
+    if freed is None:
+        return False, None, None
+
+    def done():
+        spot_allocator.release(*freed)
+        metrics.count('parking_releases_total', lot_id=freed[0])
+
+    return True, None, done
+
+
+booking_queue = BookingQueue()
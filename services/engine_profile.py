@@ -0,0 +1,107 @@
+# services/engine_profile.py
+
+import sqlite3
+from functools import wraps
+from threading import Lock
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from models import db
+
+
+def _connection_class(pragmas):
+    """sqlite3 connection that runs `pragmas` as soon as it is opened, before the pool hands it out"""
+
+    class ProfiledConnection(sqlite3.Connection):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            for pragma in pragmas:
+                self.execute(pragma)
+
+    return ProfiledConnection
+
+
+class EngineProfile:
+    """Connection settings for a SQLite database under concurrent traffic.
+
+    With SQLITE_PROFILE on, every connection runs in WAL mode (readers and
+    the writer no longer block each other), with DB_SYNCHRONOUS, a
+    DB_CACHE_KIB page cache and DB_MMAP_BYTES of memory-mapped reads, and
+    waits up to DB_BUSY_TIMEOUT seconds for a lock instead of failing with
+    "database is locked". The pool keeps DB_POOL_SIZE connections.
+
+    A second engine on the same file, with its own pool of
+    DB_READ_POOL_SIZE connections in `query_only` mode, serves the views
+    wrapped in `read_only`, so long reports neither write nor take
+    connections from bookings. Must be initialised before db.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+
+    def init_app(self, app):
+        config = app.config
+        url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+        if not config['SQLITE_PROFILE'] or url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+            return
+        pragmas = [f"PRAGMA synchronous = {config['DB_SYNCHRONOUS']}",
+                   f"PRAGMA cache_size = {-int(config['DB_CACHE_KIB'])}",
+                   f"PRAGMA mmap_size = {int(config['DB_MMAP_BYTES'])}"]
+
+        options = config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        options.setdefault('pool_size', config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', config['DB_POOL_OVERFLOW'])
+        options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+        options.setdefault('connect_args', {}).update(
+            timeout=config['DB_BUSY_TIMEOUT'],
+            #journal_mode is stored in the file, the writer connections set it
+            factory=_connection_class([f"PRAGMA journal_mode = {config['DB_JOURNAL_MODE']}"] + pragmas))
+
+        app.extensions['engine_profile'] = {'reader': None, 'reader_options': {
+            'pool_size': config['DB_READ_POOL_SIZE'],
+            'max_overflow': config['DB_POOL_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'connect_args': {'timeout': config['DB_BUSY_TIMEOUT'],
+                             'factory': _connection_class(pragmas + ['PRAGMA query_only = ON'])},
+        }}
+
+    def reader(self):
+        """Engine of the read-only connections, made on first use from the app's engine url"""
+        state = current_app.extensions['engine_profile']
+        with self._lock:
+            if state['reader'] is None:
+                state['reader'] = create_engine(db.engine.url, **state['reader_options'])
+            return state['reader']
+
+
+class ReadOnlySession(Session):
+    """Session whose queries all go to the read-only connections"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return bind
+        return engine_profile.reader()
+
+
+def read_only(view):
+    """Run a view that only reads on the read-only connections (below @login_required)"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if 'engine_profile' not in current_app.extensions:
+            return view(*args, **kwargs)
+        #db.session is scoped to the app context, swap in a reader for the length of the view
+        writer = db.session()
+        reader = ReadOnlySession(db)
+        db.session.registry.set(reader)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            reader.close()
+            db.session.registry.set(writer)
+
+    return wrapper
+
+
+engine_profile = EngineProfile()
@@ -0,0 +1,89 @@
+# services/instrumentation.py
+
+import time
+from collections import Counter
+from flask import current_app, g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class RequestInstrumentation:
+    """Per-request SQL statistics, slow-query and N+1 logging, Server-Timing.
+
+    Opt-in with SQL_INSTRUMENTATION. Statements are counted and timed from
+    SQLAlchemy engine events, template time from Flask's render signals
+    (lazy loads fired while rendering count towards both db and template).
+    Each response gets a header like
+
+        Server-Timing: db;dur=4.1;desc="6 queries", template;dur=2.3, total;dur=9.8
+    """
+
+    def __init__(self):
+        self._listening = False
+
+    def init_app(self, app):
+        """Hook into the app's requests when SQL_INSTRUMENTATION is on"""
+        if not app.config['SQL_INSTRUMENTATION']:
+            return
+        app.extensions['request_instrumentation'] = self
+        if not self._listening:
+            #one listener for every engine, requests of apps without instrumentation are skipped
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _start(self):
+        g.sql_stats = {'started': time.perf_counter(), 'queries': 0, 'db': 0.0, 'template': 0.0,
+                       'statements': Counter(), 'rendering': None}
+
+    def _stats(self):
+        return g.get('sql_stats') if has_request_context() else None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._stats() is not None:
+            conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self._stats()
+        if stats is None or not conn.info.get('query_started'):
+            return
+        elapsed = (time.perf_counter() - conn.info['query_started'].pop()) * 1000
+        stats['queries'] += 1
+        stats['db'] += elapsed
+        stats['statements'][statement] += 1
+        if elapsed >= current_app.config['SLOW_QUERY_MS']:
+            current_app.logger.warning('slow query %.1fms on %s %s: %s params=%.200r',
+                                       elapsed, request.method, request.path, ' '.join(statement.split()), parameters)
+
+    def _before_render(self, app, template, context, **extra):
+        stats = self._stats()
+        if stats is not None:
+            stats['rendering'] = time.perf_counter()
+
+    def _after_render(self, app, template, context, **extra):
+        stats = self._stats()
+        if stats is not None and stats['rendering'] is not None:
+            stats['template'] += (time.perf_counter() - stats['rendering']) * 1000
+            stats['rendering'] = None
+
+    def _finish(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+        threshold = current_app.config['N_PLUS_ONE_THRESHOLD']
+        for statement, count in stats['statements'].most_common():
+            if count < threshold:
+                break
+            current_app.logger.warning('possible N+1 on %s %s: %d x %s',
+                                       request.method, request.path, count, ' '.join(statement.split()))
+        total = (time.perf_counter() - stats['started']) * 1000
+        response.headers['Server-Timing'] = (f'db;dur={stats["db"]:.1f};desc="{stats["queries"]} queries", '
+                                             f'template;dur={stats["template"]:.1f}, total;dur={total:.1f}')
+        return response
+
+
+request_instrumentation = RequestInstrumentation()
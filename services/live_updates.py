@@ -0,0 +1,171 @@
+# services/live_updates.py
+
+import json
+import queue
+import threading
+import time
+from flask import Response, current_app
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, ParkingLot
+from services.access import login_or_token_error
+from services.lot_cache import lot_cache
+from services.lot_stats import lot_counts_changed
+
+
+class Channel:
+    """Latest lot counts of one app and the queues of its open streams"""
+
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.counts = None  # lot_id -> (name, available, occupied), loaded with the first stream
+        self.event_id = 0
+        self.poller = None
+
+    def update(self, counts):
+        """Publish what changed in `counts`: one event, built once, queued to every stream"""
+        with self.lock:
+            if self.counts is None:
+                return
+            changed = []
+            for lot_id, values in counts.items():
+                if values is None:
+                    if self.counts.pop(lot_id, None) is not None:
+                        changed.append({'id': lot_id, 'deleted': True})
+                elif self.counts.get(lot_id) != tuple(values):
+                    self.counts[lot_id] = tuple(values)
+                    changed.append(_lot_json(lot_id, values))
+            if not changed:
+                return
+            self.event_id += 1
+            message = _message('availability', {'lots': changed}, self.event_id)
+            for subscriber in list(self.subscribers):
+                try:
+                    subscriber.put_nowait(message)
+                except queue.Full:
+                    #a stream that stopped reading is dropped and starts over with a snapshot
+                    self.subscribers.discard(subscriber)
+                    subscriber.overflowed = True
+
+    def snapshot(self):
+        with self.lock:
+            lots = [_lot_json(lot_id, values) for lot_id, values in sorted(self.counts.items())]
+            return _message('snapshot', {'lots': lots}, self.event_id)
+
+    def subscribe(self, size):
+        subscriber = queue.Queue(maxsize=size)
+        subscriber.overflowed = False
+        with self.lock:
+            self.subscribers.add(subscriber)
+            if self.poller is None:
+                self.poller = threading.Thread(target=self._poll, name='live-updates-poller', daemon=True)
+                self.poller.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def _poll(self):
+        """Pick up counters committed by other processes, while anyone is listening"""
+        while True:
+            time.sleep(self.app.config['LIVE_POLL_SECONDS'])
+            with self.lock:
+                if not self.subscribers:
+                    self.poller = None
+                    return
+            with self.app.app_context():
+                try:
+                    rows = db.session.query(ParkingLot.id, ParkingLot.prime_location_name,
+                                            ParkingLot.available_spots, ParkingLot.occupied_spots).all()
+                except SQLAlchemyError:
+                    current_app.logger.exception('live updates: reading lot counters failed')
+                    continue
+                finally:
+                    db.session.remove()
+                current = {lot_id: (name, available, occupied) for lot_id, name, available, occupied in rows}
+                with self.lock:
+                    known = dict(self.counts or {})
+                changed = {lot_id: values for lot_id, values in current.items() if known.get(lot_id) != values}
+                changed.update({lot_id: None for lot_id in known if lot_id not in current})
+                if changed:
+                    #through the signal, so the listing cache and metrics hear about it too
+                    lot_counts_changed.send(self.app, counts=changed)
+
+
+class LiveUpdates:
+    """Server-Sent Events stream of lot availability at /availability/stream.
+
+    A new stream gets a `snapshot` event with every lot, then an
+    `availability` event with the changed lots whenever lot counters are
+    committed (see lot_stats.lot_counts_changed). Each event is serialised
+    once and queued to every open stream of the process, so the cost of a
+    change does not grow with the number of listeners beyond a queue put.
+
+    Changes committed by other worker processes are picked up by one poller
+    thread per process that reads the lot counters every LIVE_POLL_SECONDS,
+    and only while streams are open. Streams need a login session or an
+    API token, like the JSON API. Streams end after LIVE_MAX_SECONDS;
+    EventSource reconnects on its own and starts from a fresh snapshot.
+    """
+
+    def init_app(self, app):
+        """Add the stream when LIVE_UPDATES is on"""
+        if not app.config['LIVE_UPDATES']:
+            return
+        app.extensions['live_updates'] = Channel(app)
+        lot_counts_changed.connect(self._lots_changed, app)
+        app.add_url_rule('/availability/stream', 'availability_stream', self.stream)
+
+    def _lots_changed(self, app, counts):
+        app.extensions['live_updates'].update(counts)
+
+    def stream(self):
+        #the same data as /user/lots and /api/lots, for the same clients
+        denied = login_or_token_error()
+        if denied:
+            return denied
+        channel = current_app.extensions['live_updates']
+        config = current_app.config
+        if channel.counts is None:
+            lots = lot_cache.all_lots()
+            with channel.lock:
+                if channel.counts is None:
+                    channel.counts = {lot.id: (lot.prime_location_name, lot.available_spots, lot.occupied_spots)
+                                      for lot in lots}
+        subscriber = channel.subscribe(config['LIVE_QUEUE_SIZE'])
+        first = channel.snapshot()
+
+        def events():
+            nonlocal subscriber
+            deadline = time.monotonic() + config['LIVE_MAX_SECONDS']
+            try:
+                yield f"retry: {int(config['LIVE_RETRY_SECONDS'] * 1000)}\n\n" + first
+                while time.monotonic() < deadline:
+                    if subscriber.overflowed:
+                        subscriber = channel.subscribe(config['LIVE_QUEUE_SIZE'])
+                        yield channel.snapshot()
+                    try:
+                        yield subscriber.get(timeout=config['LIVE_KEEPALIVE_SECONDS'])
+                    except queue.Empty:
+                        #comment line, keeps proxies from closing an idle connection
+                        yield ': keepalive\n\n'
+            finally:
+                channel.unsubscribe(subscriber)
+
+        return Response(events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def _lot_json(lot_id, values):
+    name, available, occupied = values
+    return {'id': lot_id, 'name': name, 'available': available, 'occupied': occupied,
+            'total': available + occupied}
+
+
+def _message(event, data, event_id):
+    return f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+live_updates = LiveUpdates()
@@ -0,0 +1,104 @@
+# services/lot_builder.py
+
+from datetime import datetime
+from sqlalchemy import func, text, update
+from models import db, ParkingLot, ParkingSpot
+from services import search as search_index
+
+# Spot numbers are <section><n> with SPOTS_PER_SECTION bays per section:
+# A1..A10, B1..B10, ..., Z10, AA1, AB1, ... so the first 260 keep their old
+# names. Lots split into levels prefix the level: L1-A1 .. L1-E10, L2-A1 ...
+SPOTS_PER_SECTION = 10
+
+
+def section_label(section):
+    """0 -> A, 25 -> Z, 26 -> AA, 701 -> ZZ, 702 -> AAA"""
+    label = ''
+    section += 1
+    while section:
+        section, remainder = divmod(section - 1, 26)
+        label = chr(65 + remainder) + label
+    return label
+
+
+def spot_number(spot_index, spots_per_level=None):
+    """Number of the spot_index-th (1 based) spot of a lot"""
+    prefix = ''
+    if spots_per_level:
+        level, spot_index = divmod(spot_index - 1, spots_per_level)
+        spot_index += 1
+        prefix = f'L{level + 1}-'
+    section, number = divmod(spot_index - 1, SPOTS_PER_SECTION)
+    return f'{prefix}{section_label(section)}{number + 1}'
+
+
+def insert_spots(lot_id, first_index, count, spots_per_level=None):
+    """Bulk insert `count` available spots numbered from first_index.
+
+    One executemany in the caller's transaction; the caller updates the lot
+    counters, the search index and commits.
+    """
+    if count <= 0:
+        return
+    now = datetime.utcnow()
+    db.session.execute(ParkingSpot.__table__.insert(), [
+        {'lot_id': lot_id, 'spot_number': spot_number(i, spots_per_level), 'status': 'A', 'created_at': now}
+        for i in range(first_index, first_index + count)
+    ])
+
+
+def insert_missing_spots(lot, count):
+    """Add `count` new spots to a lot, filling gaps in its numbering first"""
+    existing = {number for (number,) in db.session.query(ParkingSpot.spot_number).filter_by(lot_id=lot.id)}
+    now = datetime.utcnow()
+    rows = []
+    index = 0
+    while len(rows) < count:
+        index += 1
+        number = spot_number(index, lot.spots_per_level)
+        if number not in existing:
+            rows.append({'lot_id': lot.id, 'spot_number': number, 'status': 'A', 'created_at': now})
+    if rows:
+        db.session.execute(ParkingSpot.__table__.insert(), rows)
+
+
+#the n highest / lowest ids of a lot in one status, picked and changed in one statement
+_PICK_SQL = ('UPDATE parking_spots SET status = :to_status WHERE status = :from_status AND id IN '
+             '(SELECT id FROM parking_spots WHERE lot_id = :lot_id AND status = :from_status '
+             'ORDER BY id {order} LIMIT :count)')
+
+
+def _move_spots(lot_id, from_status, to_status, count, order):
+    result = db.session.execute(text(_PICK_SQL.format(order=order)),
+                                {'lot_id': lot_id, 'from_status': from_status, 'to_status': to_status,
+                                 'count': count})
+    return result.rowcount
+
+
+def resize_lot(lot, new_size):
+    """Grow or shrink a lot to `new_size` spots in a few set-based statements.
+
+    Shrinking retires free spots from the end (status 'R'), occupied spots
+    are never touched so a lot shrinks by at most its free spots; retired
+    spots keep their reservation history. Growing revives retired spots
+    before inserting new ones. Runs in the caller's transaction, which also
+    reindexes the lot; returns the change in spots (negative when retired).
+    """
+    current = (db.session.query(func.count(ParkingSpot.id))
+               .filter(ParkingSpot.lot_id == lot.id, ParkingSpot.status.in_(('A', 'O')))
+               .scalar())
+    if new_size > current:
+        wanted = new_size - current
+        revived = _move_spots(lot.id, 'R', 'A', wanted, 'ASC')
+        insert_missing_spots(lot, wanted - revived)
+        change = wanted
+    elif new_size < current:
+        change = -_move_spots(lot.id, 'A', 'R', current - new_size, 'DESC')
+        search_index.remove_retired(lot.id)
+    else:
+        return 0
+    db.session.execute(update(ParkingLot).where(ParkingLot.id == lot.id)
+                       .values(available_spots=ParkingLot.available_spots + change,
+                               maximum_number_of_spots=current + change,
+                               version=ParkingLot.version + 1))
+    return change
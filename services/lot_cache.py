@@ -0,0 +1,104 @@
+# services/lot_cache.py
+
+import time
+from collections import OrderedDict, namedtuple
+from threading import Lock
+from flask import current_app
+from models import db, ParkingLot
+from services.lot_stats import lot_counts_changed
+from services.metrics import metrics
+
+LISTING_COLUMNS = ('id', 'prime_location_name', 'address', 'pincode', 'price_per_hour',
+                   'maximum_number_of_spots', 'available_spots', 'occupied_spots')
+
+
+class LotListing(namedtuple('LotListing', LISTING_COLUMNS)):
+    """Read-only copy of a lot row, safe to share between requests"""
+    __slots__ = ()
+
+    get_available_spots_count = ParkingLot.get_available_spots_count
+    get_occupied_spots_count = ParkingLot.get_occupied_spots_count
+    get_occupancy_percentage = ParkingLot.get_occupancy_percentage
+
+
+class LotCache:
+    """Lot listings for the user pages, shared by every request of the process.
+
+    Holds the full lot list and the results of dashboard searches for
+    LOT_CACHE_TTL seconds, at most LOT_CACHE_SIZE lists (least recently used
+    go first). Every committed change to a lot or its availability clears
+    it (see lot_stats.lot_counts_changed). Other worker processes see a
+    change once their copy expires.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._entries = OrderedDict()  # (database, key) -> (expires, lots)
+        #bumped by every invalidation, a list loaded before one is not stored
+        self._generation = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def init_app(self, app):
+        app.extensions['lot_cache'] = self
+        lot_counts_changed.connect(self._lots_changed, app)
+
+    def all_lots(self):
+        """Every lot, in id order"""
+        return self._get('all', lambda query: query)
+
+    def search(self, term):
+        """Lots whose name or pincode contains `term` (case-insensitive)"""
+        term = term.lower()
+        return self._get(('search', term), lambda query: query.filter(
+            ParkingLot.prime_location_name.ilike(f'%{term}%') | ParkingLot.pincode.ilike(f'%{term}%')))
+
+    def _get(self, key, where):
+        ttl = current_app.config['LOT_CACHE_TTL']
+        key = (current_app.config['SQLALCHEMY_DATABASE_URI'], key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            hit = entry is not None and entry[0] > now
+            if hit:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                generation = self._generation
+        metrics.count('parking_lot_cache_lookups_total', result='hit' if hit else 'miss')
+        if hit:
+            return entry[1]
+
+        columns = [getattr(ParkingLot, column) for column in LISTING_COLUMNS]
+        lots = [LotListing(*row) for row in where(db.session.query(*columns)).order_by(ParkingLot.id)]
+        if ttl <= 0:
+            return lots
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (now + ttl, lots)
+                self._entries.move_to_end(key)
+                while len(self._entries) > current_app.config['LOT_CACHE_SIZE']:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return lots
+
+    def invalidate(self):
+        """Drop every cached list, after a committed change to lots or spots"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.invalidations += 1
+
+    def _lots_changed(self, app, counts):
+        self.invalidate()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                    'entries': len(self._entries), 'evictions': self.evictions,
+                    'invalidations': self.invalidations}
+
+
+lot_cache = LotCache()
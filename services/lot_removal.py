@@ -0,0 +1,145 @@
+# services/lot_removal.py
+
+import threading
+from flask import current_app
+from sqlalchemy import func, text, update
+from models import db, ParkingLot, ParkingSpot, Reservation
+from services import search as search_index
+from services.archive import in_ids, move_to_archive
+from services.lot_stats import stage_lot_counts, announce_lot_removed
+
+# Deleting a lot runs as many short transactions instead of one long one, so
+# SQLite's write lock is released between chunks and bookings in other lots
+# keep going. Every step only touches what is left, so an interrupted delete
+# is finished by running it again.
+CHUNK_SIZE = 500
+
+def close_lot(lot_id):
+    """Stop new bookings by retiring every free spot of the lot.
+
+    Returns the number of occupied spots; the lot is only closed (and the
+    change committed) when that is 0.
+    """
+    db.session.execute(update(ParkingSpot)
+                       .where(ParkingSpot.lot_id == lot_id, ParkingSpot.status == 'A')
+                       .values(status='R'))
+    occupied = (db.session.query(func.count(ParkingSpot.id))
+                .filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status == 'O')
+                .scalar())
+    if occupied:
+        db.session.rollback()
+        return occupied
+    name = db.session.execute(update(ParkingLot).where(ParkingLot.id == lot_id)
+                              .values(available_spots=0, version=ParkingLot.version + 1)
+                              .returning(ParkingLot.prime_location_name)).scalar()
+    stage_lot_counts(lot_id, name, 0, 0)
+    db.session.commit()
+    return 0
+
+
+def lot_size(lot_id):
+    """Spots plus reservations of a lot, the rows a removal has to move or delete"""
+    spots = db.session.query(func.count(ParkingSpot.id)).filter(ParkingSpot.lot_id == lot_id).scalar()
+    reservations = (db.session.query(func.count(Reservation.id))
+                    .join(ParkingSpot, ParkingSpot.id == Reservation.spot_id)
+                    .filter(ParkingSpot.lot_id == lot_id)
+                    .scalar())
+    return spots + reservations
+
+
+def remove_closed_lot(lot_id, chunk_size=CHUNK_SIZE, progress=None):
+    """Archive the reservations, then delete the spots and the lot, chunk by chunk.
+
+    `progress(stage, done, total)` is called after every committed chunk
+    with stage 'reservations' or 'spots'. Returns (archived, spots deleted).
+    """
+    #a closed lot gets no new spots or reservations, so both id lists are read once
+    reservation_ids = [reservation_id for (reservation_id,) in
+                       db.session.query(Reservation.id)
+                       .join(ParkingSpot, ParkingSpot.id == Reservation.spot_id)
+                       .filter(ParkingSpot.lot_id == lot_id)
+                       .order_by(Reservation.id)]
+    spot_ids = [spot_id for (spot_id,) in
+                db.session.query(ParkingSpot.id).filter(ParkingSpot.lot_id == lot_id).order_by(ParkingSpot.id)]
+    db.session.commit()
+
+    for start in range(0, len(reservation_ids), chunk_size):
+        chunk = reservation_ids[start:start + chunk_size]
+        move_to_archive(chunk)
+        db.session.commit()
+        if progress:
+            progress('reservations', start + len(chunk), len(reservation_ids))
+
+    delete_spots = in_ids('DELETE FROM parking_spots WHERE id IN :ids')
+    for start in range(0, len(spot_ids), chunk_size):
+        chunk = spot_ids[start:start + chunk_size]
+        search_index.remove_spots(chunk)
+        db.session.execute(delete_spots, {'ids': chunk})
+        db.session.commit()
+        if progress:
+            progress('spots', start + len(chunk), len(spot_ids))
+
+    db.session.execute(text('DELETE FROM parking_lots WHERE id = :lot_id'), {'lot_id': lot_id})
+    db.session.commit()
+    announce_lot_removed(lot_id)
+    return len(reservation_ids), len(spot_ids)
+
+
+class LotRemovals:
+    """Removals of closed lots running in a background thread of this process.
+
+    The admin route hands a lot with more than LOT_DELETE_INLINE_ROWS spots
+    and reservations to `start`, so the request returns at once instead of
+    running into the worker timeout. `progress()` reports the running ones
+    for the dashboard. The state lives in this process only; after a
+    restart the lot is still closed, and deleting it again (or
+    `flask delete-lot <id>`) finishes the removal.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.extensions['lot_removals'] = {}
+
+    def start(self, lot_id, name):
+        """Remove the closed lot in a new thread; False if it is already being removed"""
+        app = current_app._get_current_object()
+        running = app.extensions['lot_removals']
+        with self._lock:
+            if self.running(lot_id):
+                return False
+            running[lot_id] = {'name': name, 'stage': 'reservations', 'done': 0, 'total': None, 'failed': False}
+        threading.Thread(target=self._remove, args=(app, lot_id, running[lot_id]),
+                         name=f'remove-lot-{lot_id}', daemon=True).start()
+        return True
+
+    def running(self, lot_id):
+        state = current_app.extensions['lot_removals'].get(lot_id)
+        return state is not None and not state['failed']
+
+    def progress(self):
+        """{lot_id: {'name', 'stage', 'done', 'total', 'failed'}} of the removals of this process"""
+        return dict(current_app.extensions['lot_removals'])
+
+    def _remove(self, app, lot_id, state):
+        def progress(stage, done, total):
+            state.update(stage=stage, done=done, total=total)
+            app.logger.info('deleting lot %s: %s %d/%d', lot_id, stage, done, total)
+
+        with app.app_context():
+            try:
+                archived, spots = remove_closed_lot(lot_id, progress=progress)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('deleting lot %s failed, it stays closed', lot_id)
+                state['failed'] = True
+                return
+            finally:
+                db.session.remove()
+            app.logger.info('deleted lot %s: %d spots, %d reservations archived', lot_id, spots, archived)
+            with self._lock:
+                app.extensions['lot_removals'].pop(lot_id, None)
+
+
+lot_removals = LotRemovals()
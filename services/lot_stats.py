@@ -0,0 +1,96 @@
+# services/lot_stats.py
+
+from blinker import Namespace
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session
+from models import db, ParkingLot, ParkingSpot
+
+# Sent with counts={lot_id: (name, available, occupied)} once changed lot
+# counters are committed; a deleted lot maps to None. The metrics gauges,
+# the listing cache and the live availability stream listen to it.
+lot_counts_changed = Namespace().signal('lot-counts-changed')
+
+
+def stage_lot_counts(lot_id, name, available, occupied):
+    """Counters written by the current transaction, announced when it commits"""
+    db.session.info.setdefault('lot_counts', {})[lot_id] = (name, available, occupied)
+
+
+@event.listens_for(Session, 'after_commit')
+def _announce_staged(session):
+    counts = session.info.pop('lot_counts', None)
+    if counts and has_app_context():
+        lot_counts_changed.send(current_app._get_current_object(), counts=counts)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_staged(session):
+    session.info.pop('lot_counts', None)
+
+
+def announce_lot(lot_id):
+    """Re-read and announce one lot's counters after a committed admin change (one query)"""
+    row = (db.session.query(ParkingLot.prime_location_name, ParkingLot.available_spots, ParkingLot.occupied_spots)
+           .filter(ParkingLot.id == lot_id).first())
+    lot_counts_changed.send(current_app._get_current_object(), counts={lot_id: tuple(row) if row else None})
+
+
+def announce_lot_removed(lot_id):
+    lot_counts_changed.send(current_app._get_current_object(), counts={lot_id: None})
+
+
+def spot_moved(lot_id, to_status):
+    """Shift one spot between the lot's counters (part of the caller's transaction)"""
+    if to_status == 'O':
+        values = {'available_spots': ParkingLot.available_spots - 1,
+                  'occupied_spots': ParkingLot.occupied_spots + 1}
+    else:
+        values = {'available_spots': ParkingLot.available_spots + 1,
+                  'occupied_spots': ParkingLot.occupied_spots - 1}
+    values['version'] = ParkingLot.version + 1
+    #the new counters come back with the update, listeners get them on commit
+    row = db.session.execute(update(ParkingLot).where(ParkingLot.id == lot_id).values(**values)
+                             .returning(ParkingLot.prime_location_name, ParkingLot.available_spots,
+                                        ParkingLot.occupied_spots)).first()
+    if row is not None:
+        stage_lot_counts(lot_id, *row)
+
+
+def count_spots_by_lot():
+    """Real {lot_id: (available, occupied)} from parking_spots in one GROUP BY"""
+    rows = (db.session.query(ParkingSpot.lot_id, ParkingSpot.status, func.count(ParkingSpot.id))
+            .group_by(ParkingSpot.lot_id, ParkingSpot.status)
+            .all())
+    counts = {}
+    for lot_id, status, count in rows:
+        available, occupied = counts.get(lot_id, (0, 0))
+        if status == 'A':
+            available = count
+        elif status == 'O':
+            occupied = count
+        counts[lot_id] = (available, occupied)
+    return counts
+
+
+def check_lot_counters(repair=False):
+    """Compare the stored counters with the spot table.
+
+    Returns a list of (lot, stored, actual) for every lot that drifted, where
+    stored/actual are (available, occupied) tuples. With repair=True the
+    stored counters are overwritten with the actual ones.
+    """
+    actual = count_spots_by_lot()
+    drifted = []
+    for lot in ParkingLot.query.order_by(ParkingLot.id).all():
+        stored = (lot.available_spots, lot.occupied_spots)
+        real = actual.get(lot.id, (0, 0))
+        if stored != real:
+            drifted.append((lot, stored, real))
+            if repair:
+                lot.available_spots, lot.occupied_spots = real
+                lot.version = ParkingLot.version + 1
+                stage_lot_counts(lot.id, lot.prime_location_name, *real)
+    if repair and drifted:
+        db.session.commit()
+    return drifted
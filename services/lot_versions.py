@@ -0,0 +1,63 @@
+# services/lot_versions.py
+
+import time
+import zlib
+from threading import Lock
+from flask import current_app
+from models import db, ParkingLot
+from services.lot_stats import lot_counts_changed
+
+
+class LotVersions:
+    """In-memory copy of every lot's `version`, for answering conditional GETs.
+
+    The whole map is read in one query and kept until a committed lot change
+    in this process (lot_stats.lot_counts_changed) or API_VERSION_TTL
+    seconds, which bounds how long a change made by another worker process
+    can go unnoticed. Between those reads an unchanged lot is answered
+    without touching the database.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+
+    def init_app(self, app):
+        #generation is bumped by every change, a map read before one is not kept
+        app.extensions['lot_versions'] = {'versions': None, 'loaded': 0.0, 'generation': 0}
+        lot_counts_changed.connect(self._lots_changed, app)
+
+    def _lots_changed(self, app, counts):
+        state = app.extensions['lot_versions']
+        with self._lock:
+            state['versions'] = None
+            state['generation'] += 1
+
+    def all(self):
+        """{lot_id: version} of every lot"""
+        state = current_app.extensions['lot_versions']
+        with self._lock:
+            versions, generation = state['versions'], state['generation']
+            fresh = time.monotonic() - state['loaded'] < current_app.config['API_VERSION_TTL']
+        if versions is not None and fresh:
+            return versions
+        loaded = time.monotonic()
+        versions = dict(db.session.query(ParkingLot.id, ParkingLot.version).all())
+        with self._lock:
+            if generation == state['generation']:
+                state['versions'], state['loaded'] = versions, loaded
+        return versions
+
+    def get(self, lot_id):
+        return self.all().get(lot_id)
+
+
+def lot_etag(lot_id, version, what='lot'):
+    return f'{what}-{lot_id}-v{version}'
+
+
+def listing_etag(versions):
+    """One tag for the set of lots and all their versions"""
+    return 'lots-%08x' % zlib.crc32(repr(sorted(versions.items())).encode())
+
+
+lot_versions = LotVersions()
@@ -0,0 +1,280 @@
+# services/metrics.py
+
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from flask import Response, abort, current_app, g, has_app_context, request
+from models import db, ParkingLot
+from services.lot_stats import lot_counts_changed
+
+# request latency buckets in seconds, +Inf is added on output
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTERS = {
+    'parking_bookings_total': 'Spots booked.',
+    'parking_releases_total': 'Spots released.',
+    'parking_booking_failures_total': 'Booking attempts that were turned away, by reason.',
+    'parking_lot_cache_lookups_total': 'Lot listing cache lookups, by result.',
+    'parking_user_cache_lookups_total': 'Logged-in user cache lookups, by result.',
+}
+
+
+class MetricsStore:
+    """Metric values of one process, also what it writes to METRICS_DIR"""
+
+    def __init__(self, directory=None):
+        self.lock = threading.Lock()
+        self.directory = directory
+        self.reset()
+        #a forked worker starts from zero instead of repeating its parent's numbers
+        os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        self.latency = {}       # (endpoint, method) -> [count per bucket..., +Inf, sum]
+        self.counters = {}      # (name, (label, value), ...) -> count
+        self.lots = {}          # lot_id -> [updated, name, available, occupied], name None once deleted
+        self.lots_loaded = 0.0  # when the lot gauges were last read from the database
+        self.flushed = 0.0
+        self.filename = f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+
+    def snapshot(self):
+        with self.lock:
+            return {'latency': [[list(key), list(values)] for key, values in self.latency.items()],
+                    'counters': [[list(key[1:]), key[0], value] for key, value in self.counters.items()],
+                    'lots': {str(lot_id): list(entry) for lot_id, entry in self.lots.items()}}
+
+    def flush(self):
+        """Write this process' values for the other workers (atomic replace)"""
+        self.flushed = time.monotonic()
+        path = os.path.join(self.directory, self.filename)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+    def absorb(self, snapshot):
+        """Add the values of another process' snapshot to this process' own"""
+        with self.lock:
+            for key, values in snapshot['latency']:
+                total = self.latency.setdefault(tuple(key), [0] * len(values))
+                for i, value in enumerate(values):
+                    total[i] += value
+            for labels, name, value in snapshot['counters']:
+                key = (name,) + tuple(tuple(label) for label in labels)
+                self.counters[key] = self.counters.get(key, 0) + value
+            for lot_id, entry in snapshot['lots'].items():
+                if int(lot_id) not in self.lots or entry[0] > self.lots[int(lot_id)][0]:
+                    self.lots[int(lot_id)] = entry
+
+    def flush_at_exit(self):
+        #processes that never recorded anything (CLI commands) leave no file behind
+        if self.latency or self.counters or self.lots:
+            self.flush()
+
+
+class Metrics:
+    """Prometheus metrics kept in process memory, served at /metrics.
+
+    Requests are timed into a latency histogram per endpoint; bookings,
+    releases and turned-away bookings are counted; per-lot occupancy gauges
+    are updated from the counters each booking and release already writes,
+    so a scrape reads no tables (the gauges are re-read from the database
+    every METRICS_GAUGE_REFRESH seconds to pick up changes made elsewhere).
+
+    With METRICS_DIR set, every worker process writes its values there at
+    most every METRICS_FLUSH_SECONDS and a scrape of any worker adds up the
+    files of all of them; lot gauges take the most recent value. The file
+    of a worker that has exited is taken over by the scraping worker, which
+    adds its values to its own and deletes it, so the directory holds one
+    file per live worker and the totals never go down. Workers are told
+    apart by the pid in the file name, so the directory must not be shared
+    across hosts.
+    """
+
+    def init_app(self, app):
+        """Time the app's requests and add /metrics when METRICS is on"""
+        if not app.config['METRICS']:
+            return
+        store = app.extensions['metrics'] = MetricsStore(app.config['METRICS_DIR'])
+        if store.directory:
+            os.makedirs(store.directory, exist_ok=True)
+            atexit.register(store.flush_at_exit)
+        if not app.config['METRICS_TOKEN']:
+            app.logger.warning('METRICS is on without METRICS_TOKEN, anyone can read /metrics')
+        lot_counts_changed.connect(self._lots_changed, app)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule('/metrics', 'metrics', self.scrape)
+
+    def _store(self):
+        return current_app.extensions.get('metrics') if has_app_context() else None
+
+    def _start(self):
+        g.metrics_started = time.perf_counter()
+
+    def _finish(self, response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            self.observe(request.endpoint or 'unmatched', request.method, time.perf_counter() - started)
+        return response
+
+    def observe(self, endpoint, method, seconds):
+        store = self._store()
+        if store is None:
+            return
+        with store.lock:
+            values = store.latency.get((endpoint, method))
+            if values is None:
+                values = store.latency[(endpoint, method)] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            values[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            values[-1] += seconds
+        if store.directory and time.monotonic() - store.flushed >= current_app.config['METRICS_FLUSH_SECONDS']:
+            store.flush()
+
+    def count(self, name, **labels):
+        """Add one to a counter of COUNTERS, e.g. count('parking_bookings_total', lot_id=3)"""
+        store = self._store()
+        if store is None:
+            return
+        key = (name,) + tuple(sorted((label, str(value)) for label, value in labels.items()))
+        with store.lock:
+            store.counters[key] = store.counters.get(key, 0) + 1
+
+    def _lots_changed(self, app, counts):
+        self._set_lots({lot_id: values or (None, 0, 0) for lot_id, values in counts.items()}, app)
+
+    def _set_lots(self, lots, app=None):
+        store = app.extensions['metrics'] if app else self._store()
+        now = time.time()
+        with store.lock:
+            for lot_id, (name, available, occupied) in lots.items():
+                store.lots[lot_id] = [now, name, available, occupied]
+
+    def _merged(self, store):
+        """Values of this process, or of every process sharing METRICS_DIR"""
+        snapshots = []
+        if store.directory:
+            adopted = False
+            for filename in os.listdir(store.directory):
+                if not filename.endswith('.json') or filename == store.filename:
+                    continue
+                path = os.path.join(store.directory, filename)
+                pid = filename.split('-')[0]
+                if pid.isdigit() and not _alive(int(pid)):
+                    adopted = self._adopt(store, path) or adopted
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    #a worker is replacing its file right now, it is counted next scrape
+                    continue
+            if adopted:
+                store.flush()
+        snapshots.append(store.snapshot())
+        latency, counters, lots = {}, {}, {}
+        for snapshot in snapshots:
+            for key, values in snapshot['latency']:
+                total = latency.setdefault(tuple(key), [0] * len(values))
+                for i, value in enumerate(values):
+                    total[i] += value
+            for labels, name, value in snapshot['counters']:
+                key = (name,) + tuple(tuple(label) for label in labels)
+                counters[key] = counters.get(key, 0) + value
+            for lot_id, entry in snapshot['lots'].items():
+                if lot_id not in lots or entry[0] > lots[lot_id][0]:
+                    lots[lot_id] = entry
+        return latency, counters, lots
+
+    def _adopt(self, store, path):
+        """Move an exited worker's values into this process; False if another worker got there first"""
+        claimed = f'{path}.{os.getpid()}'
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return False
+        try:
+            with open(claimed) as f:
+                store.absorb(json.load(f))
+        except (OSError, ValueError):
+            pass
+        os.remove(claimed)
+        return True
+
+    def _refresh_lots(self, store, known):
+        """Read every lot's gauges in one query, lots gone from the table are marked deleted"""
+        rows = db.session.query(ParkingLot.id, ParkingLot.prime_location_name, ParkingLot.available_spots,
+                                ParkingLot.occupied_spots).all()
+        lots = {lot_id: (name, available, occupied) for lot_id, name, available, occupied in rows}
+        for lot_id in known:
+            lots.setdefault(int(lot_id), (None, 0, 0))
+        self._set_lots(lots)
+        store.lots_loaded = time.monotonic()
+
+    def scrape(self):
+        """Prometheus text exposition of the counters, histograms and gauges"""
+        store = self._store()
+        token = current_app.config['METRICS_TOKEN']
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+        if not store.lots_loaded or time.monotonic() - store.lots_loaded >= current_app.config['METRICS_GAUGE_REFRESH']:
+            self._refresh_lots(store, self._merged(store)[2])
+            if store.directory:
+                store.flush()
+        latency, counters, lots = self._merged(store)
+        return Response(render(latency, counters, lots), mimetype='text/plain; version=0.0.4')
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}' if pairs else ''
+
+
+def render(latency, counters, lots):
+    """Prometheus text format (version 0.0.4)"""
+    lines = ['# HELP parking_request_duration_seconds Time to handle a request, by endpoint.',
+             '# TYPE parking_request_duration_seconds histogram']
+    for (endpoint, method), values in sorted(latency.items()):
+        labels = [('endpoint', endpoint), ('method', method)]
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), values):
+            cumulative += count
+            lines.append(f'parking_request_duration_seconds_bucket{_labels(labels + [("le", bound)])} {cumulative}')
+        lines.append(f'parking_request_duration_seconds_sum{_labels(labels)} {values[-1]:.6f}')
+        lines.append(f'parking_request_duration_seconds_count{_labels(labels)} {cumulative}')
+
+    for name, help_text in COUNTERS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for key, value in sorted(counters.items()):
+            if key[0] == name:
+                lines.append(f'{name}{_labels(key[1:])} {value}')
+
+    live = sorted((int(lot_id), entry) for lot_id, entry in lots.items() if entry[1] is not None)
+    gauges = [('parking_lot_available_spots', 'Free spots per lot.', lambda available, occupied: available),
+              ('parking_lot_occupied_spots', 'Occupied spots per lot.', lambda available, occupied: occupied),
+              ('parking_lot_occupancy_ratio', 'Occupied share of the spots per lot.',
+               lambda available, occupied: round(occupied / (available + occupied), 4) if available + occupied else 0)]
+    for name, help_text, value in gauges:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+        for lot_id, (_, lot_name, available, occupied) in live:
+            lines.append(f'{name}{_labels([("lot_id", lot_id), ("lot", lot_name)])} {value(available, occupied)}')
+    return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,158 @@
+# services/profiler.py
+
+import cProfile
+import os
+import pstats
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime
+from flask import current_app, g, request
+from flask_login import current_user
+
+ProfileFile = namedtuple('ProfileFile', 'route name created duration_ms')
+
+# deepest call chain written to the collapsed stacks, and the smallest
+# share of time (seconds) a path must have to be followed further
+MAX_STACK_DEPTH = 60
+MIN_STACK_SECONDS = 1e-5
+
+
+class RequestProfiler:
+    """cProfile selected requests of admins, on demand.
+
+    With PROFILING on, a request from an admin carrying the PROFILE_HEADER
+    header or the `_profile` query flag is profiled. Each run is written as
+    PROFILE_DIR/<endpoint>/<time>-<ms>ms-<id>.prof (for pstats, snakeviz) and
+    a .collapsed file of folded stacks (for flamegraph.pl, speedscope); only
+    the newest PROFILE_KEEP runs per endpoint are kept.
+    """
+
+    def init_app(self, app):
+        """Hook into the app's requests when PROFILING is on"""
+        if not app.config['PROFILING']:
+            return
+        app.config['PROFILE_DIR'] = app.config['PROFILE_DIR'] or os.path.join(app.instance_path, 'profiles')
+        app.extensions['request_profiler'] = self
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._stop)
+
+    def _wanted(self):
+        flagged = request.headers.get(current_app.config['PROFILE_HEADER']) or '_profile' in request.args
+        return flagged and current_user.is_authenticated and current_user.is_admin
+
+    def _start(self):
+        if not self._wanted():
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            #another profiler is active in this process, skip this request
+            return
+        g.request_profile = (profile, time.perf_counter())
+
+    def _finish(self, response):
+        running = g.pop('request_profile', None)
+        if running is None:
+            return response
+        profile, started = running
+        profile.disable()
+        duration_ms = (time.perf_counter() - started) * 1000
+        name = self.save(profile, request.endpoint or 'unknown', duration_ms)
+        response.headers['X-Profile-Saved'] = name
+        return response
+
+    def _stop(self, error=None):
+        #after_request is skipped when the view raises, the thread must not stay profiled
+        running = g.pop('request_profile', None)
+        if running is not None:
+            running[0].disable()
+
+    def save(self, profile, route, duration_ms):
+        """Write the .prof and .collapsed files and rotate the route's directory"""
+        directory = os.path.join(current_app.config['PROFILE_DIR'], route)
+        os.makedirs(directory, exist_ok=True)
+        name = f'{datetime.now():%Y%m%d-%H%M%S}-{duration_ms:.0f}ms-{uuid.uuid4().hex[:6]}'
+        profile.dump_stats(os.path.join(directory, name + '.prof'))
+        with open(os.path.join(directory, name + '.collapsed'), 'w') as f:
+            for stack, weight in collapsed_stacks(pstats.Stats(profile)):
+                f.write(f'{stack} {weight}\n')
+
+        runs = sorted((entry for entry in os.scandir(directory) if entry.name.endswith('.prof')),
+                      key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in runs[current_app.config['PROFILE_KEEP']:]:
+            for suffix in ('.prof', '.collapsed'):
+                try:
+                    os.remove(entry.path[:-len('.prof')] + suffix)
+                except FileNotFoundError:
+                    pass
+        return f'{route}/{name}'
+
+    def profiles(self, limit=50):
+        """Saved runs of every route, slowest first"""
+        root = current_app.config['PROFILE_DIR']
+        found = []
+        if not os.path.isdir(root):
+            return found
+        for route in os.scandir(root):
+            if not route.is_dir():
+                continue
+            for entry in os.scandir(route.path):
+                if not entry.name.endswith('.prof'):
+                    continue
+                name = entry.name[:-len('.prof')]
+                try:
+                    duration_ms = int(name.split('-')[2][:-2])
+                    created = datetime.strptime('-'.join(name.split('-')[:2]), '%Y%m%d-%H%M%S')
+                except (IndexError, ValueError):
+                    continue
+                found.append(ProfileFile(route.name, name, created, duration_ms))
+        found.sort(key=lambda run: run.duration_ms, reverse=True)
+        return found[:limit]
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == '~':
+        return name  # builtins, e.g. <built-in method time.sleep>
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+
+def collapsed_stacks(stats):
+    """Folded stacks ("a;b;c weight") rebuilt from a cProfile call graph.
+
+    cProfile only records caller -> callee edges, so a function's own time is
+    split over its call paths in proportion to the cumulative time each
+    caller spent in it (the usual approximation, as in flameprof or
+    gprof2dot). Weights are in microseconds.
+    """
+    entries = stats.stats
+    children = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, entry in entries.items() if not entry[4]]
+    folded = {}
+
+    def walk(func, share, path, labels):
+        _, _, own, cumulative, _ = entries[func]
+        labels = labels + [_label(func)]
+        fraction = share / cumulative if cumulative else 0
+        weight = int(own * fraction * 1e6)
+        if weight:
+            key = ';'.join(labels)
+            folded[key] = folded.get(key, 0) + weight
+        if len(labels) >= MAX_STACK_DEPTH:
+            return
+        for child, child_cumulative in children.get(func, ()):
+            if child not in path and child_cumulative * fraction >= MIN_STACK_SECONDS:
+                walk(child, child_cumulative * fraction, path | {child}, labels)
+
+    for root in roots:
+        walk(root, entries[root][3], {root}, [])
+    return sorted(folded.items())
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,205 @@
+# services/reports.py
+
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import func, case, and_, select, union_all
+from sqlalchemy.orm import joinedload
+from models import db, User, ParkingLot, ParkingSpot, Reservation, ReservationArchive
+
+# Completed reservations are moved to reservation_archive after a while
+# (services/archive.py). Active ones are only in the live table, so lookups
+# of those stay on it; history and totals read both.
+
+
+def spot_totals(lots):
+    """(total, available, occupied) across lots, taken from their counters"""
+    available = sum(lot.get_available_spots_count() for lot in lots)
+    occupied = sum(lot.get_occupied_spots_count() for lot in lots)
+    return available + occupied, available, occupied
+
+
+def active_reservation_count():
+    """Number of reservations that have not been released yet"""
+    return db.session.query(func.count(Reservation.id)).filter(Reservation.leaving_timestamp.is_(None)).scalar()
+
+
+def recent_reservations(limit):
+    """Latest reservations with their user, spot and lot loaded in the same query"""
+    recent = (Reservation.query
+              .options(joinedload(Reservation.user),
+                       joinedload(Reservation.spot).joinedload(ParkingSpot.lot))
+              .order_by(Reservation.created_at.desc())
+              .limit(limit)
+              .all())
+    #archived reservations are older than the live ones, they only fill up a short live table
+    if len(recent) < limit:
+        recent += (ReservationArchive.query
+                   .options(joinedload(ReservationArchive.user), joinedload(ReservationArchive.lot))
+                   .order_by(ReservationArchive.id.desc())
+                   .limit(limit - len(recent))
+                   .all())
+    return recent
+
+
+def _newest_first(reservation):
+    return reservation.created_at or datetime.min
+
+
+def user_reservations(user_id):
+    """A user's live and archived reservations, newest first, with spot and lot loaded in the same query"""
+    live = (Reservation.query
+            .options(joinedload(Reservation.spot).joinedload(ParkingSpot.lot))
+            .filter_by(user_id=user_id)
+            .all())
+    archived = (ReservationArchive.query
+                .options(joinedload(ReservationArchive.lot))
+                .filter_by(user_id=user_id)
+                .all())
+    return sorted(live + archived, key=_newest_first, reverse=True)
+
+
+def _all_reservations(*columns, where=lambda model: ()):
+    """Subquery of the named columns over live and archived reservations.
+
+    `where(model)` returns the filters for each table, so they are applied
+    (and use that table's indexes) before the two are combined.
+    """
+    return union_all(*(select(*(getattr(model, column).label(column) for column in columns)).where(*where(model))
+                       for model in (Reservation, ReservationArchive))).subquery()
+
+
+def lot_report(start=None, end=None, lot_ids=None):
+    """Revenue and current availability for every lot in a single statement.
+
+    Revenue counts completed reservations released in [start, end) when the
+    bounds are given; available/occupied are the lot's live counters.
+    Returns rows of (id, name, revenue, available, occupied) ordered by lot id.
+    """
+    completed = []
+    #live reservations get their lot from the spot, archived ones carry it
+    for model, lot_id in ((Reservation, ParkingSpot.lot_id), (ReservationArchive, ReservationArchive.lot_id)):
+        part = (select(lot_id.label('lot_id'), model.total_cost.label('total_cost'))
+                .where(model.leaving_timestamp.isnot(None)))
+        if model is Reservation:
+            part = part.join_from(Reservation, ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+        if start:
+            part = part.where(model.leaving_timestamp >= start)
+        if end:
+            part = part.where(model.leaving_timestamp < end)
+        if lot_ids:
+            part = part.where(lot_id.in_(lot_ids))
+        completed.append(part)
+    completed = union_all(*completed).subquery()
+    revenue = (db.session.query(completed.c.lot_id.label('lot_id'), func.sum(completed.c.total_cost).label('revenue'))
+               .group_by(completed.c.lot_id)
+               .subquery())
+
+    query = (db.session.query(ParkingLot.id,
+                              ParkingLot.prime_location_name,
+                              func.coalesce(revenue.c.revenue, 0.0),
+                              ParkingLot.available_spots,
+                              ParkingLot.occupied_spots)
+             .outerjoin(revenue, revenue.c.lot_id == ParkingLot.id))
+    if lot_ids:
+        query = query.filter(ParkingLot.id.in_(lot_ids))
+    return query.order_by(ParkingLot.id).all()
+
+
+UserRow = namedtuple('UserRow', 'user reservations active spent last_booking')
+
+#listing sorts: name -> (users column, descending)
+USER_SORTS = {
+    'newest': ('created_at', True),
+    'oldest': ('created_at', False),
+    'username': ('username', False),
+    'reservations': ('reservation_count', True),
+    'spent': ('total_spent', True),
+}
+
+
+def reservation_stats(user_ids=None):
+    """Per-user reservation count, active count, total spent and last booking, archive included"""
+    where = (lambda model: ()) if user_ids is None else (lambda model: (model.user_id.in_(user_ids),))
+    both = _all_reservations('id', 'user_id', 'leaving_timestamp', 'total_cost', 'created_at', where=where)
+    return db.session.query(
+        both.c.user_id.label('user_id'),
+        func.count(both.c.id).label('reservations'),
+        func.sum(case((both.c.leaving_timestamp.is_(None), 1), else_=0)).label('active'),
+        func.coalesce(func.sum(both.c.total_cost), 0.0).label('spent'),
+        func.max(both.c.created_at).label('last_booking'),
+    ).group_by(both.c.user_id)
+
+
+def reservation_totals():
+    """(reservations, users with a reservation, revenue), archive included, summed from the user counters"""
+    return db.session.query(
+        func.coalesce(func.sum(User.reservation_count), 0),
+        func.count(case((User.reservation_count > 0, 1))),
+        func.coalesce(func.sum(User.total_spent), 0.0),
+    ).one()
+
+
+def user_listing(sort='newest', search='', active_only=False, after=None, per_page=25):
+    """One page of regular users with their reservation stats.
+
+    Pages are keyset based: `after` is the id of the last user on the previous
+    page, so deep pages cost the same as the first one. Every sort reads a
+    users column (the stat sorts the per-user counters), only the stats of the
+    page's users are grouped. Returns (rows, after id of the next page).
+    """
+    field, descending = USER_SORTS.get(sort, USER_SORTS['newest'])
+    users = User.query.filter_by(is_admin=False)
+    if search:
+        users = users.filter(User.username.startswith(search, autoescape=True))
+    if active_only:
+        users = users.filter(User.reservations.any(Reservation.leaving_timestamp.is_(None)))
+
+    key = getattr(User, field)
+
+    if after:
+        #sort value of the last user on the previous page
+        pivot = db.session.query(key).filter(User.id == after).scalar()
+        #a deleted or unknown user has no sort value, the listing starts over at the first page
+        if pivot is not None and descending:
+            users = users.filter((key < pivot) | ((key == pivot) & (User.id < after)))
+        elif pivot is not None:
+            users = users.filter((key > pivot) | ((key == pivot) & (User.id > after)))
+    order = (key.desc(), User.id.desc()) if descending else (key.asc(), User.id.asc())
+    page = users.order_by(*order).limit(per_page + 1).all()
+
+    next_after = page[per_page - 1].id if len(page) > per_page else None
+    page = page[:per_page]
+    stats_by_user = {row.user_id: row for row in reservation_stats([user.id for user in page])} if page else {}
+    rows = []
+    for user in page:
+        #counts shown are the ones the page is sorted by
+        row = stats_by_user.get(user.id)
+        if row:
+            rows.append(UserRow(user, user.reservation_count, row.active, user.total_spent, row.last_booking))
+        else:
+            rows.append(UserRow(user, user.reservation_count, 0, user.total_spent, None))
+    return rows, next_after
+
+
+def lot_spot_grid(lot_id):
+    """Spots of a lot with their active reservation and its user, in one query.
+
+    Returns (spots, {spot_id: active reservation}) in creation order (A1..A10,
+    B1.., L2-A1..), which unlike the spot_number string sorts sections right.
+    """
+    rows = (db.session.query(ParkingSpot, Reservation)
+            .outerjoin(Reservation, and_(Reservation.spot_id == ParkingSpot.id,
+                                         Reservation.leaving_timestamp.is_(None)))
+            .options(joinedload(Reservation.user))
+            .filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status != 'R')
+            .order_by(ParkingSpot.id)
+            .all())
+    spots = []
+    active = {}
+    for spot, reservation in rows:
+        #the identity map hands back the same spot object for repeated rows
+        if not spots or spots[-1] is not spot:
+            spots.append(spot)
+        if reservation is not None:
+            active.setdefault(spot.id, reservation)
+    return spots, active
@@ -0,0 +1,234 @@
+# services/search.py
+
+from weakref import WeakKeyDictionary
+from sqlalchemy import bindparam, text, and_
+from sqlalchemy.orm import joinedload
+from models import db, User, ParkingLot, ParkingSpot, Reservation, normalize_vehicle_no
+
+# One FTS5 row per spot (rowid = spot id) holding the spot number, its lot's
+# name/address/pincode and the username and normalized plate of the active
+# reservation. The trigram tokenizer matches any part of a value, like the
+# LIKE '%term%' scans it replaced: "000001" finds KA01CD000001.
+SEARCH_TABLE = 'spot_search'
+SEARCH_COLUMNS = ('spot_number', 'lot_name', 'address', 'pincode', 'username', 'vehicle_key')
+
+CREATE_SQL = (f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+              f"USING fts5({', '.join(SEARCH_COLUMNS)}, tokenize='trigram')")
+
+#trigrams cannot match shorter words, those are LIKE scans over the index rows
+MIN_MATCH_LENGTH = 3
+
+#document of every spot matched by a WHERE clause on parking_spots s (retired spots have none)
+DOCUMENT_SQL = f"""
+    INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)})
+    SELECT s.id, s.spot_number, l.prime_location_name, l.address, l.pincode, u.username, r.vehicle_key
+    FROM parking_spots s
+    JOIN parking_lots l ON l.id = s.lot_id
+    LEFT JOIN reservations r ON r.spot_id = s.id AND r.leaving_timestamp IS NULL
+    LEFT JOIN users u ON u.id = r.user_id
+    WHERE s.status != 'R' AND ({{where}})
+"""
+
+#search_type -> FTS column it is restricted to (None = every column)
+SEARCH_TYPES = {
+    'all': None,
+    'spot_number': 'spot_number',
+    'lot_name': 'lot_name',
+    'username': 'username',
+    'vehicle_no': 'vehicle_key',
+}
+
+_enabled = WeakKeyDictionary()  # engine -> whether the index table exists
+
+
+def is_enabled():
+    """True when the database has the FTS index (sqlite built with FTS5)"""
+    engine = db.engine
+    if engine not in _enabled:
+        found = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': SEARCH_TABLE}
+        ).first() if engine.dialect.name == 'sqlite' else None
+        _enabled[engine] = found is not None
+    return _enabled[engine]
+
+
+def create_index():
+    """Create and fill the index if it is missing or has an older layout. Returns True if created."""
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    if is_enabled():
+        schema = db.session.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                    {'name': SEARCH_TABLE}).scalar()
+        #sqlite keeps the statement as written, minus IF NOT EXISTS
+        if CREATE_SQL.split(' USING ', 1)[1] in schema:
+            return False
+        db.session.execute(text(f'DROP TABLE {SEARCH_TABLE}'))
+        _enabled[db.engine] = False
+    try:
+        db.session.execute(text(CREATE_SQL))
+    except Exception:
+        #sqlite compiled without FTS5, search keeps using LIKE
+        db.session.rollback()
+        return False
+    _enabled[db.engine] = True
+    rebuild()
+    return True
+
+
+def _reindex(where, params):
+    if is_enabled():
+        #text() statements do not autoflush, pending ORM changes must land first
+        db.session.flush()
+        db.session.execute(text(DOCUMENT_SQL.format(where=where)), params)
+
+
+def reindex_spot(spot_id):
+    """Refresh one spot's document (booking, release), in the caller's transaction"""
+    _reindex('s.id = :spot_id', {'spot_id': spot_id})
+
+
+def reindex_lot(lot_id):
+    """Refresh every spot of a lot (create, edit, resize)"""
+    _reindex('s.lot_id = :lot_id', {'lot_id': lot_id})
+
+
+def reindex_user(user_id):
+    """Refresh the spots a user is parked in (username change)"""
+    _reindex('s.id IN (SELECT spot_id FROM reservations WHERE user_id = :user_id AND leaving_timestamp IS NULL)',
+             {'user_id': user_id})
+
+
+def remove_spots(spot_ids):
+    """Drop the documents of the given spots"""
+    if is_enabled() and spot_ids:
+        db.session.execute(text(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN :ids')
+                           .bindparams(bindparam('ids', expanding=True)), {'ids': list(spot_ids)})
+
+
+def remove_retired(lot_id):
+    """Drop documents of a lot's retired spots (after a resize)"""
+    if is_enabled():
+        db.session.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN "
+                                f"(SELECT id FROM parking_spots WHERE lot_id = :lot_id AND status = 'R')"),
+                           {'lot_id': lot_id})
+
+
+def rebuild():
+    """Recreate every document from the live tables"""
+    db.session.execute(text(f'DELETE FROM {SEARCH_TABLE}'))
+    db.session.execute(text(DOCUMENT_SQL.format(where='1 = 1')))
+    db.session.commit()
+
+
+def _phrase(word):
+    return '"' + word.replace('"', '""') + '"'
+
+
+def search_words(term, column=None):
+    """Words of the term that must all match; a plate search is one word without spaces or dashes"""
+    if column == 'vehicle_key':
+        key = normalize_vehicle_no(term)
+        return [key] if key else []
+    return term.split()
+
+
+def match_expression(words, column=None):
+    """FTS5 query for the words long enough to match by trigram, '' if there are none.
+
+    Searching every column, a word also matches a plate written without
+    its spaces and dashes.
+    """
+    phrases = []
+    for word in words:
+        if len(word) < MIN_MATCH_LENGTH:
+            continue
+        phrase = _phrase(word)
+        key = normalize_vehicle_no(word) if column is None else None
+        if key and key != word.upper() and len(key) >= MIN_MATCH_LENGTH:
+            phrase = f'({phrase} OR vehicle_key : {_phrase(key)})'
+        phrases.append(phrase)
+    expression = ' '.join(phrases)
+    return f'{column} : ({expression})' if column and expression else expression
+
+
+def _short_word_filter(words, column=None):
+    """SQL condition and params for the words too short to match by trigram"""
+    conditions = []
+    params = {}
+    for i, word in enumerate(word for word in words if len(word) < MIN_MATCH_LENGTH):
+        params[f'like{i}'] = '%' + word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        conditions.append('(' + ' OR '.join(f"{name} LIKE :like{i} ESCAPE '\\'"
+                                            for name in ((column,) if column else SEARCH_COLUMNS)) + ')')
+    return ' AND '.join(conditions), params
+
+
+def _like_spot_ids(term, column):
+    """Fallback when the FTS index is unavailable: the old LIKE scans"""
+    query = db.session.query(ParkingSpot.id).join(ParkingLot).filter(ParkingSpot.status != 'R')
+    if column in ('username', 'vehicle_key'):
+        query = query.join(Reservation, and_(Reservation.spot_id == ParkingSpot.id,
+                                             Reservation.leaving_timestamp.is_(None)))
+        if column == 'username':
+            query = query.join(User, User.id == Reservation.user_id).filter(User.username.contains(term))
+        else:
+            query = query.filter(Reservation.vehicle_key.contains(normalize_vehicle_no(term) or term))
+    elif column == 'lot_name':
+        query = query.filter(ParkingLot.prime_location_name.contains(term))
+    elif column == 'spot_number':
+        query = query.filter(ParkingSpot.spot_number.contains(term))
+    else:
+        query = query.filter(ParkingSpot.spot_number.contains(term) |
+                             ParkingLot.prime_location_name.contains(term) |
+                             ParkingLot.address.contains(term) |
+                             ParkingLot.pincode.contains(term))
+    return query.order_by(ParkingSpot.id)
+
+
+def search_spot_ids(term, search_type='all', page=1, per_page=50):
+    """Spot ids of one page of results, in spot order, and the total number of matches"""
+    column = SEARCH_TYPES.get(search_type)
+    offset = (page - 1) * per_page
+    if not is_enabled():
+        query = _like_spot_ids(term, column)
+        return [spot_id for (spot_id,) in query.offset(offset).limit(per_page)], query.count()
+
+    words = search_words(term, column)
+    expression = match_expression(words, column)
+    short, params = _short_word_filter(words, column)
+    if not expression and not short:
+        return [], 0
+    conditions = [f'{SEARCH_TABLE} MATCH :q'] if expression else []
+    if short:
+        conditions.append(short)
+    where = ' AND '.join(conditions)
+    params['q'] = expression
+    #bm25 over trigrams says little about a substring hit and has to score every match, spot order stops at the page
+    ids = db.session.execute(
+        text(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {where} ORDER BY rowid LIMIT :limit OFFSET :offset'),
+        {**params, 'limit': per_page, 'offset': offset}
+    ).scalars().all()
+    total = db.session.execute(text(f'SELECT count(*) FROM {SEARCH_TABLE} WHERE {where}'), params).scalar()
+    return ids, total
+
+
+def load_spots(spot_ids):
+    """Spots in the given order with lot, active reservation and user preloaded.
+
+    Returns (spots, {spot_id: active reservation}).
+    """
+    if not spot_ids:
+        return [], {}
+    rows = (db.session.query(ParkingSpot, Reservation)
+            .outerjoin(Reservation, and_(Reservation.spot_id == ParkingSpot.id,
+                                         Reservation.leaving_timestamp.is_(None)))
+            .options(joinedload(ParkingSpot.lot), joinedload(Reservation.user))
+            .filter(ParkingSpot.id.in_(spot_ids))
+            .all())
+    by_id = {}
+    active = {}
+    for spot, reservation in rows:
+        by_id[spot.id] = spot
+        if reservation is not None:
+            active.setdefault(spot.id, reservation)
+    return [by_id[spot_id] for spot_id in spot_ids if spot_id in by_id], active
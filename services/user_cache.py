@@ -0,0 +1,105 @@
+# services/user_cache.py
+
+import time
+from collections import OrderedDict
+from threading import Lock
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+from models import db, User
+from services.metrics import metrics
+
+USER_COLUMNS = ('id', 'username', 'password_hash', 'is_admin', 'created_at')
+
+
+class UserCache:
+    """Logged-in users for Flask-Login's user_loader, shared by every request of the process.
+
+    Keeps the columns of up to USER_CACHE_SIZE users for USER_CACHE_TTL
+    seconds (least recently used go first). A hit is attached to the request's
+    session without a query, so the user can still be edited and committed.
+    Updating or deleting a user through the ORM drops its entry when the
+    transaction commits; other worker processes see the change once their
+    copy expires.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._entries = OrderedDict()  # (database, user_id) -> (expires, column values)
+        #bumped by every invalidation, a user loaded before one is not stored
+        self._generation = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def init_app(self, app):
+        app.extensions['user_cache'] = self
+
+    def load(self, user_id):
+        """The user with `user_id`, or None"""
+        ttl = current_app.config['USER_CACHE_TTL']
+        key = (current_app.config['SQLALCHEMY_DATABASE_URI'], user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            hit = entry is not None and entry[0] > now
+            if hit:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                generation = self._generation
+        metrics.count('parking_user_cache_lookups_total', result='hit' if hit else 'miss')
+        if hit:
+            user = User(**dict(zip(USER_COLUMNS, entry[1])))
+            make_transient_to_detached(user)
+            #no query: the session's own copy if it has one, else this one as loaded
+            return db.session.merge(user, load=False)
+
+        user = db.session.get(User, user_id)
+        if user is None or ttl <= 0:
+            return user
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (now + ttl, tuple(getattr(user, column) for column in USER_COLUMNS))
+                self._entries.move_to_end(key)
+                while len(self._entries) > current_app.config['USER_CACHE_SIZE']:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return user
+
+    def invalidate(self, user_ids):
+        """Drop the given users, after a committed change to them"""
+        database = current_app.config['SQLALCHEMY_DATABASE_URI']
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop((database, user_id), None)
+            self._generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                    'entries': len(self._entries), 'evictions': self.evictions,
+                    'invalidations': self.invalidations}
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _stage_changed_user(mapper, connection, user):
+    object_session(user).info.setdefault('changed_users', set()).add(user.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_staged(session):
+    user_ids = session.info.pop('changed_users', None)
+    if user_ids and has_app_context():
+        user_cache.invalidate(user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_staged(session):
+    session.info.pop('changed_users', None)
+
+
+user_cache = UserCache()
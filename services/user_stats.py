@@ -0,0 +1,52 @@
+# services/user_stats.py
+
+from sqlalchemy import func, update, union_all, select
+from models import db, User, Reservation, ReservationArchive
+
+# Every user carries the number of reservations they made and what they
+# spent, archived reservations included, so the admin listing sorts and its
+# totals read the users table instead of grouping the whole history.
+
+
+def reservation_booked(user_id):
+    """Count a new reservation for the user (part of the caller's transaction)"""
+    db.session.execute(update(User).where(User.id == user_id)
+                       .values(reservation_count=User.reservation_count + 1))
+
+
+def reservation_released(user_id, total_cost):
+    """Add a released reservation's cost to the user (part of the caller's transaction)"""
+    db.session.execute(update(User).where(User.id == user_id)
+                       .values(total_spent=User.total_spent + (total_cost or 0.0)))
+
+
+def count_reservations_by_user():
+    """Real {user_id: (reservations, spent)} from the live and archived reservations in one GROUP BY"""
+    both = union_all(*(select(model.user_id, model.total_cost)
+                       for model in (Reservation, ReservationArchive))).subquery()
+    rows = (db.session.query(both.c.user_id, func.count(), func.coalesce(func.sum(both.c.total_cost), 0.0))
+            .group_by(both.c.user_id)
+            .all())
+    return {user_id: (count, spent) for user_id, count, spent in rows}
+
+
+def check_user_counters(repair=False):
+    """Compare the stored counters with the reservations.
+
+    Returns a list of (user, stored, actual) for every user that drifted,
+    where stored/actual are (reservations, spent) tuples. With repair=True
+    the stored counters are overwritten with the actual ones.
+    """
+    actual = count_reservations_by_user()
+    drifted = []
+    for user in User.query.order_by(User.id).all():
+        stored = (user.reservation_count, user.total_spent)
+        real = actual.get(user.id, (0, 0.0))
+        #sums of float costs differ in the last bits depending on their order
+        if stored[0] != real[0] or round(stored[1], 2) != round(real[1], 2):
+            drifted.append((user, stored, real))
+            if repair:
+                user.reservation_count, user.total_spent = real
+    if repair and drifted:
+        db.session.commit()
+    return drifted
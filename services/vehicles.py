@@ -0,0 +1,20 @@
+# services/vehicles.py
+
+from sqlalchemy.orm import joinedload
+from models import Reservation, ParkingSpot, normalize_vehicle_no
+
+
+def find_parked_vehicle(vehicle_no):
+    """Active reservation of a vehicle with spot, lot and user, or None.
+
+    A single lookup on the unique (vehicle_key) WHERE leaving_timestamp IS NULL
+    index, the related rows come joined in the same statement.
+    """
+    key = normalize_vehicle_no(vehicle_no)
+    if not key:
+        return None
+    return (Reservation.query
+            .options(joinedload(Reservation.user),
+                     joinedload(Reservation.spot).joinedload(ParkingSpot.lot))
+            .filter(Reservation.vehicle_key == key, Reservation.leaving_timestamp.is_(None))
+            .first())